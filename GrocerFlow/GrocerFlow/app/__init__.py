@@ -32,28 +32,79 @@ def create_app():
 
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
     app.config["WTF_CSRF_TIME_LIMIT"] = None
+    app.config["PAGE_SIZE"] = int(os.environ.get("PAGE_SIZE", 50))
+    # auto | like -- see search.py
+    app.config["SEARCH_BACKEND"] = os.environ.get("SEARCH_BACKEND", "auto")
+    # off | warn | strict -- see querystats.py
+    app.config["QUERY_BUDGET"] = os.environ.get("QUERY_BUDGET", "off")
+    # Seconds; 0 disables the dashboard cache
+    app.config["DASHBOARD_CACHE_TTL"] = float(os.environ.get("DASHBOARD_CACHE_TTL", 30))
+    # Take a stock snapshot every N ledger rows; 0 = only via `flask stock-snapshot`
+    app.config["SNAPSHOT_EVERY_N_TX"] = int(os.environ.get("SNAPSHOT_EVERY_N_TX", 0))
+    # Default age in days for `flask ledger-archive`; 0 = archive only with --before
+    app.config["ARCHIVE_AFTER_DAYS"] = int(os.environ.get("ARCHIVE_AFTER_DAYS", 730))
+    # Seconds the reorder analysis is cached per worker; 0 disables
+    app.config["ANALYTICS_CACHE_TTL"] = float(os.environ.get("ANALYTICS_CACHE_TTL", 300))
+    # Seconds a logged-in user is cached by the session loader; 0 disables
+    app.config["USER_CACHE_TTL"] = float(os.environ.get("USER_CACHE_TTL", 300))
+    # Seconds between freshness checks of the per-worker catalogue snapshot
+    app.config["CATALOGUE_REFRESH_SECONDS"] = float(os.environ.get("CATALOGUE_REFRESH_SECONDS", 2))
+    # Seconds rendered list pages are kept server-side per ETag; 0 disables
+    app.config["RENDER_CACHE_TTL"] = float(os.environ.get("RENDER_CACHE_TTL", 0))
+    # Background job threads per process; 0 = only `flask jobs-worker` runs jobs
+    app.config["JOB_WORKERS"] = int(os.environ.get("JOB_WORKERS", 2))
+    # Minutes after which a job still "running" is marked failed; 0 = never
+    app.config["JOB_STALE_MINUTES"] = float(os.environ.get("JOB_STALE_MINUTES", 60))
+    # Bearer token that lets a scraper read /metrics without an admin login
+    app.config["METRICS_TOKEN"] = os.environ.get("METRICS_TOKEN", "")
+    # Profile requests slower than this many ms (0 = off) -- see profiling.py
+    app.config["PROFILE_SLOW_MS"] = float(os.environ.get("PROFILE_SLOW_MS", 0))
+    app.config["PROFILE_SAMPLE_RATE"] = float(os.environ.get("PROFILE_SAMPLE_RATE", 1.0))
+    # werkzeug generate_password_hash method, spelled out in full (method:params);
+    # stored hashes made another way are upgraded at the next login
+    app.config["PASSWORD_HASH_METHOD"] = os.environ.get("PASSWORD_HASH_METHOD", "scrypt:16384:8:1")
+
+    # production | default -- see db_profile.py
+    from . import db_profile, querystats, dashboard, analytics, usercache, httpcache, jobs, metrics, profiling, catalogue, search
+    app.config["DB_PROFILE"] = os.environ.get("DB_PROFILE", "production")
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = db_profile.engine_options(
+        app.config["DB_PROFILE"], app.config["SQLALCHEMY_DATABASE_URI"]
+    )
 
     db.init_app(app)
     login_manager.init_app(app)
 
-    from .models import User
-    @login_manager.user_loader
-    def load_user(user_id):
-        return User.query.get(int(user_id))
+    with app.app_context():
+        db_profile.init_app(app, db.engine)
+    querystats.init_app(app)
+    metrics.init_app(app)
+    profiling.init_app(app)
+    dashboard.init_app(app)
+    catalogue.init_app(app)
+    analytics.init_app(app)
+    usercache.init_app(app, login_manager)
+    httpcache.init_app(app)
+    jobs.init_app(app)
+    # Nothing here touches the database: the schema is created by
+    # `flask bootstrap` / `flask db-upgrade` (see schema.py) and the search
+    # backend is picked on first use.
+    search.init_app(app)
 
     # Blueprints
     from .auth import auth_bp
     from .routes import main_bp
+    from .api import api_bp
     app.register_blueprint(auth_bp)
     app.register_blueprint(main_bp)
+    app.register_blueprint(api_bp)
 
-    with app.app_context():
-        from .seed import ensure_default_admin
-        db.create_all()
-        ensure_default_admin()
+    from .commands import register_commands
+    register_commands(app)
 
     # Template helpers
     from .utils import currency
+    from .pagination import cursor_url
     app.jinja_env.filters["currency"] = currency
+    app.jinja_env.globals["cursor_url"] = cursor_url
 
     return app
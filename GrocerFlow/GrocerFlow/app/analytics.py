@@ -0,0 +1,219 @@
+"""Demand analytics: consumption rates, days of cover and reorder suggestions.
+
+Stock Out history for the window is read in one query as three integer
+columns (product id, day number, quantity) and turned into NumPy arrays.
+Daily totals and every figure below are then computed for the whole
+catalogue at once with unique/bincount and array maths -- no query or
+Python loop per product:
+
+* avg_daily     -- moving average of units out per day over the window
+* recent_daily  -- the same over the last RECENT_DAYS (trend check)
+* days_of_cover -- stock / avg_daily (None when nothing moves)
+* reorder_point -- avg_daily * lead time + safety stock, where safety stock
+  is SERVICE_Z standard deviations of daily demand over the lead time
+* suggested_qty -- enough to cover lead time + cover days, when stock has
+  fallen to the reorder point
+
+Results are cached per worker for ANALYTICS_CACHE_TTL seconds. NumPy is
+imported by the functions that use it, so it isn't loaded (about a tenth of
+a second) until the first analysis runs rather than at every worker boot.
+"""
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import Integer, cast, func, select
+
+from . import archive, db
+from .cache import get_cache, register_cache
+from .models import Product
+
+DEFAULT_WINDOW_DAYS = 28
+DEFAULT_LEAD_TIME_DAYS = 7
+DEFAULT_COVER_DAYS = 14
+MAX_WINDOW_DAYS = 730
+RECENT_DAYS = 7
+# ~95% chance of not running out during the lead time
+SERVICE_Z = 1.65
+FETCH_CHUNK = 100000
+EPOCH = date(1970, 1, 1)
+
+
+class ReorderAnalysis:
+    """Per-product demand figures as parallel arrays, ordered by product id."""
+
+    def __init__(self, window_days, lead_time_days, cover_days, as_of):
+        self.window_days = window_days
+        self.lead_time_days = lead_time_days
+        self.cover_days = cover_days
+        self.as_of = as_of
+
+    def order(self, needs_reorder=False):
+        """Indexes by urgency: lowest days of cover first, fastest movers first on ties."""
+        import numpy as np
+        idx = np.lexsort((-self.avg_daily, self.days_of_cover))
+        if needs_reorder:
+            idx = idx[self.suggested_qty[idx] > 0]
+        return idx
+
+    def rows(self, limit=None, needs_reorder=False) -> list:
+        import numpy as np
+        idx = self.order(needs_reorder)[:limit]
+        cover = self.days_of_cover[idx]
+        return [
+            {
+                "id": int(self.ids[i]),
+                "sku": self.skus[i],
+                "name": self.names[i],
+                "stock": int(self.stock[i]),
+                "reorder_level": int(self.reorder_level[i]),
+                "avg_daily": round(float(self.avg_daily[i]), 3),
+                "recent_daily": round(float(self.recent_daily[i]), 3),
+                "days_of_cover": round(float(c), 1) if np.isfinite(c) else None,
+                "reorder_point": int(self.reorder_point[i]),
+                "suggested_qty": int(self.suggested_qty[i]),
+            }
+            for i, c in zip(idx.tolist(), cover.tolist())
+        ]
+
+    def summary(self) -> dict:
+        import numpy as np
+        return {
+            "as_of": self.as_of.isoformat(),
+            "window_days": self.window_days,
+            "lead_time_days": self.lead_time_days,
+            "cover_days": self.cover_days,
+            "recent_days": min(RECENT_DAYS, self.window_days),
+            "products": int(self.ids.size),
+            "moving": int(np.count_nonzero(self.avg_daily)),
+            "needs_reorder": int(np.count_nonzero(self.suggested_qty)),
+            "suggested_units": int(self.suggested_qty.sum()),
+        }
+
+
+def _day_number(column):
+    """Whole days since 1970-01-01 as an SQL integer expression."""
+    if db.engine.dialect.name == "sqlite":
+        return cast(func.strftime("%s", column), Integer) / 86400
+    return cast(func.floor(func.extract("epoch", column) / 86400), Integer)
+
+
+def _out_history(since):
+    """(product_id, day number, quantity) int64 columns for every Stock Out since `since`."""
+    import numpy as np
+    tx = archive.ledger(since)
+    stmt = (
+        select(tx.product_id, _day_number(tx.tx_date), tx.quantity)
+        .where(tx.tx_type == "OUT", tx.tx_date >= since)
+    )
+    # All three columns are plain integers, so read them straight off the
+    # DBAPI cursor: building a Row object per ledger line would cost more
+    # than all of the maths below.
+    result = db.session.connection().execute(stmt)
+    chunks = []
+    try:
+        while True:
+            rows = result.cursor.fetchmany(FETCH_CHUNK)
+            if not rows:
+                break
+            chunks.append(np.array(rows, dtype=np.int64))
+    finally:
+        result.close()
+    if not chunks:
+        return np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0, np.int64)
+    history = np.concatenate(chunks)
+    return history[:, 0], history[:, 1], history[:, 2]
+
+
+def _catalogue():
+    import numpy as np
+    rows = db.session.execute(
+        select(Product.id, Product.sku, Product.name, Product.stock, Product.reorder_level).order_by(Product.id)
+    ).all()
+    if not rows:
+        return np.empty(0, np.int64), [], [], np.empty(0), np.empty(0)
+    ids, skus, names, stock, reorder_level = zip(*rows)
+    return (
+        np.fromiter(ids, np.int64, len(rows)),
+        list(skus),
+        list(names),
+        np.fromiter((s or 0 for s in stock), np.float64, len(rows)),
+        np.fromiter((r or 0 for r in reorder_level), np.float64, len(rows)),
+    )
+
+
+def compute(window_days=DEFAULT_WINDOW_DAYS, lead_time_days=DEFAULT_LEAD_TIME_DAYS, cover_days=DEFAULT_COVER_DAYS, now=None) -> ReorderAnalysis:
+    import numpy as np
+    now = now or datetime.utcnow()
+    # Whole days: the window ends with today and starts window_days - 1 days earlier
+    since = datetime.combine(now.date() - timedelta(days=window_days - 1), datetime.min.time())
+
+    result = ReorderAnalysis(window_days, lead_time_days, cover_days, now)
+    result.ids, result.skus, result.names, result.stock, result.reorder_level = _catalogue()
+    n = result.ids.size
+
+    pids, days, qty = _out_history(since)
+    offset = days - (since.date() - EPOCH).days
+    # Future-dated rows would spill into the next product's buckets
+    keep = offset < window_days
+    pids, offset, qty = pids[keep], offset[keep], qty[keep]
+    idx = np.searchsorted(result.ids, pids)
+    # A product and its first Stock Out committed between the two reads are
+    # in the history but not the catalogue: leave those rows out
+    known = idx < n
+    known[known] = result.ids[idx[known]] == pids[known]
+    idx, offset, qty = idx[known], offset[known], qty[known]
+    # One bucket per product per day: the day's total Stock Out
+    buckets, inverse = np.unique(idx * window_days + offset, return_inverse=True)
+    daily = np.bincount(inverse, weights=qty)
+    bucket_product = buckets // window_days
+    recent = buckets % window_days >= window_days - RECENT_DAYS
+
+    total = np.bincount(bucket_product, weights=daily, minlength=n)
+    sum_sq = np.bincount(bucket_product, weights=daily * daily, minlength=n)
+    recent_total = np.bincount(bucket_product[recent], weights=daily[recent], minlength=n)
+
+    avg = total / window_days
+    # Days without a Stock Out count as zero demand
+    std = np.sqrt(np.maximum(sum_sq / window_days - avg * avg, 0.0))
+    safety = SERVICE_Z * std * np.sqrt(lead_time_days)
+    reorder_point = np.ceil(avg * lead_time_days + safety)
+    target = avg * (lead_time_days + cover_days) + safety
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        result.days_of_cover = np.where(avg > 0, result.stock / avg, np.inf)
+    result.avg_daily = avg
+    result.recent_daily = recent_total / min(RECENT_DAYS, window_days)
+    result.reorder_point = reorder_point
+    result.suggested_qty = np.where(
+        (avg > 0) & (result.stock <= reorder_point),
+        np.ceil(np.maximum(target - result.stock, 0.0)),
+        0.0,
+    )
+    return result
+
+
+def _int_arg(args, name, default, low, high):
+    try:
+        value = int(args.get(name, default))
+    except (TypeError, ValueError):
+        return default
+    return max(low, min(value, high))
+
+
+def params_from_args(args) -> dict:
+    """compute() keyword arguments from ?window=&lead_time=&cover= query args."""
+    return {
+        "window_days": _int_arg(args, "window", DEFAULT_WINDOW_DAYS, 1, MAX_WINDOW_DAYS),
+        "lead_time_days": _int_arg(args, "lead_time", DEFAULT_LEAD_TIME_DAYS, 0, 365),
+        "cover_days": _int_arg(args, "cover", DEFAULT_COVER_DAYS, 0, 365),
+    }
+
+
+def reorder_analysis(window_days=DEFAULT_WINDOW_DAYS, lead_time_days=DEFAULT_LEAD_TIME_DAYS, cover_days=DEFAULT_COVER_DAYS) -> ReorderAnalysis:
+    """Cached compute() for the current day."""
+    key = (window_days, lead_time_days, cover_days, datetime.utcnow().date())
+    return get_cache("analytics").get_or_set(key, lambda: compute(window_days, lead_time_days, cover_days))
+
+
+def init_app(app):
+    app.config.setdefault("ANALYTICS_CACHE_TTL", 300)
+    register_cache(app, "analytics", maxsize=8, ttl=float(app.config["ANALYTICS_CACHE_TTL"]))
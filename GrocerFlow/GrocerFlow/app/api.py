@@ -0,0 +1,114 @@
+import io
+
+from flask import Blueprint, jsonify, request
+from flask_login import login_required
+
+from . import db, search
+from .analytics import params_from_args, reorder_analysis
+from .imports import import_catalogue
+from .ledger import BatchError, InsufficientStock, apply_batch, read_csv_bytes, read_json_lines, read_transfer, transfer_stock
+from .models import Category, Product, Supplier
+from .pagination import keyset_paginate
+from .queries import CATEGORY_KEYS, SUPPLIER_KEYS, option_list_query
+from .querystats import query_budget
+
+api_bp = Blueprint("api", __name__, url_prefix="/api")
+
+MAX_ANALYTICS_ROWS = 5000
+SEARCH_LIMIT = 10
+MAX_SEARCH_LIMIT = 25
+OPTIONS_PAGE_SIZE = 50
+
+# kind -> (model, search index, keyset order)
+OPTION_SOURCES = {
+    "categories": (Category, "categories", CATEGORY_KEYS),
+    "suppliers": (Supplier, "suppliers", SUPPLIER_KEYS),
+}
+
+@api_bp.route("/transactions/batch", methods=["POST"])
+@login_required
+def transactions_batch():
+    atomic = request.args.get("atomic", "").strip() == "1"
+    try:
+        if "file" in request.files:
+            lines = read_csv_bytes(request.files["file"].read())
+        elif request.mimetype == "text/csv":
+            lines = read_csv_bytes(request.get_data())
+        else:
+            lines = read_json_lines(request.get_json(silent=True))
+        result = apply_batch(lines, atomic=atomic)
+    except BatchError as exc:
+        return jsonify({"error": str(exc)}), 400
+    return jsonify(result.to_dict()), 200 if result.applied or not result.errors else 422
+
+@api_bp.route("/transfers", methods=["POST"])
+@login_required
+def transfers():
+    """Move stock of one SKU between locations: {sku, from, to, quantity, reference, note}, locations by name."""
+    try:
+        prod_id, from_id, to_id, qty, reference, note = read_transfer(request.get_json(silent=True))
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+    try:
+        tx_id = transfer_stock(prod_id, from_id, to_id, qty, reference=reference, note=note)
+    except InsufficientStock:
+        return jsonify({"error": "Not enough stock at the source location."}), 409
+    return jsonify({"transaction_id": tx_id, "quantity": qty})
+
+@api_bp.route("/products/import", methods=["POST"])
+@login_required
+def products_import():
+    """Catalogue CSV (inventory export layout) as a `file` upload or a text/csv body."""
+    atomic = request.args.get("atomic", "").strip() == "1"
+    raw = request.files["file"].stream if "file" in request.files else request.stream
+    try:
+        result = import_catalogue(io.TextIOWrapper(raw, encoding="utf-8-sig", newline=""), atomic=atomic)
+    except BatchError as exc:
+        return jsonify({"error": str(exc)}), 400
+    return jsonify(result.to_dict()), 200 if result.applied or not result.errors else 422
+
+@api_bp.route("/analytics/reorder")
+@login_required
+def analytics_reorder():
+    """Demand figures, most urgent first; ?all=1 includes products that don't need reordering."""
+    try:
+        limit = min(int(request.args.get("limit", 500)), MAX_ANALYTICS_ROWS)
+    except ValueError:
+        limit = 500
+    analysis = reorder_analysis(**params_from_args(request.args))
+    needs_reorder = request.args.get("all", "").strip() != "1"
+    return jsonify({**analysis.summary(), "items": analysis.rows(limit=max(limit, 0), needs_reorder=needs_reorder)})
+
+@api_bp.route("/products/search")
+@login_required
+@query_budget(3)
+def products_search():
+    """Typeahead: best matches for ?q= as compact rows, at most MAX_SEARCH_LIMIT."""
+    q = request.args.get("q", "").strip()
+    try:
+        limit = min(max(int(request.args.get("limit", SEARCH_LIMIT)), 1), MAX_SEARCH_LIMIT)
+    except ValueError:
+        limit = SEARCH_LIMIT
+    if not q:
+        return jsonify({"q": q, "items": []})
+    ids = search.ranked_ids("products", q, limit)
+    rows = {}
+    if ids:
+        rows = {r.id: r for r in db.session.execute(
+            db.select(Product.id, Product.sku, Product.name, Product.stock).where(Product.id.in_(ids))
+        )}
+    items = [{"id": r.id, "sku": r.sku, "name": r.name, "stock": r.stock} for r in (rows.get(i) for i in ids) if r]
+    return jsonify({"q": q, "items": items})
+
+@api_bp.route("/<any(categories, suppliers):kind>/options")
+@login_required
+@query_budget(2)
+def options(kind):
+    """One page of (id, name) options for the product form's selects; follow `next` for more."""
+    model, index, keys = OPTION_SOURCES[kind]
+    q = request.args.get("q", "").strip()
+    page = keyset_paginate(option_list_query(model, index, q), keys, request.args.get("cursor"), OPTIONS_PAGE_SIZE)
+    return jsonify({
+        "items": [{"id": r.id, "name": r.name} for r in page.items],
+        "next": page.next_cursor,
+    })
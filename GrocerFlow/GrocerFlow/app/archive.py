@@ -0,0 +1,164 @@
+"""Ledger archival: old stock transactions move to per-year partitions.
+
+`flask ledger-archive` moves every transaction dated before a cutoff
+(default: ARCHIVE_AFTER_DAYS ago) out of the hot `stock_transactions`
+table into `stock_transactions_archive_<year>` tables, ids and all, and
+adds their net quantity to one `stock_opening_balances` row per product,
+dated with the product's last archived row. `Product.stock` is not
+touched; the opening balance stands in for the archived rows, so the hot
+table and its indexes only hold recent history.
+The newest ledger row always stays behind so that ids keep counting up
+from it (SQLite would otherwise hand out archived ids again).
+
+Reads get their source from `ledger(start, end)`: the StockTransaction
+model itself when there is no start date or no partition overlaps the
+range, otherwise an ORM alias over a UNION ALL of the hot table and only
+the overlapping partitions, with the date bounds repeated in every branch
+so each one is read through its own tx_date index. The full-text index
+covers the hot table only; over archived ranges a reference search falls
+back to LIKE.
+"""
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import (
+    Column, DateTime, Index, Integer, MetaData, String, Table, bindparam, case, delete, func, insert, select,
+    union_all, update,
+)
+from sqlalchemy.orm import aliased
+
+from . import db
+from .models import LedgerArchive, OpeningBalance, StockTransaction, signed_quantity
+from .utils import chunks
+
+TABLE_PREFIX = "stock_transactions_archive_"
+COLUMNS = ("id", "product_id", "tx_type", "quantity", "reference", "note", "tx_date", "created_at", "updated_at",
+           "location_id")
+
+# Partition tables live outside db.metadata so create_all() leaves them alone
+_metadata = MetaData()
+
+
+def partition_table(name) -> Table:
+    table = _metadata.tables.get(name)
+    if table is None:
+        table = Table(
+            name, _metadata,
+            Column("id", Integer, primary_key=True, autoincrement=False),
+            Column("product_id", Integer, nullable=False),
+            Column("tx_type", String(10), nullable=False),
+            Column("quantity", Integer, nullable=False),
+            Column("reference", String(120)),
+            Column("note", String(255)),
+            Column("tx_date", DateTime, nullable=False),
+            Column("created_at", DateTime, nullable=False),
+            Column("updated_at", DateTime, nullable=False),
+            # Added by migration 5 to partitions created before it
+            Column("location_id", Integer),
+            Index(f"ix_{name}_type_date", "tx_type", "tx_date", "product_id", "quantity"),
+            Index(f"ix_{name}_product_date", "product_id", "tx_date"),
+        )
+    return table
+
+
+def ledger(start=None, end=None):
+    """Entity to read ledger rows dated in [start, end) from (see module docstring)."""
+    if start is None:
+        return StockTransaction
+    overlapping = select(LedgerArchive.table_name).where(LedgerArchive.last_date >= start)
+    if end is not None:
+        overlapping = overlapping.where(LedgerArchive.first_date < end)
+    names = db.session.execute(overlapping.order_by(LedgerArchive.first_date)).scalars().all()
+    if not names:
+        return StockTransaction
+
+    def branch(table):
+        criteria = [table.c.tx_date >= start]
+        if end is not None:
+            criteria.append(table.c.tx_date < end)
+        return select(*[table.c[name] for name in COLUMNS]).where(*criteria)
+
+    tables = [StockTransaction.__table__] + [partition_table(name) for name in names]
+    return aliased(StockTransaction, union_all(*[branch(t) for t in tables]).subquery("ledger"))
+
+
+def opening_balance(product_id):
+    return db.session.get(OpeningBalance, product_id)
+
+
+def default_cutoff():
+    days = current_app.config.get("ARCHIVE_AFTER_DAYS", 0)
+    if days <= 0:
+        return None
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    return today - timedelta(days=days)
+
+
+def archive_before(cutoff) -> int:
+    """Archive every ledger row dated before `cutoff`, one year per commit; returns rows moved."""
+    hot = StockTransaction.__table__
+    newest_id = db.session.execute(select(func.max(hot.c.id))).scalar()
+    oldest = db.session.execute(select(func.min(hot.c.tx_date)).where(hot.c.tx_date < cutoff)).scalar()
+    db.session.rollback()
+    if oldest is None:
+        return 0
+    moved = 0
+    for year in range(oldest.year, cutoff.year + 1):
+        start = datetime(year, 1, 1)
+        end = min(datetime(year + 1, 1, 1), cutoff)
+        if start < end:
+            moved += _archive_range(year, [hot.c.tx_date >= start, hot.c.tx_date < end, hot.c.id < newest_id])
+    return moved
+
+
+def _archive_range(year, in_range) -> int:
+    hot = StockTransaction.__table__
+    first, last, count = db.session.execute(
+        select(func.min(hot.c.tx_date), func.max(hot.c.tx_date), func.count()).where(*in_range)
+    ).one()
+    if not count:
+        db.session.rollback()
+        return 0
+
+    table = partition_table(f"{TABLE_PREFIX}{year}")
+    table.create(db.session.connection(), checkfirst=True)
+    db.session.execute(insert(table).from_select(COLUMNS, select(*[hot.c[name] for name in COLUMNS]).where(*in_range)))
+    _add_to_opening_balances(in_range)
+    db.session.execute(delete(hot).where(*in_range))
+
+    entry = LedgerArchive.query.filter_by(table_name=table.name).first()
+    if entry is None:
+        entry = LedgerArchive(table_name=table.name, first_date=first, last_date=last, row_count=0)
+        db.session.add(entry)
+    entry.first_date = min(entry.first_date, first)
+    entry.last_date = max(entry.last_date, last)
+    entry.row_count += count
+    entry.archived_at = datetime.utcnow()
+    db.session.commit()
+    return count
+
+
+def _add_to_opening_balances(in_range):
+    hot = StockTransaction.__table__
+    rows = db.session.execute(
+        select(hot.c.product_id, func.sum(signed_quantity(hot.c)), func.max(hot.c.tx_date)).where(*in_range).group_by(hot.c.product_id)
+    ).all()
+    moved = {pid: (delta, last) for pid, delta, last in rows}
+    balances = OpeningBalance.__table__
+    existing = set()
+    for chunk in chunks(list(moved)):
+        existing.update(db.session.execute(
+            select(balances.c.product_id).where(balances.c.product_id.in_(chunk))
+        ).scalars())
+    if existing:
+        # A row held back as the newest by an earlier run can be older than what that run archived
+        last = bindparam("last")
+        db.session.execute(
+            update(balances)
+            .where(balances.c.product_id == bindparam("pid"))
+            .values(quantity=balances.c.quantity + bindparam("delta"), as_of=case((balances.c.as_of < last, last), else_=balances.c.as_of)),
+            [{"pid": pid, "delta": moved[pid][0], "last": moved[pid][1]} for pid in existing],
+        )
+    fresh = [{"product_id": pid, "quantity": delta, "as_of": last} for pid, (delta, last) in moved.items() if pid not in existing]
+    if fresh:
+        db.session.execute(insert(balances), fresh)
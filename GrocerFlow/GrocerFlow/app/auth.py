@@ -2,7 +2,7 @@ from flask import Blueprint, render_template, redirect, url_for, flash, request
 from flask_login import login_user, logout_user, login_required, current_user
 from .forms import LoginForm, ChangePasswordForm
 from .models import User
-from . import db
+from . import db, usercache
 
 auth_bp = Blueprint("auth", __name__, url_prefix="/auth")
 
@@ -14,6 +14,9 @@ def login():
     if form.validate_on_submit():
         user = User.query.filter_by(username=form.username.data.strip()).first()
         if user and user.check_password(form.password.data):
+            if user.needs_rehash():
+                user.set_password(form.password.data)
+                db.session.commit()
             login_user(user, remember=form.remember.data)
             next_url = request.args.get("next")
             return redirect(next_url or url_for("main.dashboard"))
@@ -31,11 +34,16 @@ def logout():
 def profile():
     form = ChangePasswordForm()
     if form.validate_on_submit():
-        if not current_user.check_password(form.current_password.data):
+        # current_user is a cached read-only copy (see usercache.py)
+        user = db.session.get(User, current_user.id)
+        if not user.check_password(form.current_password.data):
             flash("Current password is incorrect.", "danger")
         else:
-            current_user.set_password(form.new_password.data)
+            user.set_password(form.new_password.data)
             db.session.commit()
+            usercache.forget(user.id)
+            # Re-issue this session under the new password version
+            login_user(user)
             flash("Password updated successfully.", "success")
             return redirect(url_for("auth.profile"))
     return render_template("auth/profile.html", form=form)
@@ -0,0 +1,143 @@
+"""Small in-process caches with TTL expiry, LRU eviction and hit/miss counters.
+
+Caches are per process: with several workers, a write in one worker only
+invalidates that worker's copy, and the others catch up when the TTL runs
+out. Keep TTLs short for anything users expect to see change.
+
+`invalidate_on_commit` drops a worker's own copy as soon as it commits a
+write to the tables the copy was built from.
+"""
+import threading
+import time
+from collections import OrderedDict
+from itertools import chain
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+
+from . import db
+
+_MISSING = object()
+# Session.info key: callbacks due at the next commit
+_DIRTY = "invalidate_on_commit"
+# callback -> (models, their table names)
+_watchers = {}
+
+
+class TTLCache:
+    def __init__(self, maxsize=128, ttl=60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING and entry[0] > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not _MISSING:
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_set(self, key, factory):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = factory()
+            self.set(key, value)
+        return value
+
+    def invalidate(self, key=_MISSING):
+        """Drop one key, or everything when no key is given."""
+        with self._lock:
+            if key is _MISSING:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+def register_cache(app, name, maxsize=128, ttl=60.0) -> TTLCache:
+    cache = TTLCache(maxsize=maxsize, ttl=ttl)
+    app.extensions.setdefault("caches", {})[name] = cache
+    return cache
+
+
+def get_cache(name) -> TTLCache:
+    return current_app.extensions["caches"][name]
+
+
+def cache_stats() -> dict:
+    return {name: cache.stats() for name, cache in current_app.extensions.get("caches", {}).items()}
+
+
+def invalidate_on_commit(models, callback):
+    """Call `callback()` after every commit that wrote to one of `models`.
+
+    Writes are seen through the ORM unit of work and through insert, update
+    or delete statements run on the session; a write that is rolled back
+    calls nothing. The callback runs in the committing app's context.
+    Registering the same callback again (another app) replaces it.
+    """
+    _watchers[callback] = (tuple(models), {model.__tablename__ for model in models})
+    if not event.contains(db.session, "after_commit", _after_commit):
+        event.listen(db.session, "after_flush", _after_flush)
+        event.listen(db.session, "do_orm_execute", _do_orm_execute)
+        event.listen(db.session, "after_commit", _after_commit)
+        event.listen(db.session, "after_rollback", _after_rollback)
+
+
+def _after_flush(session, flush_context):
+    changed = list(chain(session.new, session.dirty, session.deleted))
+    for callback, (models, _) in _watchers.items():
+        if any(isinstance(obj, models) for obj in changed):
+            session.info.setdefault(_DIRTY, set()).add(callback)
+
+
+def _do_orm_execute(state):
+    # Also sees Core insert()/update() on the tables run through the session
+    if state.is_insert or state.is_update or state.is_delete:
+        table = getattr(state.statement, "table", None)
+        if table is None:
+            return
+        for callback, (_, tables) in _watchers.items():
+            if table.name in tables:
+                state.session.info.setdefault(_DIRTY, set()).add(callback)
+
+
+def _after_commit(session):
+    callbacks = session.info.pop(_DIRTY, None)
+    if callbacks and has_app_context():
+        for callback in callbacks:
+            callback()
+
+
+def _after_rollback(session):
+    session.info.pop(_DIRTY, None)
@@ -0,0 +1,308 @@
+"""Per-process read-only catalogue snapshot for hot product lookups.
+
+The product pages look a product up by id (or SKU) only to show its name,
+unit, price and category/supplier names, or to check that it exists.
+Rather than building a full `Product` with its relationships for that,
+each worker keeps the catalogue column-wise in memory: parallel arrays and
+lists (id, sku, name, unit, price, reorder level, category id, supplier
+id), one dict per lookup key pointing at the row, and the category,
+supplier and stock location names by id. A lookup returns a small
+`CatalogueEntry` built from one row. Stock is left out on purpose -- it
+changes with every transaction and is always read from the database.
+
+The snapshot is loaded on first use and kept fresh from `updated_at`: at
+most once every CATALOGUE_REFRESH_SECONDS a lookup reads the max
+updated_at and row count of products, categories, suppliers and
+locations (one query). When products changed, only the rows updated
+since the last refresh (minus DELTA_OVERLAP, for writes that committed
+late) are read back; when the row count still doesn't match -- a product
+was deleted -- the products are reloaded in full. Categories, suppliers
+and locations are small and reloaded whole when their stamp moves. A
+commit in this worker that touches any of these tables makes the next
+lookup refresh at once, and an id or SKU that isn't found forces a
+refresh before the lookup gives up, so a product created by another
+worker is never reported missing. Other workers' edits show up within
+the refresh interval.
+
+Use it for rendering and validation only; load the ORM object to change
+a product.
+"""
+import threading
+import time
+from array import array
+from datetime import timedelta
+
+from flask import abort, current_app
+from sqlalchemy import func, select
+
+from . import db
+from .cache import invalidate_on_commit
+from .models import Category, Location, Product, Supplier
+
+TRACKED_MODELS = (Product, Category, Supplier, Location)
+# Rows updated this long before the last refresh are read again, in case
+# their transaction committed after it
+DELTA_OVERLAP = timedelta(seconds=10)
+# Most statements one refresh runs: stamp, product delta, full product
+# reload, categories, suppliers, locations. Add it to the budget of views
+# that look up.
+REFRESH_QUERIES = 6
+
+
+class CatalogueEntry:
+    """One product as the snapshot last saw it (no stock)."""
+
+    __slots__ = ("id", "sku", "name", "unit", "price", "reorder_level", "category_id", "supplier_id",
+                 "category_name", "supplier_name")
+
+    def __init__(self, id, sku, name, unit, price, reorder_level, category_id, supplier_id, category_name, supplier_name):
+        self.id = id
+        self.sku = sku
+        self.name = name
+        self.unit = unit
+        self.price = price
+        self.reorder_level = reorder_level
+        self.category_id = category_id
+        self.supplier_id = supplier_id
+        self.category_name = category_name
+        self.supplier_name = supplier_name
+
+    def __repr__(self):
+        return f"<CatalogueEntry {self.sku}>"
+
+
+class _Rows:
+    """The product columns; row i of every column is one product."""
+
+    def __init__(self):
+        self.ids = array("q")
+        self.skus = []
+        self.names = []
+        self.units = []
+        self.prices = array("d")
+        self.reorder_levels = array("q")
+        # 0 = none
+        self.category_ids = array("q")
+        self.supplier_ids = array("q")
+        self.by_id = {}
+        self.by_sku = {}
+        # A few distinct units shared by every row
+        self.unit_strings = {}
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def put(self, pid, sku, name, unit, price, reorder_level, category_id, supplier_id):
+        unit = self.unit_strings.setdefault(unit, unit)
+        row = self.by_id.get(pid)
+        if row is None:
+            row = len(self.ids)
+            self.by_id[pid] = row
+            self.ids.append(pid)
+            self.skus.append(sku)
+            self.names.append(name)
+            self.units.append(unit)
+            self.prices.append(price)
+            self.reorder_levels.append(reorder_level)
+            self.category_ids.append(category_id or 0)
+            self.supplier_ids.append(supplier_id or 0)
+        else:
+            old_sku = self.skus[row]
+            if old_sku != sku and self.by_sku.get(old_sku) == row:
+                del self.by_sku[old_sku]
+            self.skus[row] = sku
+            self.names[row] = name
+            self.units[row] = unit
+            self.prices[row] = price
+            self.reorder_levels[row] = reorder_level
+            self.category_ids[row] = category_id or 0
+            self.supplier_ids[row] = supplier_id or 0
+        self.by_sku[sku] = row
+
+
+def _product_rows(since=None):
+    p = Product.__table__
+    stmt = select(p.c.id, p.c.sku, p.c.name, p.c.unit, p.c.price, p.c.reorder_level, p.c.category_id, p.c.supplier_id)
+    if since is not None:
+        stmt = stmt.where(p.c.updated_at >= since)
+    return db.session.execute(stmt)
+
+
+def _stamp():
+    columns = []
+    for model in TRACKED_MODELS:
+        columns.append(select(func.max(model.updated_at)).scalar_subquery())
+        columns.append(select(func.count()).select_from(model).scalar_subquery())
+    row = db.session.execute(select(*columns)).one()
+    return {model: (row[2 * i], row[2 * i + 1]) for i, model in enumerate(TRACKED_MODELS)}
+
+
+class Catalogue:
+    def __init__(self, refresh_seconds=2.0):
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        self._rows = None
+        self._categories = {}
+        self._suppliers = {}
+        # id -> name in id order; the first is the default location
+        self._locations = {}
+        self._stamp = {}
+        self._checked = 0.0
+        self._stale = True
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.reloads = 0
+
+    # ---- lookups ----
+    def get(self, product_id):
+        """CatalogueEntry for a product id, or None."""
+        return self._lookup("by_id", product_id)
+
+    def get_by_sku(self, sku):
+        return self._lookup("by_sku", sku)
+
+    def get_or_404(self, product_id):
+        entry = self.get(product_id)
+        if entry is None:
+            abort(404)
+        return entry
+
+    def options(self, model, ids):
+        """[(id, name)] of the given category, supplier or location ids that exist."""
+        ids = [i for i in ids if i]
+        self.refresh(force=any(i not in self._names(model) for i in ids))
+        names = self._names(model)
+        return [(i, names[i]) for i in ids if i in names]
+
+    def locations(self):
+        """[(id, name)] of every stock location, the default first."""
+        self.refresh(force=not self._locations)
+        return list(self._locations.items())
+
+    def location_name(self, location_id):
+        found = self.options(Location, [location_id])
+        return found[0][1] if found else None
+
+    def default_location_id(self):
+        # The default location can't be deleted, so once loaded it stays
+        # right: no refresh (stock writes mark the snapshot stale all the time)
+        if not self._locations:
+            self.refresh(force=True)
+        if not self._locations:
+            raise LookupError("No stock location exists; run `flask db-upgrade`.")
+        return next(iter(self._locations))
+
+    def _names(self, model):
+        return {Category: self._categories, Supplier: self._suppliers, Location: self._locations}[model]
+
+    def _lookup(self, index, key):
+        self.refresh()
+        entry = self._entry(index, key)
+        if entry is None:
+            # Maybe created by another worker since the last refresh
+            self.refresh(force=True)
+            entry = self._entry(index, key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return entry
+
+    def _entry(self, index, key):
+        with self._lock:
+            rows = self._rows
+            row = getattr(rows, index).get(key) if rows is not None else None
+            if row is None:
+                return None
+            category_id, supplier_id = rows.category_ids[row], rows.supplier_ids[row]
+            return CatalogueEntry(
+                rows.ids[row], rows.skus[row], rows.names[row], rows.units[row], rows.prices[row],
+                rows.reorder_levels[row], category_id or None, supplier_id or None,
+                self._categories.get(category_id), self._suppliers.get(supplier_id),
+            )
+
+    # ---- freshness ----
+    def mark_stale(self):
+        self._stale = True
+
+    def refresh(self, force=False):
+        now = time.monotonic()
+        if not (force or self._stale or now - self._checked >= self.refresh_seconds):
+            return
+        with self._lock:
+            if not (force or self._stale or now - self._checked >= self.refresh_seconds):
+                return
+            self._stale = False
+            self._checked = now
+            try:
+                self._refresh()
+            except Exception:
+                self._stale = True
+                raise
+
+    def _refresh(self):
+        stamp = _stamp()
+        if stamp == self._stamp and self._rows is not None:
+            return
+        self.refreshes += 1
+        if stamp[Category] != self._stamp.get(Category):
+            self._categories = dict(db.session.execute(select(Category.id, Category.name)).all())
+        if stamp[Supplier] != self._stamp.get(Supplier):
+            self._suppliers = dict(db.session.execute(select(Supplier.id, Supplier.name)).all())
+        if stamp[Location] != self._stamp.get(Location):
+            self._locations = dict(db.session.execute(select(Location.id, Location.name).order_by(Location.id)).all())
+
+        newest, count = stamp[Product]
+        previous = self._stamp.get(Product, (None, None))[0]
+        rows = self._rows
+        if rows is not None and stamp[Product] != self._stamp.get(Product) and count >= len(rows) and previous is not None:
+            for r in _product_rows(since=previous - DELTA_OVERLAP):
+                rows.put(*r)
+        if rows is None or len(rows) != count:
+            # First load, or products were deleted: start over
+            self.reloads += 1
+            rows = _Rows()
+            for r in _product_rows():
+                rows.put(*r)
+            self._rows = rows
+        self._stamp = stamp
+
+    def stats(self) -> dict:
+        """Counters for /stats/cache.json and /metrics.
+
+        refreshes counts stamps that had moved, reloads full product reads;
+        age is seconds since the snapshot was last checked (None before the
+        first load).
+        """
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._rows) if self._rows is not None else 0,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "refreshes": self.refreshes,
+            "reloads": self.reloads,
+            "age": round(time.monotonic() - self._checked, 3) if self._rows is not None else None,
+            "refresh_seconds": self.refresh_seconds,
+        }
+
+
+def get_catalogue() -> Catalogue:
+    return current_app.extensions["catalogue"]
+
+
+def _mark_stale():
+    catalogue = current_app.extensions.get("catalogue")
+    if catalogue is not None:
+        catalogue.mark_stale()
+
+
+def init_app(app):
+    app.config.setdefault("CATALOGUE_REFRESH_SECONDS", 2.0)
+    catalogue = Catalogue(refresh_seconds=float(app.config["CATALOGUE_REFRESH_SECONDS"]))
+    app.extensions["catalogue"] = catalogue
+    # Listed with the caches in /stats/cache.json and /metrics
+    app.extensions.setdefault("caches", {})["catalogue"] = catalogue
+    invalidate_on_commit(TRACKED_MODELS, _mark_stale)
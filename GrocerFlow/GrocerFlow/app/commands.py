@@ -0,0 +1,154 @@
+import json
+import time
+from datetime import datetime, timedelta
+
+import click
+
+from . import archive, jobs, profiling, schema, search
+from .imports import import_catalogue
+from .ledger import BatchError, apply_batch, read_csv_lines, read_json_lines
+from .models import LedgerArchive
+from .seed import ensure_default_admin
+from .snapshots import take_snapshot, valuation_as_of
+from .utils import parse_date
+
+
+def register_commands(app):
+    @app.cli.command("db-upgrade")
+    @click.option("--status", is_flag=True, help="Only list the migrations not applied yet.")
+    def db_upgrade(status):
+        """Apply pending schema migrations (run on deploy, before the workers start)."""
+        if status:
+            waiting = schema.pending()
+            for version, name in waiting:
+                click.echo(f"{version:>4}  {name}")
+            click.echo(f"{len(waiting)} migration(s) pending.")
+            return
+        started = time.perf_counter()
+        ran = schema.upgrade(echo=click.echo)
+        click.echo(f"{ran} migration(s) applied in {time.perf_counter() - started:.2f}s.")
+
+    @app.cli.command("bootstrap")
+    def bootstrap():
+        """Set up a new database: apply every migration and create the default admin."""
+        ran = schema.upgrade(echo=click.echo)
+        click.echo(f"{ran} migration(s) applied.")
+        if ensure_default_admin():
+            click.echo("Created user 'admin' with password 'admin123'; change it after logging in.")
+
+    @app.cli.command("search-rebuild")
+    def search_rebuild():
+        """Create (if missing) and fully rebuild the search index."""
+        search.rebuild()
+        click.echo(f"Search index rebuilt ({search.current_backend().name}).")
+
+    @app.cli.command("import-transactions")
+    @click.argument("path", type=click.Path(exists=True, dir_okay=False))
+    @click.option("--atomic", is_flag=True, help="Apply nothing if any line is rejected.")
+    def import_transactions(path, atomic):
+        """Record a batch of stock transactions from a CSV or JSON file."""
+        started = time.perf_counter()
+        try:
+            with open(path, encoding="utf-8-sig", newline="") as fh:
+                if path.lower().endswith(".json"):
+                    lines = read_json_lines(json.load(fh))
+                else:
+                    lines = read_csv_lines(fh)
+                result = apply_batch(lines, atomic=atomic)
+        except (BatchError, ValueError) as exc:
+            raise click.ClickException(str(exc))
+        elapsed = time.perf_counter() - started
+        for err in result.errors:
+            click.echo(f"line {err['line']} ({err['sku'] or '-'}): {err['error']}", err=True)
+        status = "applied" if result.applied else "not applied"
+        click.echo(f"{result.accepted} accepted, {len(result.errors)} rejected, {status} in {elapsed:.2f}s.")
+
+    @app.cli.command("import-catalogue")
+    @click.argument("path", type=click.Path(exists=True, dir_okay=False))
+    @click.option("--atomic", is_flag=True, help="Import nothing if any row is rejected.")
+    def import_catalogue_command(path, atomic):
+        """Create or update products from a CSV in the inventory export layout."""
+        started = time.perf_counter()
+        try:
+            with open(path, encoding="utf-8-sig", newline="") as fh:
+                result = import_catalogue(fh, atomic=atomic)
+        except BatchError as exc:
+            raise click.ClickException(str(exc))
+        elapsed = time.perf_counter() - started
+        for err in result.errors:
+            click.echo(f"line {err['line']} ({err['sku'] or '-'}): {err['error']}", err=True)
+        if result.rejected > len(result.errors):
+            click.echo(f"... {result.rejected - len(result.errors)} more rejected lines not listed", err=True)
+        status = "applied" if result.applied else "not applied"
+        click.echo(f"{result.created} created, {result.updated} updated, {result.unchanged} unchanged, {result.rejected} rejected, {status} in {elapsed:.2f}s.")
+
+    @app.cli.command("stock-snapshot")
+    def stock_snapshot():
+        """Checkpoint every product's stock (run daily, e.g. from cron)."""
+        run = take_snapshot()
+        click.echo(f"Snapshot {run.id}: {run.product_count} products up to transaction {run.last_tx_id}.")
+
+    @app.cli.command("stock-valuation")
+    @click.argument("as_of")
+    def stock_valuation(as_of):
+        """Print units and value on hand at the end of AS_OF (YYYY-MM-DD)."""
+        day = parse_date(as_of)
+        if day is None:
+            raise click.ClickException("AS_OF must be a date in YYYY-MM-DD form.")
+        report = valuation_as_of(day + timedelta(days=1) - timedelta(microseconds=1))
+        for name, entry in report["by_category"]:
+            click.echo(f"{name}: {entry['units']} units, {entry['value']:.2f}")
+        click.echo(f"Total: {report['units']} units, {report['value']:.2f}")
+
+    @app.cli.command("ledger-archive")
+    @click.option("--before", help="Archive transactions dated before this day (YYYY-MM-DD).")
+    @click.option("--days", type=int, help="Archive transactions older than this many days [default: ARCHIVE_AFTER_DAYS].")
+    def ledger_archive(before, days):
+        """Move old stock transactions into the per-year archive tables."""
+        if before:
+            cutoff = parse_date(before)
+            if cutoff is None:
+                raise click.ClickException("--before must be a date in YYYY-MM-DD form.")
+        elif days is not None:
+            today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+            cutoff = today - timedelta(days=days)
+        else:
+            cutoff = archive.default_cutoff()
+            if cutoff is None:
+                raise click.ClickException("ARCHIVE_AFTER_DAYS is 0; pass --before or --days.")
+        started = time.perf_counter()
+        moved = archive.archive_before(cutoff)
+        click.echo(f"Archived {moved} transaction(s) dated before {cutoff:%Y-%m-%d} in {time.perf_counter() - started:.1f}s.")
+        for entry in LedgerArchive.query.order_by(LedgerArchive.first_date):
+            click.echo(f"  {entry.table_name}: {entry.row_count} rows, {entry.first_date:%Y-%m-%d} .. {entry.last_date:%Y-%m-%d}")
+
+    @app.cli.command("jobs-worker")
+    @click.option("--once", is_flag=True, help="Run what is queued now, then exit.")
+    @click.option("--interval", default=2.0, show_default=True, help="Seconds between polls.")
+    def jobs_worker(once, interval):
+        """Run queued background exports and reports."""
+        while True:
+            ran = jobs.run_pending()
+            if ran:
+                click.echo(f"Ran {ran} job(s).")
+            if once:
+                break
+            time.sleep(interval)
+
+    @app.cli.command("jobs-purge")
+    @click.option("--days", default=7, show_default=True, help="Keep jobs newer than this.")
+    def jobs_purge(days):
+        """Delete finished background jobs and their files."""
+        click.echo(f"Purged {jobs.purge(days)} job(s).")
+
+    @app.cli.command("profiling")
+    @click.option("--slow-ms", type=float, default=500, show_default=True, help="Profile requests at least this slow.")
+    @click.option("--sample", type=click.FloatRange(0, 1), default=1.0, show_default=True, help="Share of requests to run under the profiler.")
+    @click.option("--off", is_flag=True, help="Stop profiling.")
+    def profiling_settings(slow_ms, sample, off):
+        """Turn slow-request profiling on or off in running workers."""
+        profiling.write_settings(app, 0 if off else slow_ms, sample)
+        if off:
+            click.echo("Profiling off.")
+        else:
+            click.echo(f"Profiling {sample:.0%} of requests; dumping those over {slow_ms:g} ms to instance/{profiling.PROFILE_DIR}/.")
@@ -0,0 +1,43 @@
+"""Cached dashboard aggregates.
+
+The dashboard's counts, low-stock list and recent transactions are read
+once and kept in a TTL cache. Any committed write to a product, category,
+supplier, location, stock balance or transaction -- through the ORM unit
+of work or an insert, update or delete statement run on the session --
+drops the cached copy, so
+the next load rebuilds it. The cached rows are plain column tuples, never ORM instances,
+so they are safe to share between requests.
+"""
+from flask import has_app_context
+
+from .cache import get_cache, invalidate_on_commit, register_cache
+from .models import Product, Category, Supplier, StockTransaction, StockBalance, Location
+from .queries import low_stock_query, recent_transactions_query
+
+TRACKED_MODELS = (Product, Category, Supplier, StockTransaction, StockBalance, Location)
+CACHE_KEY = "dashboard"
+
+
+def _load_stats():
+    return {
+        "total_products": Product.query.count(),
+        "total_categories": Category.query.count(),
+        "total_suppliers": Supplier.query.count(),
+        "low_stock": low_stock_query().limit(10).all(),
+        "recent_txs": recent_transactions_query().limit(10).all(),
+    }
+
+
+def dashboard_stats() -> dict:
+    return get_cache("dashboard").get_or_set(CACHE_KEY, _load_stats)
+
+
+def invalidate():
+    if has_app_context():
+        get_cache("dashboard").invalidate()
+
+
+def init_app(app):
+    app.config.setdefault("DASHBOARD_CACHE_TTL", 30)
+    register_cache(app, "dashboard", maxsize=4, ttl=float(app.config["DASHBOARD_CACHE_TTL"]))
+    invalidate_on_commit(TRACKED_MODELS, invalidate)
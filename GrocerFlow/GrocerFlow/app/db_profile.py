@@ -0,0 +1,62 @@
+"""Database engine profiles.
+
+`DB_PROFILE` picks how the engine is tuned:
+
+* "production" (default) -- for SQLite: WAL journal (readers never block
+  the writer), synchronous=NORMAL (safe with WAL, far fewer fsyncs), a
+  busy timeout so writers wait for the lock instead of failing with
+  "database is locked", a 64 MB page cache, 256 MB mmap and in-memory temp
+  tables, applied to every new connection. Other databases get pre-ping
+  and connection recycling on the pool.
+* "default" -- the driver's stock settings (rollback journal, full
+  fsync, sqlite3's 5 s lock wait); mainly useful as the baseline in
+  benchmarks/sqlite_profile.py.
+"""
+from sqlalchemy import event
+
+SQLITE_PRAGMAS = {
+    "production": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": 15000,
+        "cache_size": -64000,
+        "mmap_size": 268435456,
+        "temp_store": "MEMORY",
+    },
+    "default": {},
+}
+
+POOL_OPTIONS = {
+    "production": {"pool_pre_ping": True, "pool_recycle": 1800},
+    "default": {},
+}
+
+
+def engine_options(profile, db_uri) -> dict:
+    """SQLALCHEMY_ENGINE_OPTIONS for `profile`; call before db.init_app()."""
+    if db_uri.startswith("sqlite"):
+        if profile == "production":
+            # sqlite3's own busy handler (seconds); matches busy_timeout below
+            return {"connect_args": {"timeout": 15}}
+        return {}
+    return dict(POOL_OPTIONS.get(profile, {}))
+
+
+def _apply_pragmas(pragmas):
+    def on_connect(dbapi_conn, connection_record):
+        cursor = dbapi_conn.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+    return on_connect
+
+
+def init_app(app, engine):
+    profile = app.config.get("DB_PROFILE", "production")
+    if profile not in SQLITE_PRAGMAS:
+        raise ValueError(f"Unknown DB_PROFILE {profile!r}; expected one of {sorted(SQLITE_PRAGMAS)}.")
+    pragmas = SQLITE_PRAGMAS[profile]
+    if engine.dialect.name == "sqlite" and pragmas:
+        event.listen(engine, "connect", _apply_pragmas(pragmas))
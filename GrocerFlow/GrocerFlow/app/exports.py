@@ -0,0 +1,103 @@
+import csv
+
+from sqlalchemy import and_, or_
+
+from .models import Product
+from .queries import inventory_export_query, transaction_export_query, transaction_source
+
+# Rows fetched per keyset window. Memory use stays proportional to this,
+# not to the size of the table being exported.
+EXPORT_BATCH_SIZE = 2000
+
+INVENTORY_HEADER = ["SKU", "Product", "Category", "Supplier", "Unit", "Price", "Reorder Level", "Stock"]
+TRANSACTIONS_HEADER = ["Date (UTC)", "Type", "SKU", "Product", "Qty", "Reference", "Note", "Location"]
+
+
+class _LineBuffer:
+    """File-like sink for csv.writer that hands back each written line."""
+
+    def write(self, value):
+        return value
+
+
+def _stream(header, batches, to_row):
+    buf = _LineBuffer()
+    writer = csv.writer(buf)
+    yield writer.writerow(header)
+    for rows in batches:
+        # One chunk per window keeps the number of writes to the socket low
+        yield "".join(writer.writerow(to_row(r)) for r in rows)
+
+
+def _inventory_batches(batch_size):
+    base = inventory_export_query()
+    last = None
+    while True:
+        query = base
+        if last is not None:
+            query = query.filter(or_(
+                Product.name > last.product_name,
+                and_(Product.name == last.product_name, Product.id > last.id),
+            ))
+        rows = query.limit(batch_size).all()
+        if not rows:
+            return
+        yield rows
+        if len(rows) < batch_size:
+            return
+        last = rows[-1]
+
+
+def _transaction_batches(filters, batch_size):
+    tx = transaction_source(**filters)
+    base = transaction_export_query(tx, **filters)
+    last = None
+    while True:
+        query = base
+        if last is not None:
+            query = query.filter(or_(
+                tx.tx_date < last.tx_date,
+                and_(tx.tx_date == last.tx_date, tx.id < last.id),
+            ))
+        rows = query.limit(batch_size).all()
+        if not rows:
+            return
+        yield rows
+        if len(rows) < batch_size:
+            return
+        last = rows[-1]
+
+
+def stream_inventory_csv(batch_size=EXPORT_BATCH_SIZE):
+    return _stream(
+        INVENTORY_HEADER,
+        _inventory_batches(batch_size),
+        lambda r: [
+            r.sku,
+            r.product_name,
+            r.category_name or "",
+            r.supplier_name or "",
+            r.unit,
+            r.price,
+            r.reorder_level,
+            r.stock,
+        ],
+    )
+
+
+def stream_transactions_csv(q="", tx_type="", start=None, end=None, location_id=None, batch_size=EXPORT_BATCH_SIZE):
+    filters = {"q": q, "tx_type": tx_type, "start": start, "end": end, "location_id": location_id}
+    return _stream(
+        TRANSACTIONS_HEADER,
+        _transaction_batches(filters, batch_size),
+        lambda r: [
+            r.tx_date.isoformat(sep=" ", timespec="seconds"),
+            r.tx_type,
+            r.sku,
+            r.product_name,
+            r.quantity,
+            r.reference or "",
+            r.note or "",
+            r.location_name or "",
+        ],
+    )
@@ -1,6 +1,7 @@
 from flask_wtf import FlaskForm
+from flask_wtf.file import FileAllowed, FileField, FileRequired
 from wtforms import StringField, PasswordField, SubmitField, BooleanField, IntegerField, FloatField, TextAreaField, SelectField
-from wtforms.validators import DataRequired, Length, Optional, NumberRange
+from wtforms.validators import DataRequired, Length, Optional, NumberRange, ValidationError
 
 class LoginForm(FlaskForm):
     username = StringField("Username", validators=[DataRequired(), Length(max=80)])
@@ -35,9 +36,32 @@ class ProductForm(FlaskForm):
     stock = IntegerField("Opening stock", validators=[DataRequired(), NumberRange(min=0)])
     submit = SubmitField("Save")
 
+class LocationForm(FlaskForm):
+    name = StringField("Location name", validators=[DataRequired(), Length(max=120)])
+    submit = SubmitField("Save")
+
 class StockTxForm(FlaskForm):
     tx_type = SelectField("Type", choices=[("IN","Stock In"), ("OUT","Stock Out")], validators=[DataRequired()])
+    # Left out: the default location
+    location_id = SelectField("Location", coerce=int, validators=[Optional()])
     quantity = IntegerField("Quantity", validators=[DataRequired(), NumberRange(min=1)])
     reference = StringField("Reference (optional)", validators=[Optional(), Length(max=120)])
     note = TextAreaField("Note (optional)", validators=[Optional(), Length(max=255)])
     submit = SubmitField("Record Transaction")
+
+class TransferForm(FlaskForm):
+    from_location_id = SelectField("From", coerce=int, validators=[DataRequired()])
+    to_location_id = SelectField("To", coerce=int, validators=[DataRequired()])
+    quantity = IntegerField("Quantity", validators=[DataRequired(), NumberRange(min=1)])
+    reference = StringField("Reference (optional)", validators=[Optional(), Length(max=120)])
+    note = TextAreaField("Note (optional)", validators=[Optional(), Length(max=255)])
+    submit = SubmitField("Transfer")
+
+    def validate_to_location_id(self, field):
+        if field.data == self.from_location_id.data:
+            raise ValidationError("Pick two different locations.")
+
+class CatalogueImportForm(FlaskForm):
+    file = FileField("CSV file", validators=[FileRequired(), FileAllowed(["csv"], "Upload a .csv file.")])
+    atomic = BooleanField("Import nothing if any row is rejected")
+    submit = SubmitField("Import")
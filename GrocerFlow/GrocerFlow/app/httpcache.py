@@ -0,0 +1,129 @@
+"""Conditional GET for list pages and exports, and fingerprinted static URLs.
+
+Views wrapped in `conditional(*models)` are versioned by a stamp of the
+tables they read: max(updated_at) and row count per table, fetched in one
+query (updated_at is indexed, see TimestampMixin). The stamp, the full
+URL and the session's user make the ETag, and the newest updated_at is the
+Last-Modified. A browser revalidating an unchanged page gets a 304 before
+the view runs; nothing is queried or rendered beyond the stamp.
+
+With RENDER_CACHE_TTL > 0 the rendered HTML is also kept server-side under
+the same ETag, so a different tab or a client without a cached copy still
+skips the render. Streamed responses (CSV exports) are never stored.
+
+Static files are linked as /static/<file>?v=<content hash>; requests that
+carry the hash are served with a one-year immutable Cache-Control.
+"""
+import hashlib
+import os
+from datetime import timezone
+from functools import wraps
+
+from flask import current_app, make_response, request, session
+from flask_login import current_user
+from sqlalchemy import func, select
+
+from . import db
+from .cache import get_cache, register_cache
+
+STATIC_MAX_AGE = 365 * 24 * 3600
+# path -> (mtime, short content hash)
+_STATIC_HASHES = {}
+
+
+def version_stamp(*models):
+    """(token, last_modified) for the given TimestampMixin models."""
+    columns = []
+    for model in models:
+        columns.append(select(func.max(model.updated_at)).scalar_subquery())
+        columns.append(select(func.count()).select_from(model).scalar_subquery())
+    row = db.session.execute(select(*columns)).one()
+    token = "|".join(str(value) for value in row)
+    last_modified = max((value for value in row[::2] if value is not None), default=None)
+    return token, last_modified
+
+
+def _etag(token):
+    user = current_user.get_id() if current_user.is_authenticated else ""
+    raw = f"{request.full_path}\n{user}\n{token}"
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def _not_modified(etag, last_modified):
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    since = request.if_modified_since
+    return since is not None and last_modified is not None and last_modified.replace(tzinfo=timezone.utc, microsecond=0) <= since
+
+
+def _validators(response, etag, last_modified):
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified.replace(tzinfo=timezone.utc)
+    # Always revalidate; the answer is usually a cheap 304
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+def conditional(*models):
+    """Serve 304s (and cached renders) for a GET view that only reads `models`."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # Pending flash messages are part of the page but not of the stamp
+            if request.method != "GET" or session.get("_flashes"):
+                return view(*args, **kwargs)
+            token, last_modified = version_stamp(*models)
+            etag = _etag(token)
+            if _not_modified(etag, last_modified):
+                return _validators(current_app.response_class(status=304), etag, last_modified)
+
+            renders = get_cache("renders")
+            body = renders.get(etag)
+            if body is not None:
+                response = current_app.response_class(body, mimetype="text/html")
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code == 200 and not response.is_streamed and response.mimetype == "text/html":
+                    renders.set(etag, response.get_data())
+            return _validators(response, etag, last_modified)
+        return wrapper
+    return decorator
+
+
+def _static_hash(filename):
+    path = os.path.join(current_app.static_folder, filename)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    cached = _STATIC_HASHES.get(path)
+    if cached is None or cached[0] != mtime:
+        with open(path, "rb") as fh:
+            cached = (mtime, hashlib.sha1(fh.read()).hexdigest()[:12])
+        _STATIC_HASHES[path] = cached
+    return cached[1]
+
+
+def _fingerprint_static(endpoint, values):
+    if endpoint == "static" and "filename" in values and "v" not in values:
+        digest = _static_hash(values["filename"])
+        if digest:
+            values["v"] = digest
+
+
+def _long_cache_static(response):
+    if request.endpoint == "static" and "v" in request.args and response.status_code == 200:
+        response.cache_control.public = True
+        response.cache_control.max_age = STATIC_MAX_AGE
+        response.cache_control.immutable = True
+        response.cache_control.no_cache = None
+    return response
+
+
+def init_app(app):
+    app.config.setdefault("RENDER_CACHE_TTL", 0)
+    register_cache(app, "renders", maxsize=256, ttl=float(app.config["RENDER_CACHE_TTL"]))
+    app.url_defaults(_fingerprint_static)
+    app.after_request(_long_cache_static)
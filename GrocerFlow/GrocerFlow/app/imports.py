@@ -0,0 +1,257 @@
+"""Catalogue import: products (with their categories and suppliers) from CSV.
+
+The file uses the inventory export's layout (exports.INVENTORY_HEADER:
+SKU, Product, Category, Supplier, Unit, Price, Reorder Level, Stock), so
+an export can be edited and loaded back. It is read as a stream and
+handled IMPORT_BATCH_SIZE rows at a time; memory stays proportional to a
+batch plus the category/supplier names seen so far, not to the file.
+
+Per batch: category and supplier names not met before are looked up with
+chunked `IN` queries and the missing ones created with one executemany
+(`ON CONFLICT DO NOTHING`, so a concurrent import creating the same name
+is harmless). Products are then upserted by SKU with one
+`INSERT ... ON CONFLICT (sku) DO UPDATE ... WHERE <something changed>`
+executemany, so re-importing an unchanged price list writes nothing. An
+existing product's stock is never overwritten -- stock only moves through
+the ledger -- so the Stock column is the opening stock of new SKUs, and
+goes to the default location. Products whose reorder level changed get
+the low flags of all their location balances recomputed.
+
+Bad rows are reported by line number and skipped. Each batch is
+committed on its own; with `atomic=True` the whole file is one
+transaction that is rolled back if any row was rejected.
+"""
+import csv
+from datetime import datetime
+
+from sqlalchemy import or_, select
+
+from . import db
+from .exports import INVENTORY_HEADER
+from .ledger import BatchError, insert_for_dialect, run_with_busy_retry
+from .locations import default_location_id, open_default_balances, refresh_low_flags
+from .models import Category, Product, Supplier, compute_is_low
+from .utils import chunks
+
+IMPORT_BATCH_SIZE = 5000
+# Product columns an import sets on an existing SKU (never stock)
+UPSERT_COLUMNS = ("name", "unit", "price", "reorder_level", "category_id", "supplier_id")
+# Errors beyond this many are counted but not listed
+MAX_REPORTED_ERRORS = 500
+
+# header (lower-case) -> (field, max length)
+_COLUMNS = {
+    "sku": ("sku", 80),
+    "product": ("name", 200),
+    "category": ("category", 120),
+    "supplier": ("supplier", 120),
+    "unit": ("unit", 40),
+    "price": ("price", None),
+    "reorder level": ("reorder_level", None),
+    "stock": ("stock", None),
+}
+_REQUIRED = {"sku", "product", "price"}
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.rejected = 0
+        self.errors = []
+        self.applied = False
+
+    def reject(self, line_no, sku, message):
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line_no, "sku": sku, "error": message})
+
+    def to_dict(self) -> dict:
+        return {
+            "created": self.created,
+            "updated": self.updated,
+            "unchanged": self.unchanged,
+            "rejected": self.rejected,
+            "applied": self.applied,
+            "errors": self.errors,
+        }
+
+
+def _read_header(reader):
+    try:
+        header = next(reader)
+    except StopIteration:
+        raise BatchError("The file is empty.")
+    fields = [_COLUMNS.get(h.strip().lower(), (None,))[0] for h in header]
+    missing = _REQUIRED - {h.strip().lower() for h in header}
+    if missing:
+        raise BatchError(f"CSV needs a header row like the inventory export: {', '.join(INVENTORY_HEADER)}.")
+    return fields
+
+
+def _number(raw, name, cast, default=None):
+    raw = raw.strip()
+    if not raw:
+        if default is None:
+            raise ValueError(f"Missing {name}.")
+        return default
+    try:
+        value = cast(raw)
+    except ValueError:
+        raise ValueError(f"{name} must be a {'whole ' if cast is int else ''}number.")
+    if value < 0:
+        raise ValueError(f"{name} can't be negative.")
+    return value
+
+
+def _clean_row(fields, cells):
+    """Return the row as a dict or raise ValueError with a message."""
+    row = {}
+    for field, cell in zip(fields, cells):
+        if field is not None:
+            row[field] = (cell or "").strip()
+    for header, (field, max_len) in _COLUMNS.items():
+        if max_len and len(row.get(field, "")) > max_len:
+            raise ValueError(f"{header} is longer than {max_len} characters.")
+    if not row.get("sku"):
+        raise ValueError("Missing SKU.")
+    if not row.get("name"):
+        raise ValueError("Missing product name.")
+    return {
+        "sku": row["sku"],
+        "name": row["name"],
+        "category": row.get("category") or None,
+        "supplier": row.get("supplier") or None,
+        "unit": row.get("unit") or "pcs",
+        "price": _number(row.get("price", ""), "price", float),
+        "reorder_level": _number(row.get("reorder_level", ""), "reorder level", int, 0),
+        "stock": _number(row.get("stock", ""), "stock", int, 0),
+    }
+
+
+def _resolve_names(model, names, known):
+    """Fill `known` (name -> id) for `names`, creating the missing rows."""
+    wanted = [n for n in names if n not in known]
+    if not wanted:
+        return
+    for attempt in range(2):
+        for chunk in chunks(wanted):
+            known.update(db.session.execute(select(model.name, model.id).where(model.name.in_(chunk))).all())
+        wanted = [n for n in wanted if n not in known]
+        if not wanted or attempt:
+            return
+        now = datetime.utcnow()
+        db.session.execute(
+            insert_for_dialect(model.__table__).on_conflict_do_nothing(index_elements=["name"]),
+            [{"name": n, "created_at": now, "updated_at": now} for n in wanted],
+        )
+
+
+def _existing_skus(skus):
+    """Map sku -> (product id, reorder level) for the SKUs already stored."""
+    found = {}
+    for chunk in chunks(skus):
+        for sku, pid, reorder_level in db.session.execute(
+            select(Product.sku, Product.id, Product.reorder_level).where(Product.sku.in_(chunk))
+        ):
+            found[sku] = (pid, reorder_level)
+    return found
+
+
+def _write_batch(batch, categories, suppliers, location_id):
+    """Upsert one batch; returns (created, updated, unchanged)."""
+    _resolve_names(Category, list({r["category"] for r in batch if r["category"]}), categories)
+    _resolve_names(Supplier, list({r["supplier"] for r in batch if r["supplier"]}), suppliers)
+
+    # A SKU repeated within the file: its last row wins
+    rows = {}
+    for r in batch:
+        rows[r["sku"]] = r
+    existing = _existing_skus(list(rows))
+    now = datetime.utcnow()
+    values = [
+        {
+            "sku": r["sku"], "name": r["name"], "unit": r["unit"], "price": r["price"],
+            "reorder_level": r["reorder_level"], "stock": r["stock"],
+            "is_low": compute_is_low(r["stock"], r["reorder_level"]),
+            "category_id": categories.get(r["category"]), "supplier_id": suppliers.get(r["supplier"]),
+            "created_at": now, "updated_at": now,
+        }
+        for r in rows.values()
+    ]
+    table = Product.__table__
+    stmt = insert_for_dialect(table)
+    set_ = {column: stmt.excluded[column] for column in UPSERT_COLUMNS}
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["sku"],
+        set_={**set_, "updated_at": stmt.excluded.updated_at},
+        # Rows that match what is stored are left alone: no write, no
+        # search-index trigger, and updated_at (the cache stamps) unchanged.
+        where=or_(*[table.c[column].is_distinct_from(value) for column, value in set_.items()]),
+    )
+    # Rows the WHERE leaves alone return nothing. Counted from RETURNING:
+    # psycopg2 doesn't total an executemany's rowcount.
+    written = len(db.session.execute(stmt.returning(table.c.id), values).all())
+    open_default_balances(db.session, location_id, skus=[sku for sku in rows if sku not in existing])
+    refresh_low_flags(db.session, [pid for sku, (pid, level) in existing.items() if rows[sku]["reorder_level"] != level])
+    created = len(rows) - len(existing)
+    return created, written - created, len(existing) - (written - created)
+
+
+def import_catalogue(text_stream, atomic=False, batch_size=IMPORT_BATCH_SIZE) -> ImportResult:
+    """Upsert products from CSV text (see module docstring)."""
+    reader = csv.reader(text_stream)
+    fields = _read_header(reader)
+    sku_at = fields.index("sku")
+    result = ImportResult()
+    categories, suppliers = {}, {}
+    location_id = default_location_id()
+    batch = []
+
+    def write():
+        # Work on copies: ids of rows created by an attempt that is rolled
+        # back (busy retry) must not be remembered.
+        cats, sups = dict(categories), dict(suppliers)
+        counts = _write_batch(batch, cats, sups, location_id)
+        if not atomic:
+            db.session.commit()
+        categories.update(cats)
+        suppliers.update(sups)
+        return counts
+
+    def flush():
+        if batch and not (atomic and result.rejected):
+            created, updated, unchanged = write() if atomic else run_with_busy_retry(write)
+            result.created += created
+            result.updated += updated
+            result.unchanged += unchanged
+        batch.clear()
+
+    try:
+        for line_no, cells in enumerate(reader, start=2):
+            if not any(c.strip() for c in cells):
+                continue
+            try:
+                batch.append(_clean_row(fields, cells))
+            except ValueError as exc:
+                result.reject(line_no, cells[sku_at].strip() if sku_at < len(cells) else None, str(exc))
+                continue
+            if len(batch) >= batch_size:
+                flush()
+        flush()
+    except csv.Error as exc:
+        db.session.rollback()
+        raise BatchError(f"Could not read the CSV: {exc}")
+    except UnicodeDecodeError:
+        db.session.rollback()
+        raise BatchError("The file is not UTF-8 text.")
+
+    if atomic:
+        if result.rejected:
+            db.session.rollback()
+            result.created = result.updated = result.unchanged = 0
+            return result
+        db.session.commit()
+    result.applied = bool(result.created or result.updated)
+    return result
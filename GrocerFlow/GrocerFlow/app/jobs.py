@@ -0,0 +1,228 @@
+"""Background exports and reports.
+
+Heavy exports run outside the request: the view inserts a `jobs` row and
+returns at once, a worker writes the CSV to instance/jobs/, and the page
+polls /jobs/<id>.json until the file can be downloaded.
+
+Workers are a small per-process thread pool (JOB_WORKERS threads, started
+on first use) and/or a separate process running `flask jobs-worker`, which
+also picks up jobs left queued by a restart. With JOB_WORKERS=0 only the
+CLI worker runs jobs. A job is claimed with a conditional UPDATE
+(queued -> running), so each one runs exactly once however many workers
+are polling.
+
+A job still running JOB_STALE_MINUTES after it started is taken to have
+lost its worker (the process was killed or crashed mid-run) and is marked
+failed; the sweep runs before `jobs-worker` looks for queued jobs and
+whenever a job is queued. It is not retried: a job that brought its
+worker down would only do it again.
+"""
+import csv
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import update
+
+from . import db
+from .analytics import compute, params_from_args
+from .exports import stream_inventory_csv, stream_transactions_csv
+from .ledger import run_with_busy_retry
+from .models import Job
+from .queries import transaction_filter_args
+
+JOB_DIR = "jobs"
+STALE_ERROR = "Interrupted: the worker stopped while running this job."
+REORDER_HEADER = ["SKU", "Product", "Stock", "Avg / day", "Days of cover", "Reorder point", "Suggested qty"]
+
+# kind -> (label, download filename, writer(params, fh), accepted param names)
+KINDS = {}
+_pool_lock = threading.Lock()
+
+
+def job_kind(name, label, filename, params=()):
+    def decorator(writer):
+        KINDS[name] = (label, filename, writer, frozenset(params))
+        return writer
+    return decorator
+
+
+@job_kind("inventory_csv", "Inventory CSV", "grocerflow_inventory.csv")
+def _inventory_csv(params, fh):
+    fh.writelines(stream_inventory_csv())
+
+
+@job_kind("transactions_csv", "Transactions CSV", "grocerflow_transactions.csv", params=("q", "type", "start", "end", "location"))
+def _transactions_csv(params, fh):
+    fh.writelines(stream_transactions_csv(**transaction_filter_args(params)))
+
+
+@job_kind("reorder_csv", "Reorder suggestions CSV", "grocerflow_reorder.csv", params=("window", "lead_time", "cover"))
+def _reorder_csv(params, fh):
+    analysis = compute(**params_from_args(params))
+    writer = csv.writer(fh)
+    writer.writerow(REORDER_HEADER)
+    for r in analysis.rows():
+        writer.writerow([r["sku"], r["name"], r["stock"], r["avg_daily"], r["days_of_cover"] if r["days_of_cover"] is not None else "", r["reorder_point"], r["suggested_qty"]])
+
+
+def job_dir():
+    path = os.path.join(current_app.instance_path, JOB_DIR)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def output_path(job):
+    return os.path.join(job_dir(), f"{job.id}-{job.filename}")
+
+
+def label(job):
+    return KINDS[job.kind][0] if job.kind in KINDS else job.kind
+
+
+def to_dict(job) -> dict:
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "label": label(job),
+        "status": job.status,
+        "created_at": job.created_at.isoformat(),
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+        "size": job.size,
+        "error": job.error,
+    }
+
+
+def _pool(app):
+    with _pool_lock:
+        pool = app.extensions.get("job_pool")
+        if pool is None:
+            pool = ThreadPoolExecutor(max_workers=app.config["JOB_WORKERS"], thread_name_prefix="grocerflow-job")
+            app.extensions["job_pool"] = pool
+    return pool
+
+
+def enqueue(kind, params=None, user_id=None) -> Job:
+    """Queue a job and, when JOB_WORKERS > 0, start it on this process's pool.
+
+    Raises ValueError for an unknown kind or a parameter the kind doesn't take.
+    """
+    if kind not in KINDS:
+        raise ValueError(f"Unknown job kind {kind!r}.")
+    unknown = sorted(set(params or {}) - KINDS[kind][3])
+    if unknown:
+        raise ValueError(f"{KINDS[kind][0]} doesn't take {', '.join(unknown)}.")
+    fail_stale()
+    job = Job(kind=kind, params=json.dumps(params or {}), user_id=user_id, filename=KINDS[kind][1])
+    db.session.add(job)
+    db.session.commit()
+    if current_app.config.get("JOB_WORKERS", 0) > 0:
+        app = current_app._get_current_object()
+        _pool(app).submit(_run_in_app, app, job.id)
+    return job
+
+
+def _run_in_app(app, job_id):
+    with app.app_context():
+        try:
+            run_job(job_id)
+        except Exception:
+            app.logger.exception("Job %s crashed", job_id)
+
+
+def _claim(job_id):
+    def work():
+        claimed = db.session.execute(
+            update(Job).where(Job.id == job_id, Job.status == "queued").values(status="running", started_at=datetime.utcnow())
+        ).rowcount
+        db.session.commit()
+        return claimed == 1
+    return run_with_busy_retry(work)
+
+
+def run_job(job_id) -> bool:
+    """Run one queued job to completion; False if someone else claimed it first."""
+    if not _claim(job_id):
+        return False
+    job = db.session.get(Job, job_id)
+    path = output_path(job)
+    partial = path + ".part"
+    try:
+        with open(partial, "w", encoding="utf-8", newline="") as fh:
+            KINDS[job.kind][2](json.loads(job.params), fh)
+        os.replace(partial, path)
+    except Exception as exc:
+        db.session.rollback()
+        current_app.logger.exception("Job %s (%s) failed", job.id, job.kind)
+        if os.path.exists(partial):
+            os.remove(partial)
+        job.status, job.error = "failed", str(exc) or exc.__class__.__name__
+    else:
+        job.status, job.size = "done", os.path.getsize(path)
+    job.finished_at = datetime.utcnow()
+    run_with_busy_retry(db.session.commit)
+    return True
+
+
+def fail_stale(minutes=None) -> int:
+    """Mark jobs running for longer than `minutes` (JOB_STALE_MINUTES) failed."""
+    minutes = current_app.config["JOB_STALE_MINUTES"] if minutes is None else minutes
+    if minutes <= 0:
+        return 0
+    cutoff = datetime.utcnow() - timedelta(minutes=minutes)
+    stale = Job.status == "running", Job.started_at < cutoff
+    # Look before writing: an UPDATE would take the write lock on every poll
+    ids = db.session.execute(db.select(Job.id).where(*stale)).scalars().all()
+    if not ids:
+        return 0
+
+    def work():
+        failed = db.session.execute(
+            update(Job).where(Job.id.in_(ids), *stale).values(status="failed", error=STALE_ERROR, finished_at=datetime.utcnow())
+        ).rowcount
+        db.session.commit()
+        return failed
+    failed = run_with_busy_retry(work)
+    for job in Job.query.filter(Job.id.in_(ids)):
+        partial = output_path(job) + ".part"
+        if os.path.exists(partial):
+            os.remove(partial)
+    current_app.logger.warning("Marked %d stale running job(s) failed", failed)
+    return failed
+
+
+def run_pending(limit=None) -> int:
+    """Run queued jobs oldest first; returns how many this call ran."""
+    fail_stale()
+    ran = 0
+    while limit is None or ran < limit:
+        job_id = db.session.execute(
+            db.select(Job.id).where(Job.status == "queued").order_by(Job.id).limit(1)
+        ).scalar()
+        db.session.rollback()
+        if job_id is None:
+            break
+        if run_job(job_id):
+            ran += 1
+    return ran
+
+
+def purge(days) -> int:
+    """Delete finished jobs older than `days` days and their files."""
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    old = Job.query.filter(Job.status.in_(("done", "failed")), Job.created_at < cutoff).all()
+    for job in old:
+        if job.filename and os.path.exists(output_path(job)):
+            os.remove(output_path(job))
+        db.session.delete(job)
+    db.session.commit()
+    return len(old)
+
+
+def init_app(app):
+    app.config.setdefault("JOB_WORKERS", 2)
+    app.config.setdefault("JOB_STALE_MINUTES", 60)
@@ -0,0 +1,408 @@
+"""Stock movements: single transactions, transfers and batch ingestion.
+
+Stock is held per location (see locations.py). It is never read into
+Python, changed and written back (that loses updates when several workers
+post against the same SKU). Every change is one conditional UPDATE of the
+balance -- `quantity = quantity - :q ... WHERE quantity >= :q` -- so the
+check and the write happen atomically in the database, and a rowcount of
+0 means the stock was not there. In the same transaction the product's
+total moves by the same amount and its low flag is re-read from its
+balances; Stock In first creates the balance if the location never held
+the product. SQLite "database is locked" errors are retried with a short
+backoff.
+
+A transfer is an XFER_OUT ledger row at the source and an XFER_IN row at
+the destination; both balances move, the product total doesn't.
+
+A batch is a list of `{sku, tx_type, quantity, reference, note,
+location}` lines, e.g. a delivery manifest or a day of POS sales; a line
+without a location is for the default one. It costs a handful of
+statements however many lines it has: SKUs are resolved with chunked `IN`
+lookups, stock is checked per product and location against a running
+balance in line order, accepted lines are inserted with one executemany
+and each touched balance and product total is moved once by its net
+change -- all in a single transaction. Lines that fail validation are
+reported by line number and skipped (or, with `atomic=True`, abort the
+whole batch).
+"""
+import csv
+import io
+import random
+import time
+from datetime import datetime
+
+from sqlalchemy import bindparam, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import OperationalError
+
+from . import db
+from .catalogue import get_catalogue
+from .models import Product, StockBalance, StockTransaction, any_low_balance, low_stock_expr
+from .snapshots import maybe_snapshot
+from .utils import chunks
+
+# What a transaction or batch line may record; transfers go through transfer_stock()
+TX_TYPES = ("IN", "OUT")
+BUSY_RETRIES = 8
+# Times a batch is re-validated when a concurrent writer moved its stock
+BATCH_CONFLICT_RETRIES = 3
+
+
+class BatchError(ValueError):
+    """The payload itself could not be read (as opposed to a bad line)."""
+
+
+class InsufficientStock(Exception):
+    pass
+
+
+class StockConflict(Exception):
+    """Stock changed underneath a batch between validation and write."""
+
+
+def _is_busy(exc) -> bool:
+    msg = str(getattr(exc, "orig", exc)).lower()
+    return "database is locked" in msg or "database is busy" in msg
+
+
+def run_with_busy_retry(work, retries=BUSY_RETRIES):
+    """Run `work()` (which must commit), retrying when SQLite reports busy."""
+    for attempt in range(retries + 1):
+        try:
+            return work()
+        except OperationalError as exc:
+            db.session.rollback()
+            if not _is_busy(exc) or attempt == retries:
+                raise
+            # Jittered exponential backoff: 5ms, 10ms, 20ms ... capped at ~0.5s
+            time.sleep(min(0.5, 0.005 * 2 ** attempt) * (0.5 + random.random()))
+
+
+def insert_for_dialect(table):
+    """INSERT with ON CONFLICT support for the engine's dialect."""
+    name = db.engine.dialect.name
+    if name == "sqlite":
+        return sqlite.insert(table)
+    if name == "postgresql":
+        return postgresql.insert(table)
+    raise BatchError(f"INSERT ... ON CONFLICT isn't wired up for {name}.")
+
+
+def executemany_rowcount(stmt, params) -> int:
+    """Run `stmt` for every parameter set; returns the rows matched in total.
+
+    Some drivers (psycopg2) don't report a total for an executemany; the
+    statement then runs once per parameter set instead.
+    """
+    if db.session.get_bind().dialect.supports_sane_multi_rowcount:
+        return db.session.execute(stmt, params).rowcount
+    return sum(db.session.execute(stmt, p).rowcount for p in params)
+
+
+def _open_balances(keys):
+    """Create empty balances for (product id, location id) pairs that have none."""
+    if keys:
+        db.session.execute(
+            insert_for_dialect(StockBalance.__table__).on_conflict_do_nothing(index_elements=["product_id", "location_id"]),
+            [{"product_id": pid, "location_id": lid, "quantity": 0, "is_low": False} for pid, lid in keys],
+        )
+
+
+def _balance_update():
+    table = StockBalance.__table__
+    new_quantity = table.c.quantity + bindparam("delta")
+    reorder_level = select(Product.reorder_level).where(Product.id == table.c.product_id).scalar_subquery()
+    return (
+        update(table)
+        .where(table.c.product_id == bindparam("pid"), table.c.location_id == bindparam("lid"), new_quantity >= 0)
+        .values(quantity=new_quantity, is_low=low_stock_expr(new_quantity, reorder_level))
+    )
+
+
+def _total_update():
+    table = Product.__table__
+    return (
+        update(table)
+        .where(table.c.id == bindparam("pid"))
+        .values(stock=table.c.stock + bindparam("delta"), is_low=any_low_balance(table.c.id))
+    )
+
+
+# Built once: every stock change runs these, and constructing them (and
+# their cache keys) costs more than executing them on SQLite.
+_BALANCE_UPDATE = _balance_update()
+_TOTAL_UPDATE = _total_update()
+_LEDGER_INSERT = insert(StockTransaction.__table__)
+
+
+def _move_balances(changes) -> bool:
+    """Apply [{"pid", "lid", "delta"}]; False if a balance would go negative (nothing is undone)."""
+    return executemany_rowcount(_BALANCE_UPDATE, changes) == len(changes)
+
+
+def _move_totals(changes) -> bool:
+    """Apply [{"pid", "delta"}] to the product totals and re-read their low flags."""
+    return executemany_rowcount(_TOTAL_UPDATE, changes) == len(changes)
+
+
+def record_transaction(prod_id, tx_type, qty, reference=None, note=None, location_id=None):
+    """Move stock at one location and write the ledger row in one transaction.
+
+    `location_id` defaults to the default location. Returns the new ledger
+    row's id. Raises InsufficientStock (after rolling back) when a Stock Out
+    asks for more than the location holds at the moment the UPDATE runs.
+    """
+    if tx_type not in TX_TYPES or qty < 1:
+        raise ValueError("tx_type must be IN or OUT and quantity at least 1.")
+    location_id = location_id or get_catalogue().default_location_id()
+    delta = qty if tx_type == "IN" else -qty
+
+    change = [{"pid": prod_id, "lid": location_id, "delta": delta}]
+
+    def work():
+        moved = _move_balances(change)
+        if not moved and tx_type == "IN":
+            # The location's first stock of this product
+            _open_balances([(prod_id, location_id)])
+            moved = _move_balances(change)
+        if not (moved and _move_totals([{"pid": prod_id, "delta": delta}])):
+            db.session.rollback()
+            raise InsufficientStock()
+        tx_id = db.session.execute(_LEDGER_INSERT, {
+            "product_id": prod_id, "location_id": location_id, "tx_type": tx_type, "quantity": qty,
+            "reference": reference, "note": note, "tx_date": datetime.utcnow(),
+        }).inserted_primary_key[0]
+        db.session.commit()
+        return tx_id
+
+    tx_id = run_with_busy_retry(work)
+    maybe_snapshot(tx_id)
+    return tx_id
+
+
+def transfer_stock(prod_id, from_location_id, to_location_id, qty, reference=None, note=None):
+    """Move stock between two locations in one transaction.
+
+    Writes an XFER_OUT and an XFER_IN ledger row; the product total stays
+    as it is. Returns the XFER_IN row's id. Raises InsufficientStock (after
+    rolling back) when the source holds less than `qty`.
+    """
+    if from_location_id == to_location_id or qty < 1:
+        raise ValueError("Transfer between two different locations, quantity at least 1.")
+
+    def work():
+        _open_balances([(prod_id, to_location_id)])
+        # Lower location id first, so two opposite transfers lock in the same order
+        moves = sorted([(from_location_id, -qty), (to_location_id, qty)])
+        for lid, delta in moves:
+            if not _move_balances([{"pid": prod_id, "lid": lid, "delta": delta}]):
+                db.session.rollback()
+                raise InsufficientStock()
+        if not _move_totals([{"pid": prod_id, "delta": 0}]):
+            db.session.rollback()
+            raise InsufficientStock()
+        now = datetime.utcnow()
+        row = {"product_id": prod_id, "quantity": qty, "reference": reference, "note": note, "tx_date": now}
+        db.session.execute(_LEDGER_INSERT, {**row, "tx_type": "XFER_OUT", "location_id": from_location_id})
+        tx_id = db.session.execute(_LEDGER_INSERT, {**row, "tx_type": "XFER_IN", "location_id": to_location_id}).inserted_primary_key[0]
+        db.session.commit()
+        return tx_id
+
+    tx_id = run_with_busy_retry(work)
+    maybe_snapshot(tx_id)
+    return tx_id
+
+
+class BatchResult:
+    def __init__(self):
+        self.accepted = 0
+        self.errors = []
+        self.applied = False
+
+    def reject(self, line_no, sku, message):
+        self.errors.append({"line": line_no, "sku": sku, "error": message})
+
+    def to_dict(self) -> dict:
+        return {
+            "accepted": self.accepted,
+            "rejected": len(self.errors),
+            "applied": self.applied,
+            "errors": self.errors,
+        }
+
+
+def read_json_lines(payload):
+    """Accept either a list of lines or {"lines": [...]}."""
+    if isinstance(payload, dict):
+        payload = payload.get("lines")
+    if not isinstance(payload, list):
+        raise BatchError('Expected a JSON list of lines or {"lines": [...]}.')
+    return payload
+
+
+def read_csv_lines(text_stream):
+    """Lines from CSV text with a header row (sku, tx_type, quantity, reference, note, location)."""
+    reader = csv.DictReader(text_stream)
+    if not reader.fieldnames or not {"sku", "tx_type", "quantity"} <= {f.strip().lower() for f in reader.fieldnames}:
+        raise BatchError("CSV needs a header row with at least: sku, tx_type, quantity.")
+    for row in reader:
+        yield {(k or "").strip().lower(): v for k, v in row.items()}
+
+
+def read_csv_bytes(data: bytes):
+    return read_csv_lines(io.StringIO(data.decode("utf-8-sig")))
+
+
+def _clean_line(raw):
+    """Return (sku, tx_type, qty, reference, note, location name) or raise ValueError with a message."""
+    if not isinstance(raw, dict):
+        raise ValueError("Line must be an object.")
+    sku = str(raw.get("sku") or "").strip()
+    if not sku:
+        raise ValueError("Missing sku.")
+    tx_type = str(raw.get("tx_type") or "").strip().upper()
+    if tx_type not in TX_TYPES:
+        raise ValueError("tx_type must be IN or OUT.")
+    try:
+        qty = int(str(raw.get("quantity")).strip())
+    except (TypeError, ValueError):
+        raise ValueError("quantity must be a whole number.")
+    if qty < 1:
+        raise ValueError("quantity must be at least 1.")
+    reference = (str(raw.get("reference") or "").strip() or None)
+    note = (str(raw.get("note") or "").strip() or None)
+    if reference and len(reference) > 120:
+        raise ValueError("reference is longer than 120 characters.")
+    if note and len(note) > 255:
+        raise ValueError("note is longer than 255 characters.")
+    location = str(raw.get("location") or "").strip() or None
+    return sku, tx_type, qty, reference, note, location
+
+
+def read_transfer(raw):
+    """Parse `{sku, from, to, quantity, reference, note}`, locations by name.
+
+    Returns (product id, from location id, to location id, qty, reference,
+    note); raises ValueError with a message.
+    """
+    if not isinstance(raw, dict):
+        raise ValueError("Expected a JSON object.")
+    sku, _, qty, reference, note, _ = _clean_line({**raw, "tx_type": "OUT"})
+    prod_id = _resolve_skus([sku]).get(sku)
+    if prod_id is None:
+        raise ValueError("Unknown SKU.")
+    location_ids = {name.lower(): lid for lid, name in get_catalogue().locations()}
+    ends = []
+    for key in ("from", "to"):
+        name = str(raw.get(key) or "").strip()
+        if name.lower() not in location_ids:
+            raise ValueError(f"Unknown {key} location {name!r}.")
+        ends.append(location_ids[name.lower()])
+    if ends[0] == ends[1]:
+        raise ValueError("from and to must be different locations.")
+    return prod_id, ends[0], ends[1], qty, reference, note
+
+
+def _resolve_skus(skus):
+    """Map sku -> product id with one query per chunk of SKUs."""
+    found = {}
+    for chunk in chunks(list(skus)):
+        found.update(db.session.execute(select(Product.sku, Product.id).where(Product.sku.in_(chunk))).all())
+    return found
+
+
+def _read_balances(product_ids):
+    """Map (product id, location id) -> quantity for every balance of these products."""
+    found = {}
+    table = StockBalance.__table__
+    for chunk in chunks(list(product_ids)):
+        rows = db.session.execute(
+            select(table.c.product_id, table.c.location_id, table.c.quantity)
+            .where(table.c.product_id.in_(chunk))
+        )
+        for pid, lid, quantity in rows:
+            found[(pid, lid)] = quantity
+    return found
+
+
+def _validate_batch(cleaned, result):
+    """Check stock line by line; returns (rows to insert, net change per (product id, location id), balances to open)."""
+    products = _resolve_skus({line[1] for line in cleaned})
+    balances = _read_balances(set(products.values()))
+    catalogue = get_catalogue()
+    location_ids = {name.lower(): lid for lid, name in catalogue.locations()}
+    default_location = catalogue.default_location_id()
+    now = datetime.utcnow()
+    rows, deltas, missing = [], {}, set()
+    for line_no, sku, tx_type, qty, reference, note, location in cleaned:
+        prod_id = products.get(sku)
+        if prod_id is None:
+            result.reject(line_no, sku, "Unknown SKU.")
+            continue
+        location_id = location_ids.get(location.lower()) if location else default_location
+        if location_id is None:
+            result.reject(line_no, sku, f"Unknown location {location!r}.")
+            continue
+        key = (prod_id, location_id)
+        if key not in balances:
+            missing.add(key)
+        balance = balances.get(key, 0)
+        change = qty if tx_type == "IN" else -qty
+        if balance + change < 0:
+            result.reject(line_no, sku, f"Not enough stock for Stock Out (available {balance}).")
+            continue
+        balances[key] = balance + change
+        deltas[key] = deltas.get(key, 0) + change
+        rows.append({
+            "product_id": prod_id, "location_id": location_id, "tx_type": tx_type, "quantity": qty,
+            "reference": reference, "note": note, "tx_date": now,
+        })
+    return rows, deltas, missing & set(deltas)
+
+
+def _write_batch(rows, deltas, missing):
+    _open_balances(sorted(missing))
+    totals = {}
+    for (pid, _), delta in deltas.items():
+        totals[pid] = totals.get(pid, 0) + delta
+    # Conditional like record_transaction: a balance is skipped if another
+    # writer took the stock after validation, which shows in the rowcount.
+    changes = [{"pid": pid, "lid": lid, "delta": delta} for (pid, lid), delta in sorted(deltas.items()) if delta]
+    if changes and not _move_balances(changes):
+        raise StockConflict()
+    # Every touched product, even at a net change of 0: its low flag may have moved
+    if not _move_totals([{"pid": pid, "delta": delta} for pid, delta in sorted(totals.items())]):
+        raise StockConflict()
+    db.session.execute(_LEDGER_INSERT, rows)
+    db.session.commit()
+
+
+def apply_batch(lines, atomic=False) -> BatchResult:
+    """Validate and record a batch of stock transactions in one transaction."""
+    cleaned, bad = [], []
+    for line_no, raw in enumerate(lines, start=1):
+        try:
+            cleaned.append((line_no, *_clean_line(raw)))
+        except ValueError as exc:
+            bad.append((line_no, raw.get("sku") if isinstance(raw, dict) else None, str(exc)))
+
+    for attempt in range(BATCH_CONFLICT_RETRIES + 1):
+        result = BatchResult()
+        for err in bad:
+            result.reject(*err)
+        rows, deltas, missing = _validate_batch(cleaned, result)
+        result.errors.sort(key=lambda e: e["line"])
+        result.accepted = len(rows)
+        if not rows or (atomic and result.errors):
+            db.session.rollback()
+            return result
+        try:
+            run_with_busy_retry(lambda: _write_batch(rows, deltas, missing))
+        except StockConflict:
+            db.session.rollback()
+            if attempt == BATCH_CONFLICT_RETRIES:
+                raise
+            continue
+        result.applied = True
+        maybe_snapshot()
+        return result
@@ -0,0 +1,81 @@
+"""Stock locations (stores, warehouses) and per-location balances.
+
+Each product has a `StockBalance` row per location that has held it. The
+balance is the source of truth; `Product.stock` (their sum) and
+`Product.is_low` (low at some location) are aggregates maintained in the
+same transaction as the balance (ledger.py), so the product list and the
+dashboard keep reading one indexed column each and never SUM balances.
+
+A balance is low when its quantity is at or below the product's reorder
+level; `StockBalance.is_low` stores that next to the quantity, with its
+own partial index for the dashboard's low-stock list. Changing a
+product's reorder level updates the flags of all its balances
+(models._sync_low_stock_flag, and the catalogue import here).
+
+The location with the lowest id -- "Main", created by migration 5 -- is
+the default: stock recorded without a location, new products' opening
+stock and imported stock go there. Location names come from the
+catalogue snapshot, so showing or validating them costs no query.
+"""
+from sqlalchemy import func, insert, literal, select, update
+
+from . import db
+from .catalogue import get_catalogue
+from .models import Location, Product, StockBalance, StockTransaction, any_low_balance, low_stock_expr
+from .utils import chunks
+
+DEFAULT_LOCATION_NAME = "Main"
+
+
+def default_location_id() -> int:
+    return get_catalogue().default_location_id()
+
+
+def location_choices():
+    """[(id, name)] of every location, the default first."""
+    return get_catalogue().locations()
+
+
+def location_name(location_id):
+    return get_catalogue().location_name(location_id)
+
+
+def location_in_use(location_id) -> bool:
+    """True if any balance or ledger row (hot) refers to the location."""
+    balances = select(StockBalance.product_id).where(StockBalance.location_id == location_id).exists()
+    ledger = select(StockTransaction.id).where(StockTransaction.location_id == location_id).exists()
+    return db.session.execute(select(balances | ledger)).scalar()
+
+
+def open_default_balances(conn, location_id, skus=None):
+    """Give products without any balance one at `location_id` holding their whole stock.
+
+    `conn` is a connection or the session; `skus` limits it to those
+    products (e.g. the new ones of an import batch).
+    """
+    p, b = Product.__table__, StockBalance.__table__
+    criteria = [~select(b.c.product_id).where(b.c.product_id == p.c.id).exists()]
+    for chunk in [None] if skus is None else chunks(list(skus)):
+        where = criteria if chunk is None else criteria + [p.c.sku.in_(chunk)]
+        conn.execute(insert(b).from_select(
+            ["product_id", "location_id", "quantity", "is_low"],
+            select(p.c.id, literal(location_id), p.c.stock, low_stock_expr(p.c.stock, p.c.reorder_level)).where(*where),
+        ))
+
+
+def refresh_low_flags(conn, product_ids):
+    """Recompute the low flags of these products' balances and of the products.
+
+    For writes that change reorder levels outside the ORM (the catalogue
+    import); run it after they are applied.
+    """
+    p, b = Product.__table__, StockBalance.__table__
+    reorder_level = select(p.c.reorder_level).where(p.c.id == b.c.product_id).scalar_subquery()
+    for chunk in chunks(list(product_ids)):
+        conn.execute(update(b).where(b.c.product_id.in_(chunk)).values(is_low=low_stock_expr(b.c.quantity, reorder_level)))
+        conn.execute(update(p).where(p.c.id.in_(chunk)).values(is_low=any_low_balance(p.c.id)))
+
+
+def first_location_id(conn):
+    """Lowest location id straight from the database, for code outside a request."""
+    return conn.execute(select(func.min(Location.id))).scalar()
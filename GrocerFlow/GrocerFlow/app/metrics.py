@@ -0,0 +1,182 @@
+"""Request instrumentation in Prometheus text format.
+
+For every request: latency per endpoint (histogram, measured until the
+last byte of a streamed response), SQL statements and SQL time per
+request (from querystats.py's engine events) and render time per
+template. Cache hit/miss counters from cache.py are exported too.
+
+Served at /metrics to admins or to a scraper sending
+"Authorization: Bearer $METRICS_TOKEN". Figures are per process: with
+several workers, scrape each one or accept that a scrape samples one.
+"""
+import hmac
+import threading
+import time
+
+from flask import abort, current_app, g, request
+from flask.signals import before_render_template, template_rendered
+from flask_login import current_user
+
+from .cache import cache_stats
+from .querystats import request_query_stats
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=""):
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name, help, labels):
+        self.name, self.help, self.label_names = name, help, labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            yield f"{self.name}{_labels(self.label_names, labels)} {value}"
+
+
+class Histogram:
+    def __init__(self, name, help, labels, buckets):
+        self.name, self.help, self.label_names = name, help, labels
+        self.buckets = buckets
+        # labels -> [count per bucket..., count above the last bucket, sum]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[i] += 1
+                    break
+            else:
+                entry[len(self.buckets)] += 1
+            entry[-1] += value
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            items = sorted((labels, list(entry)) for labels, entry in self._values.items())
+        for labels, entry in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, entry):
+                cumulative += count
+                le = 'le="%s"' % bound
+                yield f"{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}"
+            total = cumulative + entry[len(self.buckets)]
+            le = 'le="+Inf"'
+            yield f"{self.name}_bucket{_labels(self.label_names, labels, le)} {total}"
+            yield f"{self.name}_sum{_labels(self.label_names, labels)} {entry[-1]:.6f}"
+            yield f"{self.name}_count{_labels(self.label_names, labels)} {total}"
+
+
+class Metrics:
+    def __init__(self):
+        self.requests = Counter("grocerflow_requests_total", "Requests handled.", ("endpoint", "method", "status"))
+        self.latency = Histogram("grocerflow_request_duration_seconds", "Request latency, to the last byte sent.", ("endpoint", "method"), LATENCY_BUCKETS)
+        self.sql_queries = Histogram("grocerflow_request_sql_queries", "SQL statements per request.", ("endpoint",), QUERY_BUCKETS)
+        self.sql_seconds = Counter("grocerflow_request_sql_seconds_total", "Time spent in SQL.", ("endpoint",))
+        self.render = Histogram("grocerflow_template_render_seconds", "Template render time.", ("template",), LATENCY_BUCKETS)
+
+    def render_text(self) -> str:
+        lines = []
+        for metric in (self.requests, self.latency, self.sql_queries, self.sql_seconds, self.render):
+            lines.extend(metric.render())
+        lines.extend(_cache_lines())
+        return "\n".join(lines) + "\n"
+
+
+def _cache_lines():
+    stats = cache_stats()
+    # The catalogue snapshot has no evictions, and reloads instead
+    for key, kind in (("hits", "counter"), ("misses", "counter"), ("evictions", "counter"), ("reloads", "counter"), ("size", "gauge")):
+        name = f"grocerflow_cache_{key}" + ("_total" if kind == "counter" else "")
+        yield f"# TYPE {name} {kind}"
+        for cache, values in sorted(stats.items()):
+            if key in values:
+                yield f'{name}{{cache="{_escape(cache)}"}} {values[key]}'
+
+
+def get_metrics() -> Metrics:
+    return current_app.extensions["metrics"]
+
+
+def _endpoint():
+    return request.endpoint or "unmatched"
+
+
+def _before_request():
+    g.request_started = time.perf_counter()
+
+
+def _after_request(response):
+    g.response_status = response.status_code
+    return response
+
+
+def _teardown_request(exc):
+    started = g.pop("request_started", None)
+    if started is None:
+        return
+    metrics = get_metrics()
+    endpoint = _endpoint()
+    status = 500 if exc is not None else g.get("response_status", 500)
+    metrics.requests.inc((endpoint, request.method, str(status)))
+    metrics.latency.observe((endpoint, request.method), time.perf_counter() - started)
+    count, seconds = request_query_stats()
+    metrics.sql_queries.observe((endpoint,), count)
+    metrics.sql_seconds.inc((endpoint,), seconds)
+
+
+def _before_render(sender, template, context, **extra):
+    g.setdefault("render_started", []).append(time.perf_counter())
+
+
+def _rendered(sender, template, context, **extra):
+    stack = g.get("render_started")
+    if stack:
+        get_metrics().render.observe((template.name or "string",), time.perf_counter() - stack.pop())
+
+
+def metrics_view():
+    token = current_app.config.get("METRICS_TOKEN")
+    bearer = request.headers.get("Authorization", "")
+    if not (token and hmac.compare_digest(bearer, f"Bearer {token}")):
+        if not current_user.is_authenticated or not current_user.is_admin:
+            abort(403)
+    return current_app.response_class(get_metrics().render_text(), content_type=CONTENT_TYPE)
+
+
+def init_app(app):
+    app.config.setdefault("METRICS_TOKEN", "")
+    app.extensions["metrics"] = Metrics()
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_rendered, app)
+    app.add_url_rule("/metrics", "metrics", metrics_view)
@@ -1,11 +1,17 @@
+import hashlib
 from datetime import datetime
+from flask import current_app
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
 from . import db
 
+def password_version(password_hash: str) -> str:
+    return hashlib.sha256(password_hash.encode()).hexdigest()[:16]
+
 class TimestampMixin:
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    # Indexed for the version stamps in httpcache.py
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False, index=True)
 
 class User(UserMixin, TimestampMixin, db.Model):
     __tablename__ = "users"
@@ -15,11 +21,24 @@ class User(UserMixin, TimestampMixin, db.Model):
     is_admin = db.Column(db.Boolean, default=False, nullable=False)
 
     def set_password(self, password: str):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = generate_password_hash(password, method=current_app.config["PASSWORD_HASH_METHOD"])
 
     def check_password(self, password: str) -> bool:
         return check_password_hash(self.password_hash, password)
 
+    def needs_rehash(self) -> bool:
+        """True when the stored hash wasn't made with PASSWORD_HASH_METHOD."""
+        return self.password_hash.split("$", 1)[0] != current_app.config["PASSWORD_HASH_METHOD"]
+
+    @property
+    def password_version(self) -> str:
+        return password_version(self.password_hash)
+
+    def get_id(self):
+        # The session remembers which password it was opened with, so
+        # changing the password signs out every other session.
+        return f"{self.id}:{self.password_version}"
+
 class Category(TimestampMixin, db.Model):
     __tablename__ = "categories"
     id = db.Column(db.Integer, primary_key=True)
@@ -52,18 +71,157 @@ class Product(TimestampMixin, db.Model):
     price = db.Column(db.Float, default=0.0, nullable=False)
     reorder_level = db.Column(db.Integer, default=0, nullable=False)
     stock = db.Column(db.Integer, default=0, nullable=False)
+    # Stored copy of the low-stock predicate (see low_stock_expr) so low-stock
+    # lookups read the small partial index below instead of scanning products.
+    is_low = db.Column(db.Boolean, default=False, server_default=db.false(), nullable=False)
+
+    __table_args__ = (
+        db.Index(
+            "ix_products_low_stock", "stock",
+            sqlite_where=db.text("is_low = 1"),
+            postgresql_where=db.text("is_low"),
+        ),
+    )
 
     def is_low_stock(self) -> bool:
-        return self.reorder_level > 0 and self.stock <= self.reorder_level
+        # Low at some location; a low shop isn't covered by a full warehouse
+        return self.is_low
+
+def compute_is_low(stock, reorder_level) -> bool:
+    return reorder_level > 0 and stock <= reorder_level
+
+def low_stock_expr(stock, reorder_level):
+    """SQL form of compute_is_low, for UPDATEs that change stock in the database."""
+    return db.and_(reorder_level > 0, stock <= reorder_level)
+
+def any_low_balance(product_id):
+    """SQL: the product is low at some location -- what Product.is_low stores."""
+    balances = StockBalance.__table__
+    return db.exists().where(balances.c.product_id == product_id, balances.c.is_low)
+
+@db.event.listens_for(Product, "before_insert")
+def _init_low_stock_flag(mapper, connection, target):
+    # A new product's opening stock is its only balance (see locations.py)
+    target.is_low = compute_is_low(target.stock or 0, target.reorder_level or 0)
+
+@db.event.listens_for(Product, "before_update")
+def _sync_low_stock_flag(mapper, connection, target):
+    if not db.inspect(target).attrs.reorder_level.history.has_changes():
+        return
+    balances = StockBalance.__table__
+    connection.execute(
+        db.update(balances)
+        .where(balances.c.product_id == target.id)
+        .values(is_low=low_stock_expr(balances.c.quantity, target.reorder_level or 0))
+    )
+    target.is_low = connection.execute(db.select(any_low_balance(target.id))).scalar()
+
+class Location(TimestampMixin, db.Model):
+    """A store or warehouse that holds stock (see locations.py)."""
+    __tablename__ = "locations"
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120), unique=True, nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<Location {self.name}>"
+
+class StockBalance(db.Model):
+    """Stock of one product at one location; Product.stock is their sum."""
+    __tablename__ = "stock_balances"
+    product_id = db.Column(db.Integer, db.ForeignKey("products.id"), primary_key=True)
+    location_id = db.Column(db.Integer, db.ForeignKey("locations.id"), primary_key=True)
+    quantity = db.Column(db.Integer, default=0, nullable=False)
+    # low_stock_expr(quantity, product's reorder_level), kept with quantity
+    is_low = db.Column(db.Boolean, default=False, server_default=db.false(), nullable=False)
+
+    __table_args__ = (
+        db.Index(
+            "ix_stock_balances_low", "quantity",
+            sqlite_where=db.text("is_low = 1"),
+            postgresql_where=db.text("is_low"),
+        ),
+    )
+
+# Ledger row types. A transfer is an XFER_OUT row at the source and an
+# XFER_IN row at the destination: stock moves, the product total doesn't.
+TX_TYPES = ("IN", "OUT", "XFER_IN", "XFER_OUT")
+INBOUND_TX_TYPES = ("IN", "XFER_IN")
+
+def signed_quantity(tx):
+    """SQL: a ledger row's effect on stock (+ inbound, - outbound)."""
+    return db.case((tx.tx_type.in_(INBOUND_TX_TYPES), tx.quantity), else_=-tx.quantity)
 
 class StockTransaction(TimestampMixin, db.Model):
     __tablename__ = "stock_transactions"
     id = db.Column(db.Integer, primary_key=True)
     product_id = db.Column(db.Integer, db.ForeignKey("products.id"), nullable=False, index=True)
-    tx_type = db.Column(db.String(10), nullable=False)  # IN or OUT
+    tx_type = db.Column(db.String(10), nullable=False)  # one of TX_TYPES
     quantity = db.Column(db.Integer, nullable=False)
     reference = db.Column(db.String(120), nullable=True)
     note = db.Column(db.String(255), nullable=True)
     tx_date = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    location_id = db.Column(db.Integer, db.ForeignKey("locations.id"), nullable=False)
 
     product = db.relationship("Product", backref=db.backref("transactions", lazy=True, order_by="desc(StockTransaction.tx_date)"))
+
+    # Covers the demand history read in analytics.py: a date-range scan of
+    # one transaction type that never has to visit the table itself.
+    __table_args__ = (
+        db.Index("ix_stock_transactions_type_date", "tx_type", "tx_date", "product_id", "quantity"),
+        db.Index("ix_stock_transactions_location_date", "location_id", "tx_date"),
+    )
+
+class OpeningBalance(db.Model):
+    """Net quantity of a product's archived ledger rows (see archive.py)."""
+    __tablename__ = "stock_opening_balances"
+    product_id = db.Column(db.Integer, db.ForeignKey("products.id"), primary_key=True)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+    # Date of this product's last archived ledger row
+    as_of = db.Column(db.DateTime, nullable=False)
+
+class LedgerArchive(db.Model):
+    """One archive partition of stock_transactions (see archive.py)."""
+    __tablename__ = "ledger_archives"
+    id = db.Column(db.Integer, primary_key=True)
+    table_name = db.Column(db.String(80), unique=True, nullable=False)
+    first_date = db.Column(db.DateTime, nullable=False)
+    last_date = db.Column(db.DateTime, nullable=False)
+    row_count = db.Column(db.Integer, nullable=False, default=0)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+class StockSnapshotRun(db.Model):
+    """One checkpoint of every product's stock (see snapshots.py)."""
+    __tablename__ = "stock_snapshot_runs"
+    id = db.Column(db.Integer, primary_key=True)
+    taken_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    # Highest stock_transactions.id already reflected in the snapshot
+    last_tx_id = db.Column(db.Integer, default=0, nullable=False)
+    product_count = db.Column(db.Integer, default=0, nullable=False)
+
+class StockSnapshot(db.Model):
+    __tablename__ = "stock_snapshots"
+    run_id = db.Column(db.Integer, db.ForeignKey("stock_snapshot_runs.id", ondelete="CASCADE"), primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey("products.id"), primary_key=True)
+    stock = db.Column(db.Integer, nullable=False)
+
+class SchemaMigration(db.Model):
+    """One applied schema migration (see schema.py)."""
+    __tablename__ = "schema_migrations"
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    name = db.Column(db.String(120), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+class Job(db.Model):
+    """A background export/report (see jobs.py)."""
+    __tablename__ = "jobs"
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(40), nullable=False)
+    params = db.Column(db.Text, nullable=False, default="{}")  # JSON
+    status = db.Column(db.String(10), nullable=False, default="queued", index=True)  # queued, running, done, failed
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    filename = db.Column(db.String(120), nullable=True)
+    size = db.Column(db.Integer, nullable=True)  # bytes
+    error = db.Column(db.Text, nullable=True)
@@ -0,0 +1,126 @@
+"""Keyset (cursor) pagination for the list pages.
+
+Pages are fetched with `WHERE (key) > (last key seen) ... LIMIT n` instead of
+OFFSET, so page 1000 costs the same as page 1. Cursors are opaque
+url-safe tokens carrying the boundary key and the direction to read in.
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from flask import current_app, request, url_for
+from sqlalchemy import and_, or_
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class KeysetPage:
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self) -> bool:
+        return self.prev_cursor is not None
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        return datetime.fromisoformat(value["dt"])
+    return value
+
+
+def encode_cursor(direction, values) -> str:
+    raw = json.dumps({"d": direction, "v": [_encode_value(v) for v in values]}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token, key_count):
+    """Return (direction, values), or None for a missing or malformed token."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        data = json.loads(raw)
+        direction, values = data["d"], [_decode_value(v) for v in data["v"]]
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        return None
+    if direction not in ("next", "prev") or len(values) != key_count:
+        return None
+    return direction, values
+
+
+def page_size_arg(args) -> int:
+    default = current_app.config.get("PAGE_SIZE", DEFAULT_PAGE_SIZE)
+    try:
+        size = int(args.get("per_page", default))
+    except (TypeError, ValueError):
+        size = default
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def cursor_url(cursor) -> str:
+    """URL of the current list page with its filters kept and the cursor swapped."""
+    args = request.args.to_dict()
+    args["cursor"] = cursor
+    return url_for(request.endpoint, **(request.view_args or {}), **args)
+
+
+def _after(keys, values, reverse):
+    """Criteria selecting rows strictly past `values` in the (possibly reversed) key order."""
+    clauses = []
+    for i, (col, desc) in enumerate(keys):
+        forward = desc == reverse
+        step = col > values[i] if forward else col < values[i]
+        clauses.append(and_(*[keys[j][0] == values[j] for j in range(i)], step))
+    return or_(*clauses)
+
+
+def keyset_paginate(query, keys, cursor=None, page_size=DEFAULT_PAGE_SIZE, key_of=None):
+    """Fetch one page of `query` ordered by `keys`.
+
+    `keys` is a list of (column, descending) pairs ending in a unique column.
+    `key_of` maps a result row to its key values; by default the key columns
+    are read off the row as attributes of the same name.
+    """
+    if key_of is None:
+        names = [col.key for col, _ in keys]
+        key_of = lambda row: [getattr(row, name) for name in names]
+
+    decoded = decode_cursor(cursor, len(keys))
+    reverse = decoded is not None and decoded[0] == "prev"
+
+    query = query.order_by(None).order_by(*[
+        (col.desc() if desc != reverse else col.asc()) for col, desc in keys
+    ])
+    if decoded is not None:
+        query = query.filter(_after(keys, decoded[1], reverse))
+
+    rows = query.limit(page_size + 1).all()
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if reverse:
+        rows.reverse()
+    if not rows:
+        return KeysetPage(rows)
+
+    has_next = (not reverse and has_more) or (reverse and decoded is not None)
+    has_prev = (reverse and has_more) or (not reverse and decoded is not None)
+    return KeysetPage(
+        rows,
+        next_cursor=encode_cursor("next", key_of(rows[-1])) if has_next else None,
+        prev_cursor=encode_cursor("prev", key_of(rows[0])) if has_prev else None,
+    )
@@ -0,0 +1,128 @@
+"""Opt-in profiling of slow requests.
+
+When enabled, a sample of requests (PROFILE_SAMPLE_RATE, 0..1) runs under
+cProfile; any that take at least PROFILE_SLOW_MS are dumped to
+instance/profiles/ as <time>-<endpoint>.prof (load with pstats or
+snakeviz) plus a .txt summary of the top functions by cumulative time.
+
+The settings come from the environment at boot and can be changed on a
+running deployment with `flask profiling --slow-ms 500 --sample 0.1` (or
+`--off`), which writes instance/profiling.json; every worker re-reads it
+at most once per RELOAD_SECONDS.
+
+One request per process is profiled at a time: from Python 3.12 cProfile
+runs on sys.monitoring, which takes a single profiler per process, so a
+sampled request that finds the profiler busy simply isn't profiled.
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import random
+import threading
+import time
+from datetime import datetime
+
+from flask import current_app, g, request
+
+PROFILE_DIR = "profiles"
+SETTINGS_FILE = "profiling.json"
+RELOAD_SECONDS = 1.0
+SUMMARY_LINES = 40
+
+_reload_lock = threading.Lock()
+# Held from enable() to disable() by the request being profiled
+_profiler_lock = threading.Lock()
+
+
+def settings_path(app):
+    return os.path.join(app.instance_path, SETTINGS_FILE)
+
+
+def write_settings(app, slow_ms, sample_rate):
+    with open(settings_path(app), "w") as fh:
+        json.dump({"slow_ms": slow_ms, "sample_rate": sample_rate}, fh)
+
+
+def _reload(app):
+    now = time.monotonic()
+    state = app.extensions["profiling"]
+    with _reload_lock:
+        if now - state["checked"] < RELOAD_SECONDS:
+            return
+        state["checked"] = now
+        path = settings_path(app)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return
+        if mtime == state["mtime"]:
+            return
+        state["mtime"] = mtime
+        try:
+            with open(path) as fh:
+                data = json.load(fh)
+            app.config["PROFILE_SLOW_MS"] = float(data.get("slow_ms", 0))
+            app.config["PROFILE_SAMPLE_RATE"] = float(data.get("sample_rate", 1.0))
+        except (OSError, ValueError, TypeError):
+            app.logger.warning("Ignoring unreadable %s", path)
+
+
+def _before_request():
+    app = current_app._get_current_object()
+    _reload(app)
+    if app.config["PROFILE_SLOW_MS"] <= 0 or request.endpoint == "static":
+        return
+    if random.random() >= app.config["PROFILE_SAMPLE_RATE"]:
+        return
+    if not _profiler_lock.acquire(blocking=False):
+        return
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another tool's profiler is active in this process
+        _profiler_lock.release()
+        return
+    g.profiler = profiler
+    g.profile_started = time.perf_counter()
+
+
+def _teardown_request(exc):
+    profiler = g.pop("profiler", None)
+    if profiler is None:
+        return
+    try:
+        profiler.disable()
+    finally:
+        _profiler_lock.release()
+    elapsed_ms = (time.perf_counter() - g.pop("profile_started")) * 1000
+    if elapsed_ms < current_app.config["PROFILE_SLOW_MS"]:
+        return
+    try:
+        _dump(profiler, elapsed_ms)
+    except OSError:
+        current_app.logger.exception("Could not write request profile")
+
+
+def _dump(profiler, elapsed_ms):
+    folder = os.path.join(current_app.instance_path, PROFILE_DIR)
+    os.makedirs(folder, exist_ok=True)
+    stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")
+    base = os.path.join(folder, f"{stamp}-{request.endpoint or 'unmatched'}")
+    profiler.dump_stats(base + ".prof")
+    out = io.StringIO()
+    out.write(f"{request.method} {request.full_path} took {elapsed_ms:.1f} ms\n\n")
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(SUMMARY_LINES)
+    with open(base + ".txt", "w") as fh:
+        fh.write(out.getvalue())
+    current_app.logger.warning("Slow request %s %s (%.0f ms) profiled to %s.prof", request.method, request.path, elapsed_ms, base)
+
+
+def init_app(app):
+    app.config.setdefault("PROFILE_SLOW_MS", 0)
+    app.config.setdefault("PROFILE_SAMPLE_RATE", 1.0)
+    app.extensions["profiling"] = {"checked": 0.0, "mtime": None}
+    app.before_request(_before_request)
+    app.teardown_request(_teardown_request)
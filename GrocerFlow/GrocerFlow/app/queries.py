@@ -0,0 +1,226 @@
+"""Query builders shared by the views and exports.
+
+Each builder attaches the loader options its page needs, so templates can
+walk `product.category`, `product.supplier` and `tx.product` without firing
+a lazy SELECT per row.
+"""
+from datetime import timedelta
+
+from sqlalchemy import or_
+from sqlalchemy.orm import contains_eager, joinedload
+
+from . import archive, db, search
+from .models import Product, Category, Supplier, StockTransaction, OpeningBalance, Location, StockBalance, TX_TYPES
+from .utils import parse_date
+
+# Low at some location. Served by the partial index ix_products_low_stock
+# (see models.Product.is_low)
+LOW_STOCK_CRITERIA = (Product.is_low,)
+
+# Keyset orderings for the paginated list pages: (column, descending)
+CATEGORY_KEYS = [(Category.name, False), (Category.id, False)]
+SUPPLIER_KEYS = [(Supplier.name, False), (Supplier.id, False)]
+PRODUCT_KEYS = [(Product.name, False), (Product.id, False)]
+
+
+def transaction_keys(tx=StockTransaction):
+    return [(tx.tx_date, True), (tx.id, True)]
+
+
+TRANSACTION_KEYS = transaction_keys()
+
+
+def transaction_source(start=None, end=None, **_):
+    """The ledger entity for a filtered date range: archives are only read when it reaches them."""
+    return archive.ledger(start, end + timedelta(days=1) if end else None)
+
+
+def transaction_filters(tx=StockTransaction, q="", tx_type="", start=None, end=None, location_id=None):
+    """Filter criteria shared by the /transactions page and its CSV export.
+
+    `tx` is the entity from transaction_source(). `start` and `end` are
+    dates; `end` is inclusive. The criteria reference `Product`, so the
+    query they are applied to must join it.
+    """
+    criteria = []
+    if q:
+        # The full-text index only covers the hot table
+        reference = search.match("transactions", q) if tx is StockTransaction else tx.reference.ilike(f"%{q}%")
+        criteria.append(or_(search.match("products", q, tx.product_id), reference))
+    if tx_type in TX_TYPES:
+        criteria.append(tx.tx_type == tx_type)
+    if location_id:
+        criteria.append(tx.location_id == location_id)
+    if start:
+        criteria.append(tx.tx_date >= start)
+    if end:
+        criteria.append(tx.tx_date < end + timedelta(days=1))
+    return criteria
+
+
+def transaction_filter_args(args):
+    """Read the transaction filters from a request's query string."""
+    return {
+        "q": args.get("q", "").strip(),
+        "tx_type": args.get("type", "").strip(),
+        "start": parse_date(args.get("start")),
+        "end": parse_date(args.get("end")),
+        "location_id": _int_arg(args.get("location")),
+    }
+
+
+def _int_arg(raw):
+    try:
+        return int(raw) if raw else None
+    except (TypeError, ValueError):
+        return None
+
+
+# ---- Categories / Suppliers ----
+def category_list_query(q=""):
+    query = Category.query
+    if q:
+        query = query.filter(search.match("categories", q))
+    return query.order_by(Category.name.asc())
+
+
+def supplier_list_query(q=""):
+    query = Supplier.query
+    if q:
+        query = query.filter(search.match("suppliers", q))
+    return query.order_by(Supplier.name.asc())
+
+
+def option_list_query(model, index, q=""):
+    """(id, name) rows for a lazily loaded select (see api.options)."""
+    query = db.session.query(model.id, model.name)
+    if q:
+        query = query.filter(search.match(index, q))
+    return query.order_by(model.name.asc())
+
+
+def location_list_query():
+    """(id, name, products) of every location; products = how many it holds stock of."""
+    held = db.func.count(StockBalance.product_id).filter(StockBalance.quantity > 0)
+    return (
+        db.session.query(Location.id, Location.name, held.label("products"))
+        .outerjoin(StockBalance, StockBalance.location_id == Location.id)
+        .group_by(Location.id, Location.name)
+        .order_by(Location.name.asc())
+    )
+
+
+def category_has_products(cat_id) -> bool:
+    return db.session.query(Product.query.filter(Product.category_id == cat_id).exists()).scalar()
+
+
+def supplier_has_products(supp_id) -> bool:
+    return db.session.query(Product.query.filter(Product.supplier_id == supp_id).exists()).scalar()
+
+
+# ---- Products ----
+def product_list_query(q="", only_low=False):
+    query = Product.query.options(joinedload(Product.category), joinedload(Product.supplier))
+    if q:
+        query = query.filter(search.match("products", q))
+    if only_low:
+        query = query.filter(*LOW_STOCK_CRITERIA)
+    return query.order_by(Product.name.asc())
+
+
+def low_stock_query():
+    """Low balances, one row per product and location, as plain rows (cacheable; see dashboard.py).
+
+    Read through the partial index ix_stock_balances_low.
+    """
+    return (
+        db.session.query(
+            Product.id, Product.name, Product.sku, StockBalance.quantity.label("stock"), Product.reorder_level,
+            Category.name.label("category_name"), Location.name.label("location_name"),
+        )
+        .select_from(StockBalance)
+        .join(Product, StockBalance.product_id == Product.id)
+        .join(Location, StockBalance.location_id == Location.id)
+        .outerjoin(Category, Product.category_id == Category.id)
+        .filter(StockBalance.is_low)
+        .order_by(StockBalance.quantity.asc())
+    )
+
+
+def product_stock(prod_id):
+    """(stock, is_low) of one product, or None; the rest comes from catalogue.py."""
+    return db.session.query(Product.stock, Product.is_low).filter(Product.id == prod_id).one_or_none()
+
+
+def product_balances(prod_id):
+    """(location_id, quantity, is_low) of each location that has held the product; names from catalogue.py."""
+    return (
+        db.session.query(StockBalance.location_id, StockBalance.quantity, StockBalance.is_low)
+        .filter(StockBalance.product_id == prod_id)
+        .order_by(StockBalance.location_id.asc())
+        .all()
+    )
+
+
+def product_has_transactions(prod_id) -> bool:
+    """True if the product has ledger rows, hot or archived."""
+    if db.session.get(OpeningBalance, prod_id) is not None:
+        return True
+    return db.session.query(StockTransaction.query.filter(StockTransaction.product_id == prod_id).exists()).scalar()
+
+
+def product_transactions_query(prod_id):
+    return StockTransaction.query.filter_by(product_id=prod_id).order_by(StockTransaction.tx_date.desc())
+
+
+# ---- Transactions ----
+def transaction_list_query(tx=StockTransaction, **filters):
+    return (
+        db.session.query(tx).join(tx.product)
+        .options(contains_eager(tx.product))
+        .filter(*transaction_filters(tx, **filters))
+        .order_by(tx.tx_date.desc())
+    )
+
+
+def recent_transactions_query():
+    """Latest transactions as plain rows (cacheable; see dashboard.py)."""
+    return (
+        db.session.query(
+            StockTransaction.id, StockTransaction.tx_date, StockTransaction.tx_type, StockTransaction.quantity,
+            StockTransaction.product_id, Product.name.label("product_name"), Location.name.label("location_name"),
+        )
+        .join(Product, StockTransaction.product_id == Product.id)
+        .outerjoin(Location, StockTransaction.location_id == Location.id)
+        .order_by(StockTransaction.tx_date.desc())
+    )
+
+
+# ---- Exports ----
+# Exports read plain column tuples: no ORM instances or relationship state
+# to build per row.
+def inventory_export_query():
+    return (
+        db.session.query(
+            Product.id, Product.sku, Product.name.label("product_name"),
+            Category.name.label("category_name"), Supplier.name.label("supplier_name"),
+            Product.unit, Product.price, Product.reorder_level, Product.stock,
+        )
+        .outerjoin(Category, Product.category_id == Category.id)
+        .outerjoin(Supplier, Product.supplier_id == Supplier.id)
+        .order_by(Product.name.asc(), Product.id.asc())
+    )
+
+
+def transaction_export_query(tx=StockTransaction, **filters):
+    return (
+        db.session.query(
+            tx.id, tx.tx_date, tx.tx_type,
+            Product.sku, Product.name.label("product_name"), tx.quantity,
+            tx.reference, tx.note, Location.name.label("location_name"),
+        )
+        .join(Product, tx.product_id == Product.id)
+        .outerjoin(Location, tx.location_id == Location.id)
+        .filter(*transaction_filters(tx, **filters))
+        .order_by(tx.tx_date.desc(), tx.id.desc())
+    )
@@ -0,0 +1,98 @@
+"""Per-request SQL query counting and per-endpoint query budgets.
+
+Set `QUERY_BUDGET` to "warn" to log requests that run more queries than
+their endpoint allows, or "strict" to raise `QueryBudgetExceeded` (use this
+in tests so an N+1 regression fails loudly). Views declare their budget
+with the `query_budget` decorator; the count includes the user-loader
+query made by Flask-Login on a cache miss and the version-stamp query of
+views wrapped in httpcache.conditional. One-off per-worker setup that runs
+inside whichever request comes first (the search backend's detection) is
+wrapped in `uncounted()`, so a budget doesn't depend on request order.
+"""
+import time
+from contextlib import contextmanager
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+
+from . import db
+
+
+class QueryBudgetExceeded(RuntimeError):
+    pass
+
+
+def query_budget(max_queries: int):
+    """Declare the most SQL statements a single request to a view may run."""
+    def decorator(view):
+        view.query_budget = max_queries
+        return view
+    return decorator
+
+
+def request_query_stats():
+    """(count, seconds) of SQL run so far by the current request."""
+    return g.get("sql_count", 0), g.get("sql_time", 0.0)
+
+
+@contextmanager
+def uncounted():
+    """Leave the SQL run inside the block out of the request's count."""
+    if not has_request_context():
+        yield
+        return
+    g.sql_uncounted = g.get("sql_uncounted", 0) + 1
+    try:
+        yield
+    finally:
+        g.sql_uncounted -= 1
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if not has_request_context():
+        return
+    started = conn.info["query_start"].pop()
+    if g.get("sql_uncounted"):
+        return
+    g.sql_count = g.get("sql_count", 0) + 1
+    g.sql_time = g.get("sql_time", 0.0) + (time.perf_counter() - started)
+
+
+def _reset_counts():
+    # g belongs to the app context, which a request only gets to itself when
+    # none is active already (a test holding one, a request made from a CLI
+    # command)
+    g.sql_count, g.sql_time = 0, 0.0
+
+
+def _check_budget(exc):
+    mode = current_app.config.get("QUERY_BUDGET", "off")
+    if mode == "off" or exc is not None:
+        return
+    view = current_app.view_functions.get(request.endpoint)
+    budget = getattr(view, "query_budget", None)
+    if budget is None:
+        return
+    count, _ = request_query_stats()
+    if count > budget:
+        msg = f"{request.endpoint} ran {count} queries (budget {budget})"
+        if mode == "strict":
+            raise QueryBudgetExceeded(msg)
+        current_app.logger.warning(msg)
+
+
+def init_app(app):
+    app.config.setdefault("QUERY_BUDGET", "off")
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    app.before_request(_reset_counts)
+    # Teardown rather than after_request: streamed responses (CSV exports)
+    # keep querying after the view returns.
+    app.teardown_request(_check_budget)
@@ -1,47 +1,62 @@
-import csv
 import io
-from datetime import datetime
+import os
+from datetime import datetime, timedelta
 
-from flask import Blueprint, render_template, redirect, url_for, flash, request, send_file
-from flask_login import login_required
+from flask import Blueprint, Response, abort, jsonify, render_template, redirect, url_for, flash, request, send_file, stream_with_context
+from flask_login import current_user, login_required
 
-from . import db
-from .models import Product, Category, Supplier, StockTransaction
-from .forms import CategoryForm, SupplierForm, ProductForm, StockTxForm
+from . import archive, db, jobs
+from .models import Product, Category, Supplier, StockSnapshot, StockTransaction, Job, Location, StockBalance
+from .forms import CategoryForm, SupplierForm, LocationForm, ProductForm, StockTxForm, TransferForm, CatalogueImportForm
+from .exports import stream_inventory_csv, stream_transactions_csv
+from .queries import (
+    transaction_filter_args, category_list_query, supplier_list_query, category_has_products,
+    supplier_has_products, location_list_query, product_list_query, product_stock, product_balances,
+    product_has_transactions, product_transactions_query, transaction_list_query, transaction_source,
+    transaction_keys, CATEGORY_KEYS, SUPPLIER_KEYS, PRODUCT_KEYS,
+)
+from .querystats import query_budget
+from .httpcache import conditional
+from .pagination import keyset_paginate, page_size_arg
+from .dashboard import dashboard_stats
+from .cache import cache_stats
+from .catalogue import REFRESH_QUERIES, get_catalogue
+from .imports import import_catalogue
+from .ledger import BatchError, InsufficientStock, record_transaction, transfer_stock
+from .locations import default_location_id, location_choices, location_in_use
+from .snapshots import month_ends, valuation_as_of
+from .analytics import params_from_args, reorder_analysis
+from .utils import parse_date
 
 main_bp = Blueprint("main", __name__)
 
+REORDER_REPORT_ROWS = 200
+JOBS_LIST_ROWS = 50
+
 @main_bp.route("/")
 def home():
     return redirect(url_for("main.dashboard"))
 
 @main_bp.route("/dashboard")
 @login_required
+@query_budget(6)
 def dashboard():
-    total_products = Product.query.count()
-    low_stock = Product.query.filter(Product.reorder_level > 0, Product.stock <= Product.reorder_level).order_by(Product.stock.asc()).limit(10).all()
-    recent_txs = StockTransaction.query.order_by(StockTransaction.tx_date.desc()).limit(10).all()
-    total_categories = Category.query.count()
-    total_suppliers = Supplier.query.count()
-    return render_template(
-        "dashboard.html",
-        total_products=total_products,
-        total_categories=total_categories,
-        total_suppliers=total_suppliers,
-        low_stock=low_stock,
-        recent_txs=recent_txs
-    )
+    return render_template("dashboard.html", **dashboard_stats())
+
+@main_bp.route("/stats/cache.json")
+@login_required
+def cache_stats_json():
+    return jsonify(cache_stats())
 
 # ---- Categories ----
 @main_bp.route("/categories")
 @login_required
+@query_budget(3)
+@conditional(Category)
 def categories():
     q = request.args.get("q", "").strip()
-    query = Category.query
-    if q:
-        query = query.filter(Category.name.ilike(f"%{q}%"))
-    items = query.order_by(Category.name.asc()).all()
-    return render_template("categories/list.html", items=items, q=q)
+    page = keyset_paginate(category_list_query(q), CATEGORY_KEYS, request.args.get("cursor"), page_size_arg(request.args))
+    return render_template("categories/list.html", items=page.items, page=page, q=q)
 
 @main_bp.route("/categories/new", methods=["GET", "POST"])
 @login_required
@@ -79,7 +94,7 @@ def category_edit(cat_id):
 @login_required
 def category_delete(cat_id):
     item = Category.query.get_or_404(cat_id)
-    if item.products:
+    if category_has_products(item.id):
         flash("Cannot delete category that has products. Remove products first.", "danger")
     else:
         db.session.delete(item)
@@ -90,13 +105,12 @@ def category_delete(cat_id):
 # ---- Suppliers ----
 @main_bp.route("/suppliers")
 @login_required
+@query_budget(3)
+@conditional(Supplier)
 def suppliers():
     q = request.args.get("q", "").strip()
-    query = Supplier.query
-    if q:
-        query = query.filter(Supplier.name.ilike(f"%{q}%"))
-    items = query.order_by(Supplier.name.asc()).all()
-    return render_template("suppliers/list.html", items=items, q=q)
+    page = keyset_paginate(supplier_list_query(q), SUPPLIER_KEYS, request.args.get("cursor"), page_size_arg(request.args))
+    return render_template("suppliers/list.html", items=page.items, page=page, q=q)
 
 @main_bp.route("/suppliers/new", methods=["GET", "POST"])
 @login_required
@@ -143,7 +157,7 @@ def supplier_edit(supp_id):
 @login_required
 def supplier_delete(supp_id):
     item = Supplier.query.get_or_404(supp_id)
-    if item.products:
+    if supplier_has_products(item.id):
         flash("Cannot delete supplier that has products. Remove products first.", "danger")
     else:
         db.session.delete(item)
@@ -151,25 +165,83 @@ def supplier_delete(supp_id):
         flash("Supplier deleted.", "success")
     return redirect(url_for("main.suppliers"))
 
+# ---- Locations ----
+@main_bp.route("/locations")
+@login_required
+@query_budget(3 + REFRESH_QUERIES)
+@conditional(Location, Product)
+def locations():
+    return render_template("locations/list.html", items=location_list_query().all(), default_id=default_location_id())
+
+@main_bp.route("/locations/new", methods=["GET", "POST"])
+@login_required
+def location_new():
+    form = LocationForm()
+    if form.validate_on_submit():
+        name = form.name.data.strip()
+        if Location.query.filter_by(name=name).first():
+            flash("Location already exists.", "warning")
+        else:
+            db.session.add(Location(name=name))
+            db.session.commit()
+            flash("Location created.", "success")
+            return redirect(url_for("main.locations"))
+    return render_template("locations/form.html", form=form, title="New Location")
+
+@main_bp.route("/locations/<int:loc_id>/edit", methods=["GET", "POST"])
+@login_required
+def location_edit(loc_id):
+    item = Location.query.get_or_404(loc_id)
+    form = LocationForm(obj=item)
+    if form.validate_on_submit():
+        name = form.name.data.strip()
+        exists = Location.query.filter(Location.name == name, Location.id != item.id).first()
+        if exists:
+            flash("Another location already has that name.", "warning")
+        else:
+            item.name = name
+            db.session.commit()
+            flash("Location updated.", "success")
+            return redirect(url_for("main.locations"))
+    return render_template("locations/form.html", form=form, title="Edit Location")
+
+@main_bp.route("/locations/<int:loc_id>/delete", methods=["POST"])
+@login_required
+def location_delete(loc_id):
+    item = Location.query.get_or_404(loc_id)
+    if item.id == default_location_id():
+        flash("Cannot delete the default location.", "danger")
+    elif location_in_use(item.id):
+        flash("Cannot delete location that has stock or transactions.", "danger")
+    else:
+        db.session.delete(item)
+        db.session.commit()
+        flash("Location deleted.", "success")
+    return redirect(url_for("main.locations"))
+
 # ---- Products ----
-def _populate_product_form_choices(form: ProductForm):
-    cats = Category.query.order_by(Category.name.asc()).all()
-    sups = Supplier.query.order_by(Supplier.name.asc()).all()
-    form.category_id.choices = [(0, "— None —")] + [(c.id, c.name) for c in cats]
-    form.supplier_id.choices = [(0, "— None —")] + [(s.id, s.name) for s in sups]
+def _populate_product_form_choices(form: ProductForm, item=None):
+    # Only the selected options are rendered; the select loads the rest on
+    # demand from /api/<categories|suppliers>/options. On POST this doubles
+    # as validation: an id that doesn't exist isn't a valid choice. Names
+    # come from the catalogue snapshot, not the database.
+    if request.method == "POST":
+        cat_id, sup_id = form.category_id.data, form.supplier_id.data
+    else:
+        cat_id, sup_id = (item.category_id, item.supplier_id) if item else (None, None)
+    catalogue = get_catalogue()
+    form.category_id.choices = [(0, "— None —")] + catalogue.options(Category, [cat_id])
+    form.supplier_id.choices = [(0, "— None —")] + catalogue.options(Supplier, [sup_id])
 
 @main_bp.route("/products")
 @login_required
+@query_budget(3)
+@conditional(Product, Category, Supplier)
 def products():
     q = request.args.get("q", "").strip()
     only_low = request.args.get("low", "").strip() == "1"
-    query = Product.query
-    if q:
-        query = query.filter((Product.name.ilike(f"%{q}%")) | (Product.sku.ilike(f"%{q}%")))
-    if only_low:
-        query = query.filter(Product.reorder_level > 0, Product.stock <= Product.reorder_level)
-    items = query.order_by(Product.name.asc()).all()
-    return render_template("products/list.html", items=items, q=q, only_low=only_low)
+    page = keyset_paginate(product_list_query(q, only_low), PRODUCT_KEYS, request.args.get("cursor"), page_size_arg(request.args))
+    return render_template("products/list.html", items=page.items, page=page, q=q, only_low=only_low)
 
 @main_bp.route("/products/new", methods=["GET", "POST"])
 @login_required
@@ -198,17 +270,49 @@ def product_new():
                 item.supplier_id = None
 
             db.session.add(item)
+            db.session.flush()
+            # The opening stock is held at the default location
+            db.session.add(StockBalance(product_id=item.id, location_id=default_location_id(), quantity=item.stock, is_low=item.is_low))
             db.session.commit()
             flash("Product created.", "success")
             return redirect(url_for("main.products"))
     return render_template("products/form.html", form=form, title="New Product")
 
+@main_bp.route("/products/import", methods=["GET", "POST"])
+@login_required
+def product_import():
+    form = CatalogueImportForm()
+    result = None
+    if form.validate_on_submit():
+        # Parsed straight off the upload, a batch at a time
+        stream = io.TextIOWrapper(form.file.data.stream, encoding="utf-8-sig", newline="")
+        try:
+            result = import_catalogue(stream, atomic=form.atomic.data)
+        except BatchError as exc:
+            flash(str(exc), "danger")
+        else:
+            if result.applied:
+                flash(f"Imported {result.created} new and {result.updated} updated products.", "success")
+            elif result.rejected:
+                flash("Nothing was imported.", "warning")
+            else:
+                flash("Every product was already up to date.", "info")
+    return render_template("products/import.html", form=form, result=result)
+
 @main_bp.route("/products/<int:prod_id>/edit", methods=["GET", "POST"])
 @login_required
 def product_edit(prod_id):
-    item = Product.query.get_or_404(prod_id)
-    form = ProductForm(obj=item)
-    _populate_product_form_choices(form)
+    if request.method == "POST":
+        item = Product.query.get_or_404(prod_id)
+        form = ProductForm(obj=item)
+    else:
+        # Only rendered: the catalogue snapshot plus the live stock will do
+        item = get_catalogue().get_or_404(prod_id)
+        stock = product_stock(prod_id)
+        if stock is None:
+            abort(404)
+        form = ProductForm(obj=item, stock=stock.stock)
+    _populate_product_form_choices(form, item)
 
     # Ensure initial selects are set (use 0 for None)
     if request.method == "GET":
@@ -242,105 +346,180 @@ def product_edit(prod_id):
 @login_required
 def product_delete(prod_id):
     item = Product.query.get_or_404(prod_id)
-    if item.transactions:
+    if product_has_transactions(item.id):
         flash("Cannot delete product with transactions. Delete transactions first.", "danger")
     else:
+        StockSnapshot.query.filter_by(product_id=item.id).delete()
+        StockBalance.query.filter_by(product_id=item.id).delete()
         db.session.delete(item)
         db.session.commit()
         flash("Product deleted.", "success")
     return redirect(url_for("main.products"))
 
+def _populate_location_choices(*fields):
+    # Location names come from the catalogue snapshot, like the product's
+    choices = location_choices()
+    for field in fields:
+        field.choices = choices
+
 @main_bp.route("/products/<int:prod_id>")
 @login_required
+@query_budget(4 + REFRESH_QUERIES)
 def product_detail(prod_id):
-    item = Product.query.get_or_404(prod_id)
-    txs = StockTransaction.query.filter_by(product_id=item.id).order_by(StockTransaction.tx_date.desc()).limit(50).all()
-    form = StockTxForm()
-    return render_template("products/detail.html", item=item, txs=txs, form=form)
+    item = get_catalogue().get_or_404(prod_id)
+    stock = product_stock(item.id)
+    if stock is None:
+        abort(404)
+    balances = product_balances(item.id)
+    txs = product_transactions_query(item.id).limit(50).all()
+    opening = archive.opening_balance(item.id)
+    form, transfer_form = StockTxForm(), TransferForm()
+    _populate_location_choices(form.location_id, transfer_form.from_location_id, transfer_form.to_location_id)
+    return render_template(
+        "products/detail.html", item=item, stock=stock.stock, is_low=stock.is_low, balances=balances,
+        location_names=dict(form.location_id.choices), txs=txs, opening=opening, form=form, transfer_form=transfer_form,
+    )
 
 @main_bp.route("/products/<int:prod_id>/transaction", methods=["POST"])
 @login_required
 def product_transaction(prod_id):
-    item = Product.query.get_or_404(prod_id)
+    # Existence check only; the stock itself moves in one UPDATE (ledger.py)
+    item = get_catalogue().get_or_404(prod_id)
     form = StockTxForm()
+    _populate_location_choices(form.location_id)
     if form.validate_on_submit():
-        qty = int(form.quantity.data)
-        tx_type = form.tx_type.data
-        if tx_type == "OUT" and qty > item.stock:
-            flash("Not enough stock for Stock Out.", "danger")
-            return redirect(url_for("main.product_detail", prod_id=item.id))
-
-        if tx_type == "IN":
-            item.stock += qty
+        try:
+            record_transaction(
+                item.id,
+                form.tx_type.data,
+                int(form.quantity.data),
+                reference=form.reference.data.strip() if form.reference.data else None,
+                note=form.note.data.strip() if form.note.data else None,
+                location_id=form.location_id.data or None,
+            )
+        except InsufficientStock:
+            flash("Not enough stock at that location for Stock Out.", "danger")
         else:
-            item.stock -= qty
-
-        tx = StockTransaction(
-            product_id=item.id,
-            tx_type=tx_type,
-            quantity=qty,
-            reference=form.reference.data.strip() if form.reference.data else None,
-            note=form.note.data.strip() if form.note.data else None,
-            tx_date=datetime.utcnow()
-        )
-        db.session.add(tx)
-        db.session.commit()
-        flash("Transaction recorded.", "success")
+            flash("Transaction recorded.", "success")
     else:
         flash("Please correct the errors in the transaction form.", "warning")
-    return redirect(url_for("main.product_detail", prod_id=item.id))
+    return redirect(url_for("main.product_detail", prod_id=prod_id))
+
+@main_bp.route("/products/<int:prod_id>/transfer", methods=["POST"])
+@login_required
+def product_transfer(prod_id):
+    item = get_catalogue().get_or_404(prod_id)
+    form = TransferForm()
+    _populate_location_choices(form.from_location_id, form.to_location_id)
+    if form.validate_on_submit():
+        try:
+            transfer_stock(
+                item.id,
+                form.from_location_id.data,
+                form.to_location_id.data,
+                int(form.quantity.data),
+                reference=form.reference.data.strip() if form.reference.data else None,
+                note=form.note.data.strip() if form.note.data else None,
+            )
+        except InsufficientStock:
+            flash("Not enough stock at the source location.", "danger")
+        else:
+            flash("Stock transferred.", "success")
+    else:
+        errors = form.to_location_id.errors or ["Please correct the errors in the transfer form."]
+        flash(errors[0], "warning")
+    return redirect(url_for("main.product_detail", prod_id=prod_id))
 
 # ---- Transactions ----
 @main_bp.route("/transactions")
 @login_required
+@query_budget(3 + REFRESH_QUERIES)
+@conditional(StockTransaction, Product, Location)
 def transactions():
-    q = request.args.get("q", "").strip()
-    tx_type = request.args.get("type", "").strip()  # IN/OUT/blank
-    query = StockTransaction.query.join(Product)
-    if q:
-        query = query.filter((Product.name.ilike(f"%{q}%")) | (Product.sku.ilike(f"%{q}%")) | (StockTransaction.reference.ilike(f"%{q}%")))
-    if tx_type in ("IN", "OUT"):
-        query = query.filter(StockTransaction.tx_type == tx_type)
-    items = query.order_by(StockTransaction.tx_date.desc()).limit(500).all()
-    return render_template("transactions/list.html", items=items, q=q, tx_type=tx_type)
+    filters = transaction_filter_args(request.args)
+    tx = transaction_source(**filters)
+    page = keyset_paginate(transaction_list_query(tx, **filters), transaction_keys(tx), request.args.get("cursor"), page_size_arg(request.args))
+    locations = location_choices()
+    return render_template("transactions/list.html", items=page.items, page=page, locations=locations,
+                           location_names=dict(locations), **filters)
 
 # ---- Exports ----
+def _csv_response(chunks, filename):
+    # Stream rows as they are read instead of building the file in memory
+    return Response(
+        stream_with_context(chunks),
+        mimetype="text/csv",
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
+
 @main_bp.route("/export/inventory.csv")
 @login_required
+@query_budget(3)
+@conditional(Product, Category, Supplier)
 def export_inventory():
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(["SKU", "Product", "Category", "Supplier", "Unit", "Price", "Reorder Level", "Stock"])
-    for p in Product.query.order_by(Product.name.asc()).all():
-        writer.writerow([
-            p.sku,
-            p.name,
-            p.category.name if p.category else "",
-            p.supplier.name if p.supplier else "",
-            p.unit,
-            p.price,
-            p.reorder_level,
-            p.stock,
-        ])
-    mem = io.BytesIO(output.getvalue().encode("utf-8"))
-    return send_file(mem, mimetype="text/csv", as_attachment=True, download_name="grocerflow_inventory.csv")
+    return _csv_response(stream_inventory_csv(), "grocerflow_inventory.csv")
 
 @main_bp.route("/export/transactions.csv")
 @login_required
+@query_budget(3)
+@conditional(StockTransaction, Product, Location)
 def export_transactions():
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(["Date (UTC)", "Type", "SKU", "Product", "Qty", "Reference", "Note"])
-    items = StockTransaction.query.join(Product).order_by(StockTransaction.tx_date.desc()).all()
-    for tx in items:
-        writer.writerow([
-            tx.tx_date.isoformat(sep=" ", timespec="seconds"),
-            tx.tx_type,
-            tx.product.sku,
-            tx.product.name,
-            tx.quantity,
-            tx.reference or "",
-            tx.note or "",
-        ])
-    mem = io.BytesIO(output.getvalue().encode("utf-8"))
-    return send_file(mem, mimetype="text/csv", as_attachment=True, download_name="grocerflow_transactions.csv")
+    filters = transaction_filter_args(request.args)
+    return _csv_response(stream_transactions_csv(**filters), "grocerflow_transactions.csv")
+
+# ---- Reports ----
+@main_bp.route("/reports/valuation")
+@login_required
+def valuation_report():
+    day = parse_date(request.args.get("as_of"))
+    as_of = day + timedelta(days=1) - timedelta(microseconds=1) if day else datetime.utcnow()
+    history = [valuation_as_of(end) for end in month_ends(12, until=as_of)]
+    return render_template("reports/valuation.html", report=valuation_as_of(as_of), day=day, history=history)
+
+@main_bp.route("/reports/reorder")
+@login_required
+def reorder_report():
+    params = params_from_args(request.args)
+    show_all = request.args.get("all", "").strip() == "1"
+    analysis = reorder_analysis(**params)
+    rows = analysis.rows(limit=REORDER_REPORT_ROWS, needs_reorder=not show_all)
+    return render_template("reports/reorder.html", rows=rows, summary=analysis.summary(), show_all=show_all, **params)
+
+# ---- Background jobs ----
+@main_bp.route("/jobs")
+@login_required
+def jobs_list():
+    items = Job.query.order_by(Job.id.desc()).limit(JOBS_LIST_ROWS).all()
+    return render_template("jobs/list.html", items=items, kinds=jobs.KINDS, label=jobs.label)
+
+@main_bp.route("/jobs/<kind>", methods=["POST"])
+@login_required
+def job_new(kind):
+    if kind not in jobs.KINDS:
+        abort(404)
+    params = {k: v for k, v in request.form.items() if v}
+    try:
+        job = jobs.enqueue(kind, params, user_id=current_user.id)
+    except ValueError as exc:
+        abort(400, description=str(exc))
+    return redirect(url_for("main.job_detail", job_id=job.id))
+
+@main_bp.route("/jobs/<int:job_id>")
+@login_required
+def job_detail(job_id):
+    job = Job.query.get_or_404(job_id)
+    return render_template("jobs/detail.html", job=job, label=jobs.label(job))
+
+@main_bp.route("/jobs/<int:job_id>.json")
+@login_required
+def job_status(job_id):
+    return jsonify(jobs.to_dict(Job.query.get_or_404(job_id)))
+
+@main_bp.route("/jobs/<int:job_id>/download")
+@login_required
+def job_download(job_id):
+    job = Job.query.get_or_404(job_id)
+    path = jobs.output_path(job)
+    if job.status != "done" or not os.path.exists(path):
+        abort(404)
+    return send_file(path, mimetype="text/csv", as_attachment=True, download_name=job.filename)
@@ -0,0 +1,245 @@
+"""Versioned schema migrations.
+
+The app never creates or alters tables while booting; a worker only opens
+connections when a request needs one. `flask db-upgrade` applies the
+pending steps below in order, each in its own transaction, and records it
+in `schema_migrations`; `flask bootstrap` does the same on a new install
+and then creates the default admin. Run one of them on deploy, before the
+new workers start.
+
+Databases from before versioning (whose tables were created at every
+boot) have no `schema_migrations` table: every step is idempotent, so
+they are brought up to date by running all of them. A schema change is a
+new numbered step at the end of MIGRATIONS -- never edit an applied one.
+
+Steps never build DDL from the models, which keep changing: the tables a
+step creates are written out below as they were when it was added, and
+each step creates or alters only what it introduces.
+"""
+from datetime import datetime
+
+from sqlalchemy import (
+    Boolean, Column, DateTime, Float, ForeignKey, Index, Integer, MetaData, String, Table, Text, false, inspect,
+    insert, select, text,
+)
+
+from . import db, locations, search
+from .models import LedgerArchive, SchemaMigration, StockTransaction
+
+# ---- Frozen table definitions ----
+_metadata = MetaData()
+
+
+def _timestamps():
+    return [
+        Column("created_at", DateTime, nullable=False),
+        Column("updated_at", DateTime, nullable=False, index=True),
+    ]
+
+
+# Step 1: the models when versioning began
+V1_TABLES = [
+    Table(
+        "users", _metadata,
+        Column("id", Integer, primary_key=True),
+        Column("username", String(80), unique=True, nullable=False, index=True),
+        Column("password_hash", String(255), nullable=False),
+        Column("is_admin", Boolean, nullable=False),
+        *_timestamps(),
+    ),
+    Table(
+        "categories", _metadata,
+        Column("id", Integer, primary_key=True),
+        Column("name", String(120), unique=True, nullable=False, index=True),
+        *_timestamps(),
+    ),
+    Table(
+        "suppliers", _metadata,
+        Column("id", Integer, primary_key=True),
+        Column("name", String(120), unique=True, nullable=False, index=True),
+        Column("phone", String(40)),
+        Column("email", String(120)),
+        Column("address", String(255)),
+        *_timestamps(),
+    ),
+    Table(
+        "products", _metadata,
+        Column("id", Integer, primary_key=True),
+        Column("name", String(200), nullable=False, index=True),
+        Column("sku", String(80), unique=True, nullable=False, index=True),
+        Column("unit", String(40), nullable=False),
+        Column("category_id", Integer, ForeignKey("categories.id")),
+        Column("supplier_id", Integer, ForeignKey("suppliers.id")),
+        Column("price", Float, nullable=False),
+        Column("reorder_level", Integer, nullable=False),
+        Column("stock", Integer, nullable=False),
+        Column("is_low", Boolean, server_default=false(), nullable=False),
+        *_timestamps(),
+        Index("ix_products_low_stock", "stock", sqlite_where=text("is_low = 1"), postgresql_where=text("is_low")),
+    ),
+    Table(
+        "stock_transactions", _metadata,
+        Column("id", Integer, primary_key=True),
+        Column("product_id", Integer, ForeignKey("products.id"), nullable=False, index=True),
+        Column("tx_type", String(10), nullable=False),
+        Column("quantity", Integer, nullable=False),
+        Column("reference", String(120)),
+        Column("note", String(255)),
+        Column("tx_date", DateTime, nullable=False, index=True),
+        *_timestamps(),
+        Index("ix_stock_transactions_type_date", "tx_type", "tx_date", "product_id", "quantity"),
+    ),
+    Table(
+        "stock_opening_balances", _metadata,
+        Column("product_id", Integer, ForeignKey("products.id"), primary_key=True),
+        Column("quantity", Integer, nullable=False),
+        Column("as_of", DateTime, nullable=False),
+    ),
+    Table(
+        "ledger_archives", _metadata,
+        Column("id", Integer, primary_key=True),
+        Column("table_name", String(80), unique=True, nullable=False),
+        Column("first_date", DateTime, nullable=False),
+        Column("last_date", DateTime, nullable=False),
+        Column("row_count", Integer, nullable=False),
+        Column("archived_at", DateTime, nullable=False),
+    ),
+    Table(
+        "stock_snapshot_runs", _metadata,
+        Column("id", Integer, primary_key=True),
+        Column("taken_at", DateTime, nullable=False, index=True),
+        Column("last_tx_id", Integer, nullable=False),
+        Column("product_count", Integer, nullable=False),
+    ),
+    Table(
+        "stock_snapshots", _metadata,
+        Column("run_id", Integer, ForeignKey("stock_snapshot_runs.id", ondelete="CASCADE"), primary_key=True),
+        Column("product_id", Integer, ForeignKey("products.id"), primary_key=True),
+        Column("stock", Integer, nullable=False),
+    ),
+    Table(
+        "jobs", _metadata,
+        Column("id", Integer, primary_key=True),
+        Column("kind", String(40), nullable=False),
+        Column("params", Text, nullable=False),
+        Column("status", String(10), nullable=False, index=True),
+        Column("user_id", Integer, ForeignKey("users.id")),
+        Column("created_at", DateTime, nullable=False, index=True),
+        Column("started_at", DateTime),
+        Column("finished_at", DateTime),
+        Column("filename", String(120)),
+        Column("size", Integer),
+        Column("error", Text),
+    ),
+]
+
+# Step 5
+LOCATIONS = Table(
+    "locations", _metadata,
+    Column("id", Integer, primary_key=True),
+    Column("name", String(120), unique=True, nullable=False, index=True),
+    *_timestamps(),
+)
+STOCK_BALANCES = Table(
+    "stock_balances", _metadata,
+    Column("product_id", Integer, ForeignKey("products.id"), primary_key=True),
+    Column("location_id", Integer, ForeignKey("locations.id"), primary_key=True),
+    Column("quantity", Integer, nullable=False),
+    Column("is_low", Boolean, server_default=false(), nullable=False),
+    Index("ix_stock_balances_low", "quantity", sqlite_where=text("is_low = 1"), postgresql_where=text("is_low")),
+)
+
+
+# ---- Steps ----
+def _create_tables(conn):
+    _metadata.create_all(conn, tables=V1_TABLES, checkfirst=True)
+
+
+def _add_low_stock_flag(conn):
+    columns = {c["name"] for c in inspect(conn).get_columns("products")}
+    if "is_low" in columns:
+        return
+    conn.execute(text("ALTER TABLE products ADD COLUMN is_low BOOLEAN NOT NULL DEFAULT false"))
+    conn.execute(text("UPDATE products SET is_low = (reorder_level > 0 AND stock <= reorder_level)"))
+
+
+def _create_missing_indexes(conn):
+    # Indexes of the step 1 tables that boots before versioning didn't create
+    insp = inspect(conn)
+    for table in V1_TABLES:
+        if not insp.has_table(table.name):
+            continue
+        existing = {ix["name"] for ix in insp.get_indexes(table.name)}
+        columns = {c["name"] for c in insp.get_columns(table.name)}
+        for index in table.indexes:
+            if index.name not in existing and {c.name for c in index.columns} <= columns:
+                index.create(conn)
+
+
+def _install_search_index(conn):
+    # FTS5 tables and triggers, or pg_trgm indexes (see search.py)
+    search.install(conn)
+
+
+def _add_locations(conn):
+    # Everything so far was one location: it becomes "Main", holding every
+    # product's stock and every ledger row, hot or archived.
+    LOCATIONS.create(conn, checkfirst=True)
+    STOCK_BALANCES.create(conn, checkfirst=True)
+    main_id = locations.first_location_id(conn)
+    if main_id is None:
+        now = datetime.utcnow()
+        main_id = conn.execute(insert(LOCATIONS).values(
+            name=locations.DEFAULT_LOCATION_NAME, created_at=now, updated_at=now,
+        )).inserted_primary_key[0]
+    ledgers = [StockTransaction.__tablename__] + list(conn.execute(select(LedgerArchive.table_name)).scalars())
+    for name in ledgers:
+        if "location_id" not in {c["name"] for c in inspect(conn).get_columns(name)}:
+            conn.execute(text(f"ALTER TABLE {name} ADD COLUMN location_id INTEGER"))
+        conn.execute(text(f"UPDATE {name} SET location_id = :main WHERE location_id IS NULL"), {"main": main_id})
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("ALTER TABLE stock_transactions ALTER COLUMN location_id SET NOT NULL"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_stock_transactions_location_date ON stock_transactions (location_id, tx_date)"))
+    # Product.is_low now means "low at some location": the same thing while
+    # each product has the one balance.
+    locations.open_default_balances(conn, main_id)
+
+
+# (version, name, step) -- append only
+MIGRATIONS = [
+    (1, "create tables", _create_tables),
+    (2, "products.is_low", _add_low_stock_flag),
+    (3, "missing indexes", _create_missing_indexes),
+    (4, "search index", _install_search_index),
+    (5, "stock locations", _add_locations),
+    # Replaces the word-prefix FTS5 tables with trigram (substring) ones
+    (6, "substring search index", _install_search_index),
+]
+
+
+def applied_versions() -> set:
+    with db.engine.connect() as conn:
+        if not inspect(conn).has_table(SchemaMigration.__tablename__):
+            return set()
+        return set(conn.execute(select(SchemaMigration.version)).scalars())
+
+
+def pending():
+    """[(version, name)] not applied yet, in order."""
+    done = applied_versions()
+    return [(version, name) for version, name, _ in MIGRATIONS if version not in done]
+
+
+def upgrade(echo=None) -> int:
+    """Apply the pending migrations; returns how many ran."""
+    SchemaMigration.__table__.create(db.engine, checkfirst=True)
+    steps = dict((version, step) for version, _, step in MIGRATIONS)
+    ran = 0
+    for version, name in pending():
+        with db.engine.begin() as conn:
+            steps[version](conn)
+            conn.execute(insert(SchemaMigration.__table__).values(version=version, name=name, applied_at=datetime.utcnow()))
+        ran += 1
+        if echo:
+            echo(f"{version:>4}  {name}")
+    return ran
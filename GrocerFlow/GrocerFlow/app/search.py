@@ -0,0 +1,260 @@
+"""Search index for the list-page search boxes.
+
+`ilike('%q%')` cannot use a B-tree index, so every search scanned the whole
+table. The backend is picked from the database dialect:
+
+* SQLite  -- FTS5 external-content tables with the trigram tokenizer,
+  kept in sync by triggers, with bm25 ranking.
+* Postgres -- pg_trgm GIN indexes, which serve the existing substring
+  ILIKE directly and rank by similarity.
+* anything else (or `SEARCH_BACKEND=like`) -- the plain ILIKE scan.
+
+Every backend matches the same rows: the query as a substring of any
+indexed column, case-insensitively. Trigrams need three characters, so
+shorter queries are a scan on every backend.
+
+The index is created by a migration (schema.py); the backend is picked
+on first use, and falls back to the LIKE scan if its index is missing. Run
+`flask search-rebuild` after restoring a database or bulk-loading rows
+with triggers disabled.
+"""
+from flask import current_app
+from sqlalchemy import Integer, bindparam, column, func, or_, select, text
+from sqlalchemy.exc import OperationalError
+
+from . import db
+from .models import Product, Category, Supplier, StockTransaction
+from .querystats import uncounted
+
+# index name -> (model, indexed columns)
+INDEXES = {
+    "products": (Product, ("name", "sku")),
+    "categories": (Category, ("name",)),
+    "suppliers": (Supplier, ("name",)),
+    "transactions": (StockTransaction, ("reference",)),
+}
+
+class LikeBackend:
+    name = "like"
+
+    def install(self, conn):
+        pass
+
+    def installed(self, conn) -> bool:
+        return True
+
+    def rebuild(self, conn):
+        pass
+
+    def match(self, index, q, id_column=None):
+        """Criterion for rows of `index` matching `q`.
+
+        `id_column` is the column holding the indexed row's id in the query
+        being filtered (e.g. `StockTransaction.product_id`); the LIKE
+        backend ignores it and expects the model itself to be in the query.
+        """
+        model, columns = INDEXES[index]
+        return or_(*[getattr(model, c).ilike(f"%{q}%") for c in columns])
+
+    def ranked_ids(self, index, q, limit):
+        model, columns = INDEXES[index]
+        stmt = select(model.id).where(self.match(index, q)).order_by(getattr(model, columns[0])).limit(limit)
+        return db.session.execute(stmt).scalars().all()
+
+
+class SQLiteFTSBackend(LikeBackend):
+    name = "fts5"
+    # Substring matching, like ILIKE '%q%'
+    TOKENIZER = "trigram"
+
+    @staticmethod
+    def fts_table(index):
+        return f"{INDEXES[index][0].__tablename__}_fts"
+
+    @staticmethod
+    def available(conn) -> bool:
+        try:
+            # The trigram tokenizer needs SQLite 3.34+
+            conn.execute(text("CREATE VIRTUAL TABLE temp._fts5_probe USING fts5(x, tokenize='trigram')"))
+            conn.execute(text("DROP TABLE temp._fts5_probe"))
+            return True
+        except OperationalError:
+            return False
+
+    def _definitions(self, conn):
+        """fts table name -> its CREATE statement, for the ones that exist."""
+        names = [self.fts_table(index) for index in INDEXES]
+        return dict(conn.execute(
+            text("SELECT name, sql FROM sqlite_master WHERE name IN :names").bindparams(bindparam("names", expanding=True)),
+            {"names": names},
+        ).all())
+
+    def installed(self, conn) -> bool:
+        found = self._definitions(conn)
+        return len(found) == len(INDEXES) and all(self.TOKENIZER in sql for sql in found.values())
+
+    def install(self, conn):
+        """Create missing FTS tables and triggers; new tables are populated.
+
+        Tables from before substring matching (word tokens) are replaced.
+        """
+        found = self._definitions(conn)
+        for index, (model, columns) in INDEXES.items():
+            table, fts = model.__tablename__, self.fts_table(index)
+            if fts in found:
+                if self.TOKENIZER in found[fts]:
+                    continue
+                for suffix in ("ai", "ad", "au"):
+                    conn.execute(text(f"DROP TRIGGER IF EXISTS {fts}_{suffix}"))
+                conn.execute(text(f"DROP TABLE {fts}"))
+            cols = ", ".join(columns)
+            new = ", ".join(f"new.{c}" for c in columns)
+            old = ", ".join(f"old.{c}" for c in columns)
+            conn.execute(text(
+                f"CREATE VIRTUAL TABLE {fts} USING fts5({cols}, content='{table}', content_rowid='id', "
+                f"tokenize='{self.TOKENIZER}')"
+            ))
+            conn.execute(text(
+                f"CREATE TRIGGER {fts}_ai AFTER INSERT ON {table} BEGIN "
+                f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new}); END"
+            ))
+            conn.execute(text(
+                f"CREATE TRIGGER {fts}_ad AFTER DELETE ON {table} BEGIN "
+                f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old}); END"
+            ))
+            # Only re-index when a searchable column changes, not on stock updates
+            conn.execute(text(
+                f"CREATE TRIGGER {fts}_au AFTER UPDATE OF {cols} ON {table} BEGIN "
+                f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old}); "
+                f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new}); END"
+            ))
+            conn.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+
+    def rebuild(self, conn):
+        self.install(conn)
+        for index in INDEXES:
+            fts = self.fts_table(index)
+            conn.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+
+    @staticmethod
+    def fts_query(q):
+        """Turn free text into an FTS5 query for `q` as a substring, or "" if too short."""
+        q = q.strip()
+        if len(q) < 3:
+            return ""
+        # One quoted phrase: the trigrams of q, in order
+        return '"' + q.replace('"', '""') + '"'
+
+    def _matching_ids(self, index, expr):
+        fts = self.fts_table(index)
+        return (
+            text(f"SELECT rowid FROM {fts} WHERE {fts} MATCH :expr")
+            .bindparams(expr=expr)
+            .columns(column("rowid", Integer))
+        )
+
+    def match(self, index, q, id_column=None):
+        expr = self.fts_query(q)
+        if not expr:
+            # Shorter than a trigram: fall back to a scan
+            return super().match(index, q)
+        if id_column is None:
+            id_column = INDEXES[index][0].id
+        return id_column.in_(self._matching_ids(index, expr))
+
+    def ranked_ids(self, index, q, limit):
+        expr = self.fts_query(q)
+        if not expr:
+            return super().ranked_ids(index, q, limit)
+        fts = self.fts_table(index)
+        rows = db.session.execute(
+            text(f"SELECT rowid FROM {fts} WHERE {fts} MATCH :expr ORDER BY rank LIMIT :limit"),
+            {"expr": expr, "limit": limit},
+        )
+        return [r[0] for r in rows]
+
+
+class PostgresTrigramBackend(LikeBackend):
+    name = "pg_trgm"
+
+    def installed(self, conn) -> bool:
+        return conn.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).first() is not None
+
+    def install(self, conn):
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        for model, columns in INDEXES.values():
+            table = model.__tablename__
+            for c in columns:
+                conn.execute(text(
+                    f"CREATE INDEX IF NOT EXISTS ix_{table}_{c}_trgm ON {table} USING gin ({c} gin_trgm_ops)"
+                ))
+
+    def rebuild(self, conn):
+        self.install(conn)
+        for model, _ in INDEXES.values():
+            conn.execute(text(f"REINDEX TABLE {model.__tablename__}"))
+
+    def ranked_ids(self, index, q, limit):
+        model, columns = INDEXES[index]
+        scores = [func.similarity(getattr(model, c), q) for c in columns]
+        score = func.greatest(*scores) if len(scores) > 1 else scores[0]
+        stmt = select(model.id).where(self.match(index, q)).order_by(score.desc()).limit(limit)
+        return db.session.execute(stmt).scalars().all()
+
+
+def _choose_backend(app, conn):
+    """The backend this database supports (installed or not)."""
+    wanted = app.config.get("SEARCH_BACKEND", "auto")
+    if wanted == "like":
+        return LikeBackend()
+    if conn.dialect.name == "sqlite":
+        if SQLiteFTSBackend.available(conn):
+            return SQLiteFTSBackend()
+        app.logger.warning("SQLite was built without FTS5; search falls back to LIKE scans.")
+    elif conn.dialect.name == "postgresql":
+        return PostgresTrigramBackend()
+    return LikeBackend()
+
+
+def current_backend():
+    """The backend in use, picked on first use (not at boot)."""
+    backend = current_app.extensions.get("search")
+    if backend is None:
+        # Once per worker, in whichever request searches first: not part
+        # of that view's query budget
+        with uncounted(), db.engine.connect() as conn:
+            backend = _choose_backend(current_app, conn)
+            if not backend.installed(conn):
+                current_app.logger.warning(
+                    "Search index is missing; run `flask search-rebuild`. Using LIKE scans meanwhile."
+                )
+                backend = LikeBackend()
+        current_app.extensions["search"] = backend
+    return backend
+
+
+def match(index, q, id_column=None):
+    return current_backend().match(index, q, id_column)
+
+
+def ranked_ids(index, q, limit=20):
+    """Ids of the best matches for `q`, best first."""
+    return current_backend().ranked_ids(index, q, limit)
+
+
+def install(conn):
+    """Create the index this database supports, if missing (a migration step)."""
+    backend = _choose_backend(current_app, conn)
+    backend.install(conn)
+    current_app.extensions["search"] = backend
+
+
+def rebuild():
+    with db.engine.begin() as conn:
+        backend = _choose_backend(current_app, conn)
+        backend.rebuild(conn)
+    current_app.extensions["search"] = backend
+
+
+def init_app(app):
+    app.config.setdefault("SEARCH_BACKEND", "auto")
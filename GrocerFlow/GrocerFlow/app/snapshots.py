@@ -0,0 +1,174 @@
+"""Stock checkpoints and point-in-time stock / valuation.
+
+A snapshot run copies every product's current stock in a single
+INSERT ... SELECT, together with the highest ledger id it reflects. Stock as
+of any time T is then read from the checkpoint nearest to T plus the few
+ledger rows between the two, instead of replaying the whole history:
+
+* forward from an earlier run:  run stock + rows with id > run.last_tx_id
+  and tx_date <= T
+* backward from a later run (or from the live `products.stock`):
+  checkpoint stock - rows with tx_date > T that the checkpoint includes
+
+Runs are taken by `flask stock-snapshot` (e.g. daily from cron) and, when
+`SNAPSHOT_EVERY_N_TX` is set, automatically after that many new ledger rows.
+Valuations use each product's current price; prices are not versioned.
+Ledger reads go through archive.ledger(), so a date before the archive
+horizon also reads the archived partitions it reaches.
+"""
+import calendar
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import func, insert, literal, select
+
+from . import archive, db
+from .models import Product, Category, StockTransaction, StockSnapshot, StockSnapshotRun, signed_quantity
+
+
+def take_snapshot() -> StockSnapshotRun:
+    """Checkpoint every product's stock now, and commit."""
+    run = StockSnapshotRun(taken_at=datetime.utcnow())
+    db.session.add(run)
+    db.session.flush()
+    # Read the ledger high-water mark after the flush has taken SQLite's
+    # write lock, so no stock change can land between it and the copy.
+    run.last_tx_id = db.session.execute(select(func.coalesce(func.max(StockTransaction.id), 0))).scalar()
+    run.product_count = db.session.execute(
+        insert(StockSnapshot.__table__).from_select(
+            ["run_id", "product_id", "stock"],
+            select(literal(run.id), Product.id, Product.stock),
+        )
+    ).rowcount
+    db.session.commit()
+    return run
+
+
+def maybe_snapshot(latest_tx_id=None):
+    """Take a run if SNAPSHOT_EVERY_N_TX ledger rows have landed since the last one."""
+    every = current_app.config.get("SNAPSHOT_EVERY_N_TX", 0)
+    if not every:
+        return None
+    if latest_tx_id is None:
+        latest_tx_id = db.session.execute(select(func.coalesce(func.max(StockTransaction.id), 0))).scalar()
+    state = current_app.extensions.setdefault("snapshots", {})
+    if "last_tx_id" not in state:
+        state["last_tx_id"] = _latest_run_tx_id()
+    if latest_tx_id - state["last_tx_id"] < every:
+        return None
+    # Another worker may have just taken one
+    state["last_tx_id"] = _latest_run_tx_id()
+    if latest_tx_id - state["last_tx_id"] < every:
+        return None
+    run = take_snapshot()
+    state["last_tx_id"] = run.last_tx_id
+    return run
+
+
+def _latest_run_tx_id():
+    return db.session.execute(select(func.coalesce(func.max(StockSnapshotRun.last_tx_id), 0))).scalar()
+
+
+def _nearest_runs(as_of):
+    runs = StockSnapshotRun.query
+    before = runs.filter(StockSnapshotRun.taken_at <= as_of).order_by(StockSnapshotRun.taken_at.desc()).first()
+    after = runs.filter(StockSnapshotRun.taken_at > as_of).order_by(StockSnapshotRun.taken_at.asc()).first()
+    return before, after
+
+
+def _deltas(since, criteria):
+    """{product_id: net quantity} of ledger rows dated from `since` that match `criteria(tx)`."""
+    tx = archive.ledger(since)
+    rows = db.session.execute(
+        select(tx.product_id, func.sum(signed_quantity(tx)))
+        .where(*criteria(tx))
+        .group_by(tx.product_id)
+    )
+    return dict(rows.all())
+
+
+def stock_as_of(as_of) -> dict:
+    """{product_id: stock} at `as_of` for products that existed then."""
+    now = datetime.utcnow()
+    before, after = _nearest_runs(as_of)
+    # Start from whichever checkpoint is closest in time; the live stock
+    # column counts as a checkpoint taken "now".
+    candidates = []
+    if before is not None:
+        candidates.append((as_of - before.taken_at, "forward", before))
+    if after is not None:
+        candidates.append((after.taken_at - as_of, "backward", after))
+    candidates.append((abs(now - as_of), "live", None))
+    _, mode, run = min(candidates, key=lambda c: c[0])
+
+    existed = select(Product.id).where(Product.created_at <= as_of)
+    if mode == "live":
+        return _backward_from_live(as_of, existed)
+
+    base = dict(db.session.execute(
+        select(StockSnapshot.product_id, StockSnapshot.stock)
+        .where(StockSnapshot.run_id == run.id, StockSnapshot.product_id.in_(existed))
+    ).all())
+    if mode == "backward":
+        deltas = _deltas(as_of, lambda tx: [
+            tx.id <= run.last_tx_id,
+            tx.tx_date > as_of,
+            tx.tx_date <= run.taken_at,
+        ])
+        return {pid: stock - deltas.get(pid, 0) for pid, stock in base.items()}
+
+    deltas = _deltas(run.taken_at, lambda tx: [tx.id > run.last_tx_id, tx.tx_date <= as_of])
+    result = {pid: stock + deltas.get(pid, 0) for pid, stock in base.items()}
+    # Products created after the run have opening stock that no ledger row
+    # records, so they can only be worked out backwards from today.
+    late = select(Product.id).where(Product.created_at > run.taken_at, Product.created_at <= as_of)
+    result.update(_backward_from_live(as_of, late))
+    return result
+
+
+def _backward_from_live(as_of, product_ids):
+    base = dict(db.session.execute(select(Product.id, Product.stock).where(Product.id.in_(product_ids))).all())
+    if not base:
+        return {}
+    deltas = _deltas(as_of, lambda tx: [tx.tx_date > as_of, tx.product_id.in_(product_ids)])
+    return {pid: stock - deltas.get(pid, 0) for pid, stock in base.items()}
+
+
+def valuation_as_of(as_of) -> dict:
+    """Units and value on hand at `as_of`, in total and per category."""
+    stock = stock_as_of(as_of)
+    info = db.session.execute(
+        select(Product.id, Product.price, Category.name)
+        .outerjoin(Category, Product.category_id == Category.id)
+        .where(Product.created_at <= as_of)
+    )
+    by_category = {}
+    total_units = total_value = 0
+    for pid, price, cat_name in info:
+        units = stock.get(pid, 0)
+        value = units * (price or 0)
+        entry = by_category.setdefault(cat_name or "Uncategorized", {"units": 0, "value": 0.0})
+        entry["units"] += units
+        entry["value"] += value
+        total_units += units
+        total_value += value
+    return {
+        "as_of": as_of,
+        "units": total_units,
+        "value": total_value,
+        "by_category": sorted(by_category.items(), key=lambda kv: -kv[1]["value"]),
+    }
+
+
+def month_ends(count, until=None):
+    """The last `count` month-end instants (23:59:59.999999), newest first."""
+    until = until or datetime.utcnow()
+    year, month = until.year, until.month
+    ends = []
+    while len(ends) < count:
+        last_day = calendar.monthrange(year, month)[1]
+        end = datetime(year, month, last_day) + timedelta(days=1) - timedelta(microseconds=1)
+        if end <= until:
+            ends.append(end)
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+    return ends
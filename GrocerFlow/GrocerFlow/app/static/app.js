@@ -8,14 +8,74 @@ function initChoices() {
     el.dataset.choicesInitialized = "1";
 
     const placeholder = el.getAttribute('data-placeholder') || 'Select...';
-    new Choices(el, {
+    const remote = el.hasAttribute('data-options-url');
+    const choices = new Choices(el, {
       searchEnabled: true,
       shouldSort: false,
       itemSelectText: '',
       allowHTML: false,
       placeholder: true,
       placeholderValue: placeholder,
+      // Remote selects are filtered by the server, not in the browser
+      searchChoices: !remote,
     });
+    if (remote) initRemoteChoices(el, choices);
+  });
+}
+
+function initRemoteChoices(el, choices) {
+  // Options come a page at a time from data-options-url instead of being
+  // rendered into the page: first page on open, search as you type, more
+  // when the list is scrolled to the end.
+  const url = el.getAttribute('data-options-url');
+  const blank = { value: '0', label: '— None —' };
+  let query = null;
+  let next = null;
+  let loading = null;
+  let timer = null;
+
+  const load = (q, cursor) => {
+    if (loading) loading.abort();
+    const controller = new AbortController();
+    loading = controller;
+    const params = new URLSearchParams({ q });
+    if (cursor) params.set('cursor', cursor);
+    fetch(`${url}?${params}`, { headers: { 'Accept': 'application/json' }, signal: controller.signal })
+      .then((r) => (r.ok ? r.json() : Promise.reject(r.status)))
+      .then((data) => {
+        next = data.next;
+        const items = data.items.map((o) => ({ value: String(o.id), label: o.name }));
+        if (cursor) {
+          choices.setChoices(items, 'value', 'label', false);
+        } else {
+          query = q;
+          choices.setChoices(q ? items : [blank, ...items], 'value', 'label', true);
+        }
+      })
+      .catch(() => {})
+      .finally(() => {
+        // Unless a newer request replaced this one, allow the next load
+        // (scrolling retries a page that failed)
+        if (loading === controller) loading = null;
+      });
+  };
+
+  el.addEventListener('showDropdown', () => {
+    if (query === null) load('', null);
+  });
+  el.addEventListener('hideDropdown', () => {
+    query = null;
+  });
+  el.addEventListener('search', (e) => {
+    clearTimeout(timer);
+    const q = e.detail.value.trim();
+    timer = setTimeout(() => load(q, null), 250);
+  });
+  choices.choiceList.element.addEventListener('scroll', (e) => {
+    const list = e.currentTarget;
+    if (next && !loading && list.scrollTop + list.clientHeight >= list.scrollHeight - 40) {
+      load(query, next);
+    }
   });
 }
 
@@ -42,8 +102,124 @@ function autoDismissAlerts() {
   });
 }
 
+function pollJobStatus() {
+  // Background job page: refresh once the job has finished
+  const el = document.querySelector('[data-job-status-url]');
+  if (!el) return;
+  const url = el.getAttribute('data-job-status-url');
+  const tick = () => {
+    fetch(url, { headers: { 'Accept': 'application/json' } })
+      .then((r) => r.json())
+      .then((job) => {
+        if (job.status === 'done' || job.status === 'failed') {
+          window.location.reload();
+        } else {
+          el.textContent = job.status;
+          setTimeout(tick, 2000);
+        }
+      })
+      .catch(() => setTimeout(tick, 5000));
+  };
+  setTimeout(tick, 1000);
+}
+
+function initLiveSearch() {
+  // Product typeahead: debounced, one request in flight, recent answers cached
+  const input = document.querySelector('input[data-live-search]');
+  if (!input) return;
+  const url = input.getAttribute('data-live-search');
+  const itemUrl = input.getAttribute('data-item-url').replace(/0$/, '');
+  const box = input.parentElement.querySelector('.live-search-results');
+  const cache = new Map();
+  const CACHE_SIZE = 50;
+  let timer = null;
+  let inflight = null;
+  let active = -1;
+
+  const render = (items) => {
+    box.replaceChildren();
+    active = -1;
+    if (!items.length) {
+      const empty = document.createElement('div');
+      empty.className = 'empty';
+      empty.textContent = 'No matches';
+      box.appendChild(empty);
+    }
+    items.forEach((item) => {
+      const a = document.createElement('a');
+      a.href = itemUrl + item.id;
+      const label = document.createElement('span');
+      label.textContent = `${item.name} · ${item.sku}`;
+      const stock = document.createElement('span');
+      stock.className = 'text-muted';
+      stock.textContent = item.stock;
+      a.append(label, stock);
+      box.appendChild(a);
+    });
+    box.hidden = false;
+  };
+
+  const lookup = (q) => {
+    if (cache.has(q)) {
+      const items = cache.get(q);
+      cache.delete(q);
+      cache.set(q, items);
+      return Promise.resolve(items);
+    }
+    if (inflight) inflight.abort();
+    inflight = new AbortController();
+    return fetch(`${url}?q=${encodeURIComponent(q)}`, { headers: { 'Accept': 'application/json' }, signal: inflight.signal })
+      .then((r) => (r.ok ? r.json() : Promise.reject(r.status)))
+      .then((data) => {
+        inflight = null;
+        cache.set(q, data.items);
+        if (cache.size > CACHE_SIZE) cache.delete(cache.keys().next().value);
+        return data.items;
+      });
+  };
+
+  input.addEventListener('input', () => {
+    clearTimeout(timer);
+    const q = input.value.trim();
+    if (!q) {
+      if (inflight) inflight.abort();
+      box.hidden = true;
+      return;
+    }
+    timer = setTimeout(() => {
+      lookup(q)
+        .then((items) => {
+          // Drop answers to a query the user has already typed past
+          if (input.value.trim() === q) render(items);
+        })
+        .catch(() => {});
+    }, 200);
+  });
+
+  input.addEventListener('keydown', (e) => {
+    const links = box.hidden ? [] : box.querySelectorAll('a');
+    if (e.key === 'Escape') {
+      box.hidden = true;
+    } else if ((e.key === 'ArrowDown' || e.key === 'ArrowUp') && links.length) {
+      e.preventDefault();
+      if (active >= 0) links[active].classList.remove('active');
+      active = (active + (e.key === 'ArrowDown' ? 1 : links.length - 1)) % links.length;
+      links[active].classList.add('active');
+    } else if (e.key === 'Enter' && active >= 0 && links[active]) {
+      e.preventDefault();
+      window.location.href = links[active].href;
+    }
+  });
+
+  document.addEventListener('click', (e) => {
+    if (!box.contains(e.target) && e.target !== input) box.hidden = true;
+  });
+}
+
 document.addEventListener('DOMContentLoaded', () => {
   initChoices();
   initConfirms();
   autoDismissAlerts();
+  pollJobStatus();
+  initLiveSearch();
 });
@@ -0,0 +1,82 @@
+"""Cached Flask-Login user loader.
+
+Flask-Login calls the user loader on every authenticated request. Instead
+of a `users` lookup each time, the loader keeps a small read-only
+`SessionUser` per user id in an LRU/TTL cache ("users" in
+/stats/cache.json), so steady-state requests run no auth queries.
+
+Session ids are "<user id>:<password version>" (see User.get_id) and every
+hit is checked against the cached user's password version. After a
+password change the worker that made it drops its entry, so sessions
+opened with the old password are signed out at once there; other workers
+sign them out when their cached copy expires (USER_CACHE_TTL), or at once
+if a session with the new password reaches them first.
+"""
+from flask_login import UserMixin
+
+from . import db
+from .cache import get_cache, register_cache
+from .models import User
+
+
+class SessionUser(UserMixin):
+    """What `current_user` needs for rendering and access checks.
+
+    Load the real `User` (db.session.get(User, current_user.id)) to change it.
+    """
+
+    def __init__(self, id, username, is_admin, password_version):
+        self.id = id
+        self.username = username
+        self.is_admin = is_admin
+        self.password_version = password_version
+
+    def get_id(self):
+        return f"{self.id}:{self.password_version}"
+
+
+def _parse_session_id(session_id):
+    user_id, _, version = str(session_id).partition(":")
+    try:
+        return int(user_id), version or None
+    except ValueError:
+        return None, None
+
+
+def _load(user_id):
+    user = db.session.get(User, user_id)
+    if user is None:
+        return None
+    return SessionUser(user.id, user.username, user.is_admin, user.password_version)
+
+
+def load_user(session_id):
+    user_id, version = _parse_session_id(session_id)
+    if user_id is None:
+        return None
+    cache = get_cache("users")
+    user = cache.get(user_id)
+    if user is None or (version is not None and version != user.password_version):
+        # Miss, or the password changed (here or in another worker) since
+        # the entry was cached: check the database.
+        user = _load(user_id)
+        if user is None:
+            cache.invalidate(user_id)
+            return None
+        cache.set(user_id, user)
+    # Sessions from before versioned ids carry no version; let them through
+    # -- the next login_user() stores a versioned id.
+    if version is not None and version != user.password_version:
+        return None
+    return user
+
+
+def forget(user_id):
+    """Drop a cached user after changing it in this worker."""
+    get_cache("users").invalidate(user_id)
+
+
+def init_app(app, login_manager):
+    app.config.setdefault("USER_CACHE_TTL", 300)
+    register_cache(app, "users", maxsize=1024, ttl=float(app.config["USER_CACHE_TTL"]))
+    login_manager.user_loader(load_user)
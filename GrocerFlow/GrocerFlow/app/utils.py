@@ -1,5 +1,24 @@
+from datetime import datetime
+
+# Values per IN (...) list: well under SQLite's bound-parameter limit
+IN_CHUNK = 500
+
+
 def currency(value):
     try:
         return f"{float(value):,.2f}"
     except Exception:
         return value
+
+def chunks(items, size=IN_CHUNK):
+    """Consecutive slices of the list `items`, each at most `size` long."""
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+def parse_date(value):
+    """Parse a YYYY-MM-DD query-string value; returns None when blank or invalid."""
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value.strip(), "%Y-%m-%d")
+    except ValueError:
+        return None
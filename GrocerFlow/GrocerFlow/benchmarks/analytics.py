@@ -0,0 +1,97 @@
+"""Time the reorder analysis over a large synthetic catalogue and ledger.
+
+    python benchmarks/analytics.py --products 50000 --days 730 --density 0.1
+
+Seeds a fresh SQLite database with `--products` SKUs and, for each product
+and day, a Stock Out with probability `--density` (bulk inserts), then
+times app.analytics.compute() for each `--window`. Prints JSON.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+INSERT_CHUNK = 50000
+
+
+def _make_app(db_path):
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    from app import create_app
+    return create_app()
+
+
+def _seed(products, days, density, seed):
+    from sqlalchemy import insert
+    from app import db
+    from app.locations import first_location_id
+    from app.models import Product, StockTransaction
+    rng = random.Random(seed)
+    location_id = first_location_id(db.session)
+    db.session.execute(insert(Product.__table__), [
+        {"name": f"Item {i:06d}", "sku": f"A-{i:06d}", "unit": "pcs", "price": 1.0,
+         "reorder_level": 10, "stock": rng.randint(0, 200), "is_low": False}
+        for i in range(products)
+    ])
+    ids = [pid for (pid,) in db.session.execute(db.select(Product.id))]
+    now = datetime.utcnow()
+    chunk, count = [], 0
+    for d in range(days):
+        day = now - timedelta(days=d)
+        for pid in ids:
+            if rng.random() < density:
+                chunk.append({"product_id": pid, "location_id": location_id, "tx_type": "OUT", "quantity": rng.randint(1, 6), "tx_date": day})
+        if len(chunk) >= INSERT_CHUNK:
+            db.session.execute(insert(StockTransaction.__table__), chunk)
+            count += len(chunk)
+            chunk = []
+    if chunk:
+        db.session.execute(insert(StockTransaction.__table__), chunk)
+        count += len(chunk)
+    db.session.commit()
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--products", type=int, default=50000)
+    parser.add_argument("--days", type=int, default=730)
+    parser.add_argument("--density", type=float, default=0.1, help="chance of a Stock Out per product per day")
+    parser.add_argument("--window", type=int, action="append", help="repeatable; default: 28 and --days")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    from app import schema
+    from app.analytics import compute
+    with tempfile.TemporaryDirectory() as tmp:
+        app = _make_app(os.path.join(tmp, "analytics.db"))
+        with app.app_context():
+            schema.upgrade()
+            started = time.perf_counter()
+            tx_count = _seed(args.products, args.days, args.density, args.seed)
+            seeded = time.perf_counter() - started
+            report = {
+                "products": args.products,
+                "days": args.days,
+                "transactions": tx_count,
+                "seed_seconds": round(seeded, 2),
+                "windows": {},
+            }
+            for window in args.window or (28, args.days):
+                started = time.perf_counter()
+                analysis = compute(window_days=window)
+                elapsed = time.perf_counter() - started
+                report["windows"][str(window)] = {
+                    "seconds": round(elapsed, 3),
+                    "needs_reorder": analysis.summary()["needs_reorder"],
+                }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
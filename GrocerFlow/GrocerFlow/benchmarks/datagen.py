@@ -0,0 +1,219 @@
+"""Generate a synthetic catalogue and ledger with bulk inserts.
+
+    python benchmarks/datagen.py /tmp/bench.db --products 100000 --transactions 5000000
+
+Categories, suppliers, products and stock transactions are written in
+chunks of bulk INSERTs with the search triggers dropped (the index is
+rebuilt once at the end); the random columns are drawn with NumPy a chunk
+at a time, so tens of millions of ledger rows take minutes, not hours.
+Product popularity is skewed (a few SKUs get most of the traffic),
+transactions are spread over `--days` days, and each product's stock is
+a non-negative opening balance plus its ledger sum. Everything is held at
+the default location. The same `--seed` always produces the same data.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CHUNK = 50000
+TX_INSERT = (
+    "INSERT INTO stock_transactions (product_id, location_id, tx_type, quantity, reference, tx_date, created_at, updated_at) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+)
+CATEGORY_WORDS = ["Dairy", "Bakery", "Produce", "Meat", "Seafood", "Frozen", "Pantry", "Snacks", "Beverages", "Household",
+                  "Baby", "Pet", "Health", "Beauty", "Deli", "Spices", "Canned", "Cereal", "Pasta", "Sauces"]
+PRODUCT_WORDS = ["Organic", "Fresh", "Classic", "Whole", "Light", "Crunchy", "Golden", "Smoked", "Sweet", "Spicy",
+                 "Milk", "Bread", "Apples", "Cheese", "Rice", "Beans", "Coffee", "Tea", "Juice", "Soap",
+                 "Yogurt", "Butter", "Eggs", "Chicken", "Salmon", "Pasta", "Flour", "Sugar", "Honey", "Oats"]
+UNITS = ["pcs", "kg", "g", "L", "ml", "pack", "box", "bottle"]
+
+
+def make_app(db_path, bootstrap=False):
+    """App on `db_path`; with `bootstrap`, also what `flask bootstrap` does."""
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.abspath(db_path)}"
+    from app import create_app
+    app = create_app()
+    if bootstrap:
+        from app import schema
+        from app.seed import ensure_default_admin
+        with app.app_context():
+            schema.upgrade()
+            ensure_default_admin()
+    return app
+
+
+def _sql_datetime(values):
+    """datetime64 array -> the text SQLAlchemy stores for DateTime on SQLite."""
+    return np.char.replace(np.datetime_as_string(values, unit="us"), "T", " ").tolist()
+
+
+def _drop_search_triggers():
+    # FTS5 triggers make each insert several times slower; the index is
+    # rebuilt in one pass at the end instead.
+    from app import db, search
+    if not isinstance(search.current_backend(), search.SQLiteFTSBackend):
+        return
+    for index in search.INDEXES:
+        fts = search.SQLiteFTSBackend.fts_table(index)
+        for suffix in ("ai", "ad", "au"):
+            db.session.execute(db.text(f"DROP TRIGGER IF EXISTS {fts}_{suffix}"))
+        db.session.execute(db.text(f"DROP TABLE IF EXISTS {fts}"))
+
+
+def _insert(table, rows):
+    from app import db
+    db.session.execute(table.insert(), rows)
+
+
+def generate(products=10000, categories=None, suppliers=None, transactions=100000, days=365, seed=1, echo=print) -> dict:
+    """Fill the current app's (empty, SQLite) database; returns row counts and timings."""
+    from app import db, search
+    from app.locations import first_location_id, open_default_balances
+    from app.models import Category, Product, Supplier, compute_is_low
+
+    rng = np.random.default_rng(seed)
+    categories = categories or max(5, min(products // 200, 2000))
+    suppliers = suppliers or max(5, min(products // 500, 1000))
+    now = datetime.utcnow().replace(microsecond=0)
+    timings = {}
+    location_id = first_location_id(db.session)
+    _drop_search_triggers()
+
+    started = time.perf_counter()
+    _insert(Category.__table__, [
+        {"name": f"{CATEGORY_WORDS[i % len(CATEGORY_WORDS)]} {i:05d}", "created_at": now, "updated_at": now}
+        for i in range(categories)
+    ])
+    _insert(Supplier.__table__, [
+        {"name": f"Supplier {i:05d}", "phone": f"555-{i:07d}", "email": f"orders{i}@supplier.test", "created_at": now, "updated_at": now}
+        for i in range(suppliers)
+    ])
+    cat_ids = np.array(db.session.execute(db.select(Category.id).order_by(Category.id)).scalars().all())
+    sup_ids = np.array(db.session.execute(db.select(Supplier.id).order_by(Supplier.id)).scalars().all())
+    timings["lookups_seconds"] = round(time.perf_counter() - started, 2)
+
+    # Zipf-ish popularity: transaction product picks follow these weights
+    popularity = 1.0 / np.arange(1, products + 1) ** 0.8
+    popularity /= popularity.sum()
+    net = np.zeros(products, dtype=np.int64)
+
+    started = time.perf_counter()
+    first_id = None
+    for lo in range(0, products, CHUNK):
+        hi = min(lo + CHUNK, products)
+        n = hi - lo
+        words = rng.integers(0, len(PRODUCT_WORDS), size=(n, 2))
+        price = np.round(rng.uniform(0.25, 80.0, n), 2)
+        reorder = rng.integers(0, 50, n)
+        cat = cat_ids[rng.integers(0, cat_ids.size, n)]
+        sup = sup_ids[rng.integers(0, sup_ids.size, n)]
+        unit = rng.integers(0, len(UNITS), n)
+        _insert(Product.__table__, [
+            {
+                "name": f"{PRODUCT_WORDS[words[i, 0]]} {PRODUCT_WORDS[words[i, 1]]} {lo + i:07d}",
+                "sku": f"GEN-{lo + i:07d}",
+                "unit": UNITS[unit[i]],
+                "price": float(price[i]),
+                "reorder_level": int(reorder[i]),
+                "stock": 0,
+                "is_low": bool(reorder[i] > 0),
+                "category_id": int(cat[i]),
+                "supplier_id": int(sup[i]),
+                "created_at": now - timedelta(days=days),
+                "updated_at": now,
+            }
+            for i in range(n)
+        ])
+        if first_id is None:
+            first_id = db.session.execute(db.select(db.func.min(Product.id))).scalar()
+    timings["products_seconds"] = round(time.perf_counter() - started, 2)
+
+    started = time.perf_counter()
+    span = days * 86400
+    start = np.datetime64(now - timedelta(seconds=span), "s")
+    stamp = _sql_datetime(np.array([now], dtype="datetime64[s]"))[0]
+    conn = db.session.connection()
+    for lo in range(0, transactions, CHUNK):
+        n = min(CHUNK, transactions - lo)
+        idx = rng.choice(products, size=n, p=popularity)
+        is_out = rng.random(n) < 0.6
+        qty = rng.integers(1, 12, n)
+        qty[~is_out] *= 4
+        np.add.at(net, idx, np.where(is_out, -qty, qty))
+        dates = _sql_datetime(start + np.sort(rng.integers(0, span, n)))
+        # Straight to the driver: the rows are already in storage format, and
+        # this is by far the biggest table.
+        conn.exec_driver_sql(TX_INSERT, list(zip(
+            (idx + first_id).tolist(),
+            [location_id] * n,
+            np.where(is_out, "OUT", "IN").tolist(),
+            qty.tolist(),
+            [f"GEN-{i}" for i in range(lo, lo + n)],
+            dates,
+            [stamp] * n,
+            [stamp] * n,
+        )))
+        if echo and (lo // CHUNK) % 20 == 19:
+            echo(f"  {lo + n:,} transactions")
+    timings["transactions_seconds"] = round(time.perf_counter() - started, 2)
+
+    # Closing stock = a non-negative opening balance + the ledger sum.
+    started = time.perf_counter()
+    closing = rng.integers(0, 400, products) + np.maximum(net, 0)
+    reorder = np.array(db.session.execute(db.select(Product.reorder_level).order_by(Product.id)).scalars().all())
+    table = Product.__table__
+    stmt = table.update().where(table.c.id == db.bindparam("pid")).values(stock=db.bindparam("new_stock"), is_low=db.bindparam("new_is_low"))
+    for lo in range(0, products, CHUNK):
+        hi = min(lo + CHUNK, products)
+        db.session.execute(stmt, [
+            {"pid": first_id + i, "new_stock": int(closing[i]), "new_is_low": compute_is_low(int(closing[i]), int(reorder[i]))}
+            for i in range(lo, hi)
+        ])
+    open_default_balances(db.session, location_id)
+    db.session.commit()
+    timings["stock_seconds"] = round(time.perf_counter() - started, 2)
+
+    started = time.perf_counter()
+    search.rebuild()
+    timings["search_index_seconds"] = round(time.perf_counter() - started, 2)
+
+    return {
+        "products": products,
+        "categories": categories,
+        "suppliers": suppliers,
+        "transactions": transactions,
+        "days": days,
+        "seed": seed,
+        "timings": timings,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("db", help="SQLite file to create (must not exist)")
+    parser.add_argument("--products", type=int, default=10000)
+    parser.add_argument("--categories", type=int)
+    parser.add_argument("--suppliers", type=int)
+    parser.add_argument("--transactions", type=int, default=100000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    if os.path.exists(args.db):
+        parser.error(f"{args.db} already exists")
+
+    app = make_app(args.db, bootstrap=True)
+    with app.app_context():
+        report = generate(args.products, args.categories, args.suppliers, args.transactions, args.days, args.seed,
+                          echo=lambda msg: print(msg, file=sys.stderr))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+"""Load-test the main pages against a generated dataset.
+
+    python benchmarks/load.py --products 100000 --transactions 2000000
+    python benchmarks/load.py --db /tmp/bench.db --mode server --concurrency 8 --output run.json
+    python benchmarks/load.py --db /tmp/bench.db --compare run.json
+
+Without --db a throwaway database is filled by datagen.py first. Each
+scenario then runs in a fresh process (so its peak RSS is its own):
+`--concurrency` threads, each logged in as --username, send requests
+through the Flask test client (`--mode client`) or over HTTP to a local
+threaded WSGI server (`--mode server`) and read every response to its
+last byte. Prints JSON with p50/p95/p99 latency, throughput, errors and
+peak RSS per scenario, tagged with the git commit; --compare adds the
+ratio to an earlier run's figures.
+
+The product_transaction scenario writes Stock In/Out rows to the
+database, so it runs last.
+"""
+import argparse
+import http.client
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import datagen  # noqa: E402
+
+WORDS = ["Milk", "Bread", "Cheese", "Coffee", "Organic", "Fresh", "Rice", "Juice"]
+
+
+def _dashboard(rng, ids):
+    return "GET", "/dashboard", None
+
+
+def _products(rng, ids):
+    return "GET", "/products?" + rng.choice(["", "low=1", urlencode({"q": rng.choice(WORDS)}), "per_page=100"]), None
+
+
+def _transactions(rng, ids):
+    return "GET", "/transactions?" + rng.choice(["", "type=OUT", "type=IN", urlencode({"q": f"GEN-{rng.randrange(1000)}"})]), None
+
+
+def _product_transaction(rng, ids):
+    tx_type = rng.choice(("IN", "OUT"))
+    return "POST", f"/products/{rng.choice(ids)}/transaction", {"tx_type": tx_type, "quantity": "1", "reference": "LOAD"}
+
+
+def _export_inventory(rng, ids):
+    return "GET", "/export/inventory.csv", None
+
+
+def _export_transactions(rng, ids):
+    return "GET", "/export/transactions.csv?type=OUT", None
+
+
+# name -> (request factory, whether it counts as an export for --export-requests)
+SCENARIOS = {
+    "dashboard": (_dashboard, False),
+    "products": (_products, False),
+    "transactions": (_transactions, False),
+    "export_inventory": (_export_inventory, True),
+    "export_transactions": (_export_transactions, True),
+    "product_transaction": (_product_transaction, False),
+}
+
+
+class TestClientSession:
+    def __init__(self, app, username, password):
+        self.client = app.test_client()
+        self.request("POST", "/auth/login", {"username": username, "password": password})
+
+    def request(self, method, url, data):
+        response = self.client.open(url, method=method, data=data)
+        body = response.get_data()
+        response.close()
+        return response.status_code, len(body)
+
+
+class HTTPSession:
+    def __init__(self, port, username, password):
+        self.port = port
+        self.cookie = ""
+        self.request("POST", "/auth/login", {"username": username, "password": password})
+
+    def request(self, method, url, data):
+        conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=600)
+        headers = {"Cookie": self.cookie} if self.cookie else {}
+        body = None
+        if data is not None:
+            body = urlencode(data)
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        conn.request(method, url, body=body, headers=headers)
+        response = conn.getresponse()
+        size = len(response.read())
+        cookie = response.getheader("Set-Cookie")
+        if cookie:
+            self.cookie = cookie.split(";", 1)[0]
+        conn.close()
+        return response.status, size
+
+
+def _peak_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def run_scenario(db_path, name, mode, concurrency, requests, username, password, seed):
+    """Runs in its own process; returns the scenario's figures."""
+    from app.models import Product
+    app = datagen.make_app(db_path)
+    app.config["WTF_CSRF_ENABLED"] = False
+    with app.app_context():
+        ids = [pid for (pid,) in Product.query.with_entities(Product.id).order_by(Product.id).limit(1000)]
+    boot_rss = _peak_rss_mb()
+
+    server = None
+    if mode == "server":
+        from werkzeug.serving import make_server
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)
+        server = make_server("127.0.0.1", 0, app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        sessions = [HTTPSession(server.server_port, username, password) for _ in range(concurrency)]
+    else:
+        sessions = [TestClientSession(app, username, password) for _ in range(concurrency)]
+
+    factory = SCENARIOS[name][0]
+    latencies, errors, sizes = [], [], []
+    lock = threading.Lock()
+    remaining = [requests]
+
+    def worker(n):
+        rng = random.Random(seed * 1000 + n)
+        session = sessions[n]
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            method, url, data = factory(rng, ids)
+            started = time.perf_counter()
+            status, size = session.request(method, url, data)
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                sizes.append(size)
+                # Form posts answer with a redirect back to the page
+                if status >= 400 or (method == "GET" and status != 200):
+                    errors.append(status)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+    if server is not None:
+        server.shutdown()
+
+    ms = np.array(latencies) * 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "p50_ms": round(float(p50), 2),
+        "p95_ms": round(float(p95), 2),
+        "p99_ms": round(float(p99), 2),
+        "mean_ms": round(float(ms.mean()), 2),
+        "max_ms": round(float(ms.max()), 2),
+        "throughput_rps": round(len(latencies) / wall, 2),
+        "mean_response_bytes": int(np.mean(sizes)),
+        "boot_rss_mb": boot_rss,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def git_commit():
+    try:
+        root = os.path.dirname(os.path.abspath(__file__))
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=root, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=root, capture_output=True, text=True).stdout.strip()
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _dataset(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                for table in ("products", "categories", "suppliers", "stock_transactions")}
+    finally:
+        conn.close()
+
+
+def _compare(report, baseline):
+    """Ratios current / baseline; below 1 is better for latency, above 1 for throughput."""
+    changes = {}
+    for name, figures in report["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name)
+        if not before:
+            continue
+        changes[name] = {
+            key: round(figures[key] / before[key], 3)
+            for key in ("p50_ms", "p95_ms", "p99_ms", "throughput_rps", "peak_rss_mb")
+            if before.get(key)
+        }
+    return {"commit": baseline.get("commit"), "ratios": changes}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", help="existing database (e.g. from datagen.py); default: generate a throwaway one")
+    parser.add_argument("--products", type=int, default=10000)
+    parser.add_argument("--transactions", type=int, default=200000)
+    parser.add_argument("--mode", choices=("client", "server"), default="client")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=200, help="per page scenario")
+    parser.add_argument("--export-requests", type=int, default=5, help="per export scenario")
+    parser.add_argument("--scenario", choices=list(SCENARIOS), action="append", help="repeatable; default: all")
+    parser.add_argument("--username", default="admin")
+    parser.add_argument("--password", default="admin123")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="also write the JSON report here")
+    parser.add_argument("--compare", help="earlier JSON report to compare against")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = args.db
+        generated = None
+        if not db_path:
+            db_path = os.path.join(tmp, "load.db")
+            ctx = multiprocessing.get_context("spawn")
+            with ctx.Pool(1) as pool:
+                generated = pool.apply(_generate, (db_path, args.products, args.transactions, args.seed))
+
+        report = {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "mode": args.mode,
+            "concurrency": args.concurrency,
+            "dataset": _dataset(db_path),
+            "generated": generated,
+            "scenarios": {},
+        }
+        # Keep the declared order so the writing scenario stays last
+        chosen = [name for name in SCENARIOS if not args.scenario or name in args.scenario]
+        ctx = multiprocessing.get_context("spawn")
+        for name in chosen:
+            requests = args.export_requests if SCENARIOS[name][1] else args.requests
+            with ctx.Pool(1) as pool:
+                report["scenarios"][name] = pool.apply(run_scenario, (
+                    db_path, name, args.mode, args.concurrency, requests, args.username, args.password, args.seed,
+                ))
+            print(f"{name}: {report['scenarios'][name]['p95_ms']} ms p95", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare) as fh:
+            report["compare"] = _compare(report, json.load(fh))
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as fh:
+            fh.write(text + "\n")
+    print(text)
+
+
+def _generate(db_path, products, transactions, seed):
+    app = datagen.make_app(db_path, bootstrap=True)
+    with app.app_context():
+        return datagen.generate(products=products, transactions=transactions, seed=seed, echo=None)
+
+
+if __name__ == "__main__":
+    main()
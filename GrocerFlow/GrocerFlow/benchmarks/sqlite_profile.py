@@ -0,0 +1,154 @@
+"""Compare read/write throughput with each DB_PROFILE on SQLite.
+
+    python benchmarks/sqlite_profile.py --readers 4 --writers 4 --seconds 10
+
+For every profile a fresh database is seeded, then reader processes page
+through the product list while writer processes record stock
+transactions, all at once for a fixed time -- roughly what several
+gunicorn workers do. Every process boots the app first and waits at a
+barrier, so the clock starts when all of them are ready; rates are each
+process's operations over the time it actually ran. Prints reads/s,
+writes/s and the number of operations that still failed with "database
+is locked" as JSON.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PROFILES = ("default", "production")
+# Seconds to wait for every process to boot
+BOOT_TIMEOUT = 300
+
+
+def _make_app(db_path, profile):
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ["DB_PROFILE"] = profile
+    from app import create_app
+    return create_app()
+
+
+def _seed(db_path, profile, products):
+    from sqlalchemy import insert
+    from app import db, schema
+    from app.locations import first_location_id, open_default_balances
+    from app.models import Product
+    app = _make_app(db_path, profile)
+    with app.app_context():
+        schema.upgrade()
+        db.session.execute(insert(Product.__table__), [
+            {"name": f"Item {i:06d}", "sku": f"B-{i:06d}", "unit": "pcs", "price": 1.0,
+             "reorder_level": 5, "stock": 1000, "is_low": False}
+            for i in range(products)
+        ])
+        open_default_balances(db.session, first_location_id(db.session))
+        db.session.commit()
+
+
+def _reader(db_path, profile, seconds, seed, start):
+    from sqlalchemy.exc import OperationalError
+    from app.pagination import keyset_paginate
+    from app.queries import PRODUCT_KEYS, product_list_query
+    app = _make_app(db_path, profile)
+    done = failed = 0
+    with app.app_context():
+        cursor = None
+        started = start()
+        while time.perf_counter() - started < seconds:
+            try:
+                page = keyset_paginate(product_list_query(), PRODUCT_KEYS, cursor, 50)
+                cursor = page.next_cursor
+                done += 1
+            except OperationalError:
+                failed += 1
+    return "read", done, failed, time.perf_counter() - started
+
+
+def _writer(db_path, profile, seconds, seed, start):
+    from sqlalchemy.exc import OperationalError
+    from app.ledger import InsufficientStock, record_transaction
+    from app.models import Product
+    app = _make_app(db_path, profile)
+    rng = random.Random(seed)
+    done = failed = 0
+    with app.app_context():
+        ids = [pid for (pid,) in Product.query.with_entities(Product.id).limit(200)]
+        started = start()
+        while time.perf_counter() - started < seconds:
+            try:
+                record_transaction(rng.choice(ids), rng.choice(("IN", "OUT")), rng.randint(1, 3))
+                done += 1
+            except InsufficientStock:
+                done += 1
+            except OperationalError:
+                failed += 1
+    return "write", done, failed, time.perf_counter() - started
+
+
+def _run(worker, args, barrier, results):
+    def start():
+        # Booted: wait for the others, then start the clock
+        barrier.wait(BOOT_TIMEOUT)
+        return time.perf_counter()
+    results.put(worker(*args, start=start))
+
+
+def bench(profile, readers, writers, seconds, products):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        _seed(db_path, profile, products)
+        ctx = multiprocessing.get_context("spawn")
+        barrier, queue = ctx.Barrier(readers + writers), ctx.Queue()
+        jobs = [(_reader, (db_path, profile, seconds, n)) for n in range(readers)]
+        jobs += [(_writer, (db_path, profile, seconds, n)) for n in range(writers)]
+        procs = [ctx.Process(target=_run, args=(worker, args, barrier, queue)) for worker, args in jobs]
+        for proc in procs:
+            proc.start()
+        results = []
+        for proc in procs:
+            # Read before joining: a process with unread queue data doesn't exit
+            results.append(queue.get(timeout=BOOT_TIMEOUT + seconds * 10))
+        for proc in procs:
+            proc.join()
+            if proc.exitcode:
+                raise SystemExit(f"benchmark process exited with {proc.exitcode}")
+    totals = {"read": [0.0, 0], "write": [0.0, 0]}
+    for kind, done, failed, elapsed in results:
+        totals[kind][0] += done / elapsed
+        totals[kind][1] += failed
+    return {
+        "reads_per_second": round(totals["read"][0], 1),
+        "writes_per_second": round(totals["write"][0], 1),
+        "failed_reads": totals["read"][1],
+        "failed_writes": totals["write"][1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--products", type=int, default=20000)
+    parser.add_argument("--profile", choices=PROFILES, action="append", help="repeatable; default: all")
+    args = parser.parse_args()
+    report = {
+        "readers": args.readers,
+        "writers": args.writers,
+        "seconds": args.seconds,
+        "products": args.products,
+        "profiles": {},
+    }
+    for profile in args.profile or PROFILES:
+        report["profiles"][profile] = bench(profile, args.readers, args.writers, args.seconds, args.products)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
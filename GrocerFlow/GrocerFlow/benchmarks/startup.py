@@ -0,0 +1,153 @@
+"""Measure worker start-up: time from process start to the first answered request.
+
+    python benchmarks/startup.py --workers 8 --rounds 5
+    python benchmarks/startup.py --db /tmp/bench.db --output boot.json --compare old.json
+
+Each round starts --workers fresh Python processes at once, as a process
+manager (gunicorn, uWSGI) does after a deploy or restart. Every worker
+imports the app package, calls create_app() and serves one request
+(--url through the test client), timing each phase; the parent also
+measures the wall time from spawning the process to that response, which
+includes interpreter start-up and contention between the workers. Prints
+JSON with p50/p95/max per phase, tagged with the git commit like load.py;
+--compare adds the ratio to an earlier run's figures.
+
+Without --db a small throwaway database is generated (and bootstrapped)
+first. Workers only import the standard library before the app, so that
+NumPy, which this script's parent uses, is not preloaded for them.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PHASES = ("import_seconds", "create_app_seconds", "first_request_seconds", "time_to_first_request_seconds")
+
+
+def child(db_path, url):
+    """One worker; prints its figures as a JSON line."""
+    started = time.perf_counter()
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.abspath(db_path)}"
+    sys.path.insert(0, ROOT)
+    from app import create_app
+    imported = time.perf_counter()
+    app = create_app()
+    created = time.perf_counter()
+    response = app.test_client().get(url)
+    response.get_data()
+    answered = time.perf_counter()
+    print(json.dumps({
+        "ready_at": time.time(),
+        "status": response.status_code,
+        "import_seconds": imported - started,
+        "create_app_seconds": created - imported,
+        "first_request_seconds": answered - created,
+        "modules": len(sys.modules),
+        "numpy_loaded": "numpy" in sys.modules,
+        # KiB on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }))
+
+
+def run_round(db_path, workers, url):
+    procs = []
+    for _ in range(workers):
+        spawned = time.time()
+        proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--child", db_path, "--url", url],
+                                stdout=subprocess.PIPE, text=True)
+        procs.append((spawned, proc))
+    results = []
+    for spawned, proc in procs:
+        out, _ = proc.communicate()
+        if proc.returncode:
+            raise SystemExit(f"worker exited with {proc.returncode}")
+        figures = json.loads(out.strip().splitlines()[-1])
+        figures["time_to_first_request_seconds"] = figures.pop("ready_at") - spawned
+        results.append(figures)
+    return results
+
+
+def _summary(samples):
+    import numpy as np
+    report = {}
+    for phase in PHASES:
+        ms = np.array([s[phase] for s in samples]) * 1000
+        p50, p95 = np.percentile(ms, [50, 95])
+        report[phase.replace("_seconds", "_ms")] = {
+            "p50": round(float(p50), 1), "p95": round(float(p95), 1), "max": round(float(ms.max()), 1),
+        }
+    return report
+
+
+def _compare(report, baseline):
+    """p50 ratios current / baseline; below 1 is faster."""
+    ratios = {}
+    for phase, figures in report["phases"].items():
+        before = baseline.get("phases", {}).get(phase, {}).get("p50")
+        if before:
+            ratios[phase] = round(figures["p50"] / before, 3)
+    return {"commit": baseline.get("commit"), "ratios": ratios}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", help="existing, migrated database; default: generate a throwaway one")
+    parser.add_argument("--workers", type=int, default=4, help="processes started at once per round")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--url", default="/auth/login", help="first request each worker serves")
+    parser.add_argument("--output", help="also write the JSON report here")
+    parser.add_argument("--compare", help="earlier JSON report to compare against")
+    parser.add_argument("--child", metavar="DB", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.child, args.url)
+        return
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import datagen
+    import load
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = args.db
+        if not db_path:
+            db_path = os.path.join(tmp, "startup.db")
+            app = datagen.make_app(db_path, bootstrap=True)
+            with app.app_context():
+                datagen.generate(products=1000, transactions=10000, echo=None)
+        # Warm the OS file cache so the first round isn't an outlier
+        run_round(db_path, 1, args.url)
+        samples = []
+        for n in range(args.rounds):
+            samples.extend(run_round(db_path, args.workers, args.url))
+            print(f"round {n + 1}: {max(s['time_to_first_request_seconds'] for s in samples[-args.workers:]) * 1000:.0f} ms slowest",
+                  file=sys.stderr)
+
+    report = {
+        "commit": load.git_commit(),
+        "python": sys.version.split()[0],
+        "workers": args.workers,
+        "rounds": args.rounds,
+        "url": args.url,
+        "statuses": sorted({s["status"] for s in samples}),
+        "modules": max(s["modules"] for s in samples),
+        "numpy_loaded": any(s["numpy_loaded"] for s in samples),
+        "peak_rss_mb": max(s["peak_rss_mb"] for s in samples),
+        "phases": _summary(samples),
+    }
+    if args.compare:
+        with open(args.compare) as fh:
+            report["compare"] = _compare(report, json.load(fh))
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as fh:
+            fh.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
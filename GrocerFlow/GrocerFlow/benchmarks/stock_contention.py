@@ -0,0 +1,132 @@
+"""Hammer one product from many threads or processes and check the ledger.
+
+    python benchmarks/stock_contention.py --workers 8 --ops 250 --mode processes
+
+Every worker records random Stock In / Stock Out transactions (single and
+small batches) against the same SKU. At the end the product's stock must
+equal its opening stock plus the ledger sum and its location balance, and
+must never be negative; the script exits non-zero otherwise. Throughput is printed as JSON.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SKU = "CONTENDED-1"
+OPENING_STOCK = 50
+
+
+def _make_app(db_path):
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    from app import create_app
+    return create_app()
+
+
+def _setup(db_path):
+    from app import db, schema
+    from app.locations import first_location_id, open_default_balances
+    from app.models import Product
+    app = _make_app(db_path)
+    with app.app_context():
+        schema.upgrade()
+        db.session.add(Product(name="Contended item", sku=SKU, unit="pcs", price=1, reorder_level=10, stock=OPENING_STOCK))
+        db.session.flush()
+        open_default_balances(db.session, first_location_id(db.session))
+        db.session.commit()
+
+
+def _worker(db_path, ops, seed, app=None):
+    from app.ledger import InsufficientStock, apply_batch, record_transaction
+    from app.models import Product
+    app = app or _make_app(db_path)
+    rng = random.Random(seed)
+    refused = 0
+    with app.app_context():
+        prod_id = Product.query.filter_by(sku=SKU).one().id
+        for i in range(ops):
+            tx_type = "OUT" if rng.random() < 0.55 else "IN"
+            qty = rng.randint(1, 5)
+            if i % 10 == 9:
+                lines = [{"sku": SKU, "tx_type": rng.choice(("IN", "OUT")), "quantity": rng.randint(1, 3)} for _ in range(5)]
+                refused += len(apply_batch(lines).errors)
+                continue
+            try:
+                record_transaction(prod_id, tx_type, qty, reference=f"w{seed}-{i}")
+            except InsufficientStock:
+                refused += 1
+    return refused
+
+
+def _verify(db_path):
+    from app import db
+    from app.models import Product
+    app = _make_app(db_path)
+    with app.app_context():
+        product = Product.query.filter_by(sku=SKU).one()
+        ledger = db.session.execute(db.text(
+            "SELECT COALESCE(SUM(CASE WHEN tx_type = 'IN' THEN quantity ELSE -quantity END), 0), COUNT(*) "
+            "FROM stock_transactions WHERE product_id = :p"
+        ), {"p": product.id}).one()
+        balance = db.session.execute(db.text(
+            "SELECT COALESCE(SUM(quantity), 0) FROM stock_balances WHERE product_id = :p"
+        ), {"p": product.id}).scalar()
+        return product.stock, OPENING_STOCK + ledger[0], balance, ledger[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--ops", type=int, default=200, help="operations per worker")
+    parser.add_argument("--mode", choices=("threads", "processes"), default="processes")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "contention.db")
+        _setup(db_path)
+        started = time.perf_counter()
+        if args.mode == "processes":
+            ctx = multiprocessing.get_context("spawn")
+            with ctx.Pool(args.workers) as pool:
+                refused = sum(pool.starmap(_worker, [(db_path, args.ops, n) for n in range(args.workers)]))
+        else:
+            app = _make_app(db_path)
+            results = [0] * args.workers
+
+            def run(n):
+                results[n] = _worker(db_path, args.ops, n, app=app)
+
+            threads = [threading.Thread(target=run, args=(n,)) for n in range(args.workers)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            refused = sum(results)
+        elapsed = time.perf_counter() - started
+
+        stock, expected, balance, tx_count = _verify(db_path)
+        ok = stock == expected == balance and stock >= 0
+        print(json.dumps({
+            "mode": args.mode,
+            "workers": args.workers,
+            "ops": args.workers * args.ops,
+            "seconds": round(elapsed, 3),
+            "ops_per_second": round(args.workers * args.ops / elapsed, 1),
+            "transactions": tx_count,
+            "refused_for_stock": refused,
+            "stock": stock,
+            "opening_plus_ledger": expected,
+            "location_balance": balance,
+            "consistent": ok,
+        }, indent=2))
+        sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Shared fixtures: a migrated SQLite database with a few rows, and apps on it.
+
+`database` is built once per run and must not be written to; tests that
+write use `app` (or `client`), which works on a private copy of it.
+"""
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db  # noqa: E402
+
+PRODUCTS = (("Banana", "FRU-BAN"), ("Apple", "FRU-APP"), ("Cherry", "FRU-CHE"), ("Pineapple", "FRU-PIN"))
+
+
+def _make_app(db_path, **config):
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{db_path}",
+        "QUERY_BUDGET": "strict",
+        "JOB_WORKERS": "0",
+    })
+    app = create_app()
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False, **config)
+    # Job files and the like go next to the test database, not into instance/
+    app.instance_path = os.path.dirname(db_path)
+    return app
+
+
+@pytest.fixture(scope="session")
+def make_app():
+    """A fresh app (cold caches, like a new worker) on the given database."""
+    return _make_app
+
+
+@pytest.fixture(scope="session")
+def database(tmp_path_factory):
+    """(db path, id of the "Banana" product) of a migrated, seeded database."""
+    from app import schema
+    from app.ledger import record_transaction
+    from app.models import Category, Product, Supplier
+    from app.seed import ensure_default_admin
+
+    db_path = tmp_path_factory.mktemp("grocerflow") / "test.db"
+    app = _make_app(db_path)
+    with app.app_context():
+        schema.upgrade()
+        ensure_default_admin()
+        fruit, acme = Category(name="Fruit"), Supplier(name="Acme Foods")
+        db.session.add_all([fruit, acme])
+        products = [
+            Product(name=name, sku=sku, unit="kg", price=1.5, reorder_level=5, stock=0, category=fruit, supplier=acme)
+            for name, sku in PRODUCTS
+        ]
+        db.session.add_all(products)
+        db.session.commit()
+        for product in products:
+            record_transaction(product.id, "IN", 10, reference="ban-delivery")
+        record_transaction(products[0].id, "OUT", 7)
+        product_id = products[0].id
+    return db_path, product_id
+
+
+@pytest.fixture
+def app(make_app, database, tmp_path):
+    """An app, inside its app context, on this test's own copy of `database`."""
+    copy = tmp_path / "test.db"
+    source, target = sqlite3.connect(database[0]), sqlite3.connect(copy)
+    try:
+        source.backup(target)
+    finally:
+        source.close()
+        target.close()
+    app = make_app(copy)
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    """A test client of `app`, logged in as the default admin."""
+    client = app.test_client()
+    client.post("/auth/login", data={"username": "admin", "password": "admin123"})
+    return client
@@ -0,0 +1,21 @@
+"""Reorder analysis when the ledger has moved on since the catalogue was read."""
+from app import analytics
+from app.ledger import record_transaction
+
+
+def test_history_of_a_product_missing_from_the_catalogue_is_skipped(app, monkeypatch):
+    last_id = int(analytics.compute().ids[-1])
+    record_transaction(last_id, "OUT", 2)
+    full = analytics.compute()
+    assert full.avg_daily[-1] > 0
+    read_catalogue = analytics._catalogue
+
+    def without_last_product():
+        # As if the last product and its Stock Out were created between the reads
+        ids, skus, names, stock, reorder_level = read_catalogue()
+        return ids[:-1], skus[:-1], names[:-1], stock[:-1], reorder_level[:-1]
+
+    monkeypatch.setattr(analytics, "_catalogue", without_last_product)
+    partial = analytics.compute()
+    assert partial.ids.tolist() == full.ids[:-1].tolist()
+    assert partial.avg_daily.tolist() == full.avg_daily[:-1].tolist()
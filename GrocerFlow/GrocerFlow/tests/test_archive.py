@@ -0,0 +1,96 @@
+"""Ledger archival: partitions, opening balances and reads across them."""
+from datetime import datetime
+
+from sqlalchemy import update
+
+from app import archive, db
+from app.ledger import record_transaction
+from app.models import LedgerArchive, OpeningBalance, Product, StockTransaction, signed_quantity
+
+# Ledger rows of the seeded database in insertion order, redated into the past;
+# Banana's Stock Out is the newest row and stays behind
+DATES = {
+    "FRU-BAN": {"IN": datetime(2023, 8, 1), "OUT": datetime(2023, 6, 1)},
+    "FRU-APP": {"IN": datetime(2022, 3, 1)},
+    "FRU-CHE": {"IN": datetime(2022, 7, 1)},
+    "FRU-PIN": {"IN": datetime(2023, 2, 1)},
+}
+CUTOFF = datetime(2024, 1, 1)
+
+
+def _ids():
+    return dict(db.session.execute(db.select(Product.sku, Product.id)).all())
+
+
+def _redate():
+    tx = StockTransaction.__table__
+    for sku, pid in _ids().items():
+        for tx_type, day in DATES[sku].items():
+            db.session.execute(update(tx).where(tx.c.product_id == pid, tx.c.tx_type == tx_type).values(tx_date=day))
+    db.session.commit()
+
+
+def _opening(sku):
+    balance = db.session.get(OpeningBalance, _ids()[sku])
+    return balance.quantity, balance.as_of
+
+
+def test_opening_balance_is_dated_with_the_last_archived_row(app):
+    _redate()
+    assert archive.archive_before(CUTOFF) == 4
+    assert _opening("FRU-APP") == (10, datetime(2022, 3, 1))
+    assert _opening("FRU-BAN") == (10, datetime(2023, 8, 1))
+
+    # The held-back Stock Out goes with the next run without moving the date back
+    record_transaction(_ids()["FRU-APP"], "IN", 1)
+    assert archive.archive_before(datetime(2100, 1, 1)) == 1
+    db.session.expire_all()
+    assert _opening("FRU-BAN") == (3, datetime(2023, 8, 1))
+
+
+def test_old_rows_move_to_yearly_partitions(app):
+    _redate()
+    hot = StockTransaction.__table__
+    before = {r.id: dict(r._mapping) for r in db.session.execute(db.select(hot)).all()}
+    stock = dict(db.session.execute(db.select(Product.id, Product.stock)).all())
+    assert archive.archive_before(CUTOFF) == 4
+
+    entries = {e.table_name: e for e in LedgerArchive.query}
+    assert {name: (e.row_count, e.first_date, e.last_date) for name, e in entries.items()} == {
+        "stock_transactions_archive_2022": (2, datetime(2022, 3, 1), datetime(2022, 7, 1)),
+        "stock_transactions_archive_2023": (2, datetime(2023, 2, 1), datetime(2023, 8, 1)),
+    }
+    archived = {}
+    for name in entries:
+        archived.update({r.id: dict(r._mapping) for r in db.session.execute(db.select(archive.partition_table(name))).all()})
+    # Ids and all; only the newest row, Banana's Stock Out, stays behind
+    kept = db.session.execute(db.select(hot.c.id)).scalars().all()
+    assert kept == [max(before)]
+    assert archived == {i: r for i, r in before.items() if i != max(before)}
+    # Opening balance plus what is still hot is the stock, which didn't move
+    assert dict(db.session.execute(db.select(Product.id, Product.stock)).all()) == stock
+    hot_net = dict(db.session.execute(db.select(hot.c.product_id, db.func.sum(signed_quantity(hot.c))).group_by(hot.c.product_id)).all())
+    for pid, quantity in stock.items():
+        assert db.session.get(OpeningBalance, pid).quantity + hot_net.get(pid, 0) == quantity
+
+
+def test_ledger_reads_only_the_partitions_a_range_reaches(app):
+    _redate()
+    archive.archive_before(CUTOFF)
+    assert archive.ledger() is StockTransaction
+    assert archive.ledger(datetime(2024, 1, 1)) is StockTransaction
+
+    tx = archive.ledger(datetime(2023, 1, 1), datetime(2023, 7, 1))
+    sql = str(db.select(tx.id).compile(db.engine))
+    assert "UNION ALL" in sql and "archive_2023" in sql and "archive_2022" not in sql
+    ids = _ids()
+    found = db.session.execute(db.select(tx.product_id, tx.tx_type).order_by(tx.tx_date)).all()
+    assert found == [(ids["FRU-PIN"], "IN"), (ids["FRU-BAN"], "OUT")]
+
+
+def test_transactions_page_finds_archived_rows(client):
+    _redate()
+    archive.archive_before(CUTOFF)
+    page = client.get("/transactions?start=2022-01-01&end=2022-12-31&q=delivery").get_data(as_text=True)
+    assert "FRU-APP" in page and "FRU-CHE" in page and "FRU-PIN" not in page
+    assert "FRU-APP" not in client.get("/transactions?q=delivery").get_data(as_text=True)
@@ -0,0 +1,60 @@
+"""Committed writes drop the dashboard cache and mark the catalogue stale."""
+from sqlalchemy import update
+
+from app import db
+from app.cache import get_cache
+from app.catalogue import get_catalogue
+from app.dashboard import CACHE_KEY, dashboard_stats
+from app.models import Category, Supplier
+
+
+def _warm():
+    dashboard_stats()
+    get_catalogue().refresh(force=True)
+
+
+def _dropped():
+    return get_cache("dashboard").get(CACHE_KEY) is None, get_catalogue()._stale
+
+
+def test_orm_write_invalidates_after_commit(app):
+    _warm()
+    category = db.session.get(Category, 1)
+    category.name = category.name
+    db.session.add(Category(name="Dairy"))
+    db.session.flush()
+    assert _dropped() == (False, False)
+    db.session.commit()
+    assert _dropped() == (True, True)
+
+
+def test_core_statement_on_session_invalidates(app):
+    _warm()
+    db.session.execute(update(Supplier).where(Supplier.id == 1).values(name="Acme"))
+    db.session.commit()
+    assert _dropped() == (True, True)
+
+
+def test_rollback_invalidates_nothing(app):
+    _warm()
+    db.session.add(Category(name="Bakery"))
+    db.session.flush()
+    db.session.rollback()
+    db.session.commit()
+    assert _dropped() == (False, False)
+
+
+def test_catalogue_reports_its_own_counters(app, client):
+    catalogue = get_catalogue()
+    assert (catalogue.stats()["size"], catalogue.stats()["age"]) == (0, None)
+    assert catalogue.get_by_sku("FRU-BAN").name == "Banana"
+    assert catalogue.get_by_sku("NOPE") is None
+    stats = catalogue.stats()
+    assert (stats["size"], stats["hits"], stats["misses"], stats["reloads"]) == (4, 1, 1, 1)
+    assert 0 <= stats["age"] < 5
+    assert "evictions" not in stats and "maxsize" not in stats
+
+    text = client.get("/metrics").get_data(as_text=True)
+    assert 'grocerflow_cache_reloads_total{cache="catalogue"} 1' in text
+    assert 'grocerflow_cache_evictions_total{cache="catalogue"}' not in text
+    assert 'grocerflow_cache_evictions_total{cache="dashboard"}' in text
@@ -0,0 +1,42 @@
+"""CSV exports stream the table in keyset windows."""
+import csv
+import io
+
+from app import db
+from app.exports import INVENTORY_HEADER, TRANSACTIONS_HEADER, stream_inventory_csv, stream_transactions_csv
+from app.models import Product
+
+
+def _rows(chunks):
+    return list(csv.reader(io.StringIO("".join(chunks))))
+
+
+def test_inventory_windows_cover_every_product_once(app):
+    # Same name as an existing product: the window boundary falls between them
+    db.session.add(Product(name="Apple", sku="FRU-AP2", unit="kg", price=2.0, reorder_level=0, stock=0))
+    db.session.commit()
+    chunks = list(stream_inventory_csv(batch_size=1))
+    # Header, one chunk per window, nothing after the last short one
+    assert len(chunks) == 1 + 5
+    rows = _rows(chunks)
+    assert rows[0] == INVENTORY_HEADER
+    assert [(r[0], r[1]) for r in rows[1:]] == [
+        ("FRU-APP", "Apple"), ("FRU-AP2", "Apple"), ("FRU-BAN", "Banana"), ("FRU-CHE", "Cherry"), ("FRU-PIN", "Pineapple"),
+    ]
+    assert _rows(stream_inventory_csv(batch_size=2)) == rows
+
+
+def test_transactions_export_filters_and_orders_newest_first(app):
+    rows = _rows(stream_transactions_csv(batch_size=2))
+    assert rows[0] == TRANSACTIONS_HEADER
+    assert (rows[1][1], rows[1][2], rows[1][4]) == ("OUT", "FRU-BAN", "7")
+    assert len(rows) == 1 + 5
+    assert [r[2] for r in _rows(stream_transactions_csv(tx_type="IN", q="FRU-CHE"))[1:]] == ["FRU-CHE"]
+
+
+def test_export_view_streams(client):
+    response = client.get("/export/transactions.csv?type=OUT")
+    assert response.is_streamed
+    assert response.headers["Content-Disposition"] == "attachment; filename=grocerflow_transactions.csv"
+    rows = _rows([response.get_data(as_text=True)])
+    assert [r[2] for r in rows[1:]] == ["FRU-BAN"]
@@ -0,0 +1,45 @@
+"""Conditional GET: ETag / Last-Modified revalidation and fingerprinted static files."""
+from flask import url_for
+
+from app import db
+from app.models import Product
+
+
+def test_unchanged_page_revalidates_to_304(client):
+    first = client.get("/products")
+    assert first.status_code == 200
+    assert first.headers["ETag"] and first.headers["Last-Modified"]
+    assert {"private", "no-cache"} <= {d.strip() for d in first.headers["Cache-Control"].split(",")}
+
+    again = client.get("/products", headers={"If-None-Match": first.headers["ETag"]})
+    assert (again.status_code, again.get_data()) == (304, b"")
+    assert again.headers["ETag"] == first.headers["ETag"]
+    assert client.get("/products", headers={"If-Modified-Since": first.headers["Last-Modified"]}).status_code == 304
+    # The URL is part of the ETag
+    assert client.get("/products?q=apple", headers={"If-None-Match": first.headers["ETag"]}).status_code == 200
+
+
+def test_a_write_changes_the_etag(client):
+    etag = client.get("/products").headers["ETag"]
+    product = db.session.execute(db.select(Product).where(Product.sku == "FRU-APP")).scalar_one()
+    product.price = 2.25
+    db.session.commit()
+    response = client.get("/products", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert b"2.25" in response.get_data()
+
+
+def test_export_revalidates_without_streaming(client):
+    first = client.get("/export/inventory.csv")
+    assert first.is_streamed and first.headers["ETag"]
+    assert client.get("/export/inventory.csv", headers={"If-None-Match": first.headers["ETag"]}).status_code == 304
+
+
+def test_fingerprinted_static_files_are_immutable(app, client):
+    with app.test_request_context():
+        url = url_for("static", filename="app.js")
+    assert "?v=" in url
+    cache_control = client.get(url).headers["Cache-Control"]
+    assert "immutable" in cache_control and "max-age=31536000" in cache_control
+    assert "immutable" not in client.get("/static/app.js").headers.get("Cache-Control", "")
@@ -0,0 +1,54 @@
+"""Catalogue import: upserts by SKU, idempotent re-imports, rejected rows."""
+import io
+
+from app import db
+from app.imports import import_catalogue
+from app.locations import default_location_id
+from app.models import Product, StockBalance
+
+HEADER = "SKU,Product,Category,Supplier,Unit,Price,Reorder Level,Stock\n"
+FILE = HEADER + (
+    "FRU-BAN,Banana,Fruit,Acme Foods,kg,1.75,1,99\n"
+    "VEG-CAR,Carrot,Vegetables,Green Farm,kg,0.8,10,4\n"
+    "VEG-LEE,Leek,Vegetables,Green Farm,pcs,1.2,0,30\n"
+)
+
+
+def _import(text, **kwargs):
+    return import_catalogue(io.StringIO(text), **kwargs).to_dict()
+
+
+def _product(sku):
+    return db.session.execute(db.select(Product).where(Product.sku == sku)).scalar_one()
+
+
+def test_import_creates_and_updates_by_sku(app):
+    result = _import(FILE)
+    assert (result["created"], result["updated"], result["unchanged"], result["rejected"]) == (2, 1, 0, 0)
+    banana, carrot = _product("FRU-BAN"), _product("VEG-CAR")
+    # Existing stock only moves through the ledger; the reorder level change re-reads the low flag
+    assert (banana.price, banana.stock, banana.reorder_level, banana.is_low) == (1.75, 3, 1, False)
+    assert (carrot.stock, carrot.is_low, carrot.category.name, carrot.supplier.name) == (4, True, "Vegetables", "Green Farm")
+    # A new SKU's opening stock is held at the default location
+    balance = db.session.get(StockBalance, (carrot.id, default_location_id()))
+    assert (balance.quantity, balance.is_low) == (4, True)
+
+
+def test_reimporting_the_same_file_writes_nothing(app):
+    _import(FILE)
+    stamps = dict(db.session.execute(db.select(Product.sku, Product.updated_at)).all())
+    result = _import(FILE)
+    assert (result["created"], result["updated"], result["unchanged"], result["applied"]) == (0, 0, 3, False)
+    assert dict(db.session.execute(db.select(Product.sku, Product.updated_at)).all()) == stamps
+
+
+def test_bad_rows_are_reported_by_line(app):
+    text = FILE + "VEG-ONI,Onion,Vegetables,,kg,cheap,0,1\n,No SKU,,,pcs,1,0,0\n"
+    result = _import(text)
+    assert [(e["line"], e["sku"]) for e in result["errors"]] == [(5, "VEG-ONI"), (6, "")]
+    assert result["created"] == 2
+
+    db.session.rollback()
+    result = _import(text.replace("VEG-CAR", "VEG-CAB").replace("VEG-LEE", "VEG-KAL"), atomic=True)
+    assert (result["created"], result["applied"], result["rejected"]) == (0, False, 2)
+    assert db.session.execute(db.select(Product.id).where(Product.sku == "VEG-CAB")).first() is None
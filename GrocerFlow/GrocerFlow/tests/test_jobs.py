@@ -0,0 +1,38 @@
+"""Jobs whose worker died while running them don't stay "running" forever."""
+import json
+import os
+from datetime import datetime, timedelta
+
+from app import db, jobs
+from app.models import Job
+
+
+def _running(minutes_ago):
+    job = Job(kind="inventory_csv", filename="grocerflow_inventory.csv", status="running",
+              started_at=datetime.utcnow() - timedelta(minutes=minutes_ago))
+    db.session.add(job)
+    db.session.commit()
+    return job.id
+
+
+def test_run_pending_fails_stale_running_jobs(app):
+    stale, busy = _running(120), _running(5)
+    partial = jobs.output_path(db.session.get(Job, stale)) + ".part"
+    open(partial, "w").close()
+    jobs.run_pending()
+    db.session.expire_all()
+    assert db.session.get(Job, stale).status == "failed"
+    assert db.session.get(Job, stale).error == jobs.STALE_ERROR
+    assert db.session.get(Job, busy).status == "running"
+    assert not jobs.fail_stale()
+    assert not os.path.exists(partial)
+
+
+def test_job_takes_only_the_params_its_kind_declares(client):
+    assert client.post("/jobs/reorder_csv", data={"window": "30", "cover": "14"}).status_code == 302
+    job = Job.query.order_by(Job.id.desc()).first()
+    assert json.loads(job.params) == {"window": "30", "cover": "14"}
+
+    assert client.post("/jobs/reorder_csv", data={"window": "30", "q": "x"}).status_code == 400
+    assert client.post("/jobs/inventory_csv", data={"filename": "../../app.py"}).status_code == 400
+    assert Job.query.count() == 1
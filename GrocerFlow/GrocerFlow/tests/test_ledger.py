@@ -0,0 +1,98 @@
+"""Batch stock transactions: per-line errors and the conditional stock moves."""
+import pytest
+
+from app import db, ledger
+from app.models import Product
+
+BOTH_ROWCOUNT_MODES = pytest.mark.parametrize("multi_rowcount", [True, False], ids=["executemany", "per-row"])
+
+
+class _NoTotal:
+    """An executemany result whose rowcount is unknown, as with psycopg2."""
+
+    def __init__(self, result):
+        self._result = result
+        self.rowcount = -1
+
+    def __getattr__(self, name):
+        return getattr(self._result, name)
+
+
+def _rowcount_mode(monkeypatch, multi_rowcount):
+    if multi_rowcount:
+        return
+    monkeypatch.setattr(db.engine.dialect, "supports_sane_multi_rowcount", False)
+    execute = db.session.execute
+
+    def execute_without_totals(statement, params=None, *args, **kwargs):
+        result = execute(statement, params, *args, **kwargs)
+        return _NoTotal(result) if isinstance(params, list) and len(params) > 1 else result
+    monkeypatch.setattr(db.session, "execute", execute_without_totals)
+
+
+def _stock(sku):
+    return db.session.execute(db.select(Product.stock).where(Product.sku == sku)).scalar()
+
+
+@BOTH_ROWCOUNT_MODES
+def test_multi_line_batch_applies(app, monkeypatch, multi_rowcount):
+    # psycopg2 can't total an executemany's rowcount; the ledger then runs one statement per line
+    _rowcount_mode(monkeypatch, multi_rowcount)
+    result = ledger.apply_batch([
+        {"sku": "FRU-APP", "tx_type": "OUT", "quantity": 4},
+        {"sku": "FRU-CHE", "tx_type": "OUT", "quantity": 1},
+        {"sku": "FRU-PIN", "tx_type": "IN", "quantity": 5},
+    ])
+    assert result.applied and result.accepted == 3
+    assert (_stock("FRU-APP"), _stock("FRU-CHE"), _stock("FRU-PIN")) == (6, 9, 15)
+
+
+@BOTH_ROWCOUNT_MODES
+def test_stock_taken_after_validation_is_a_conflict(app, monkeypatch, multi_rowcount):
+    _rowcount_mode(monkeypatch, multi_rowcount)
+    read_balances = ledger._read_balances
+    # Validation sees more stock than the UPDATE will find, as if another
+    # writer took it in between
+    monkeypatch.setattr(ledger, "_read_balances", lambda ids: {k: q + 100 for k, q in read_balances(ids).items()})
+    with pytest.raises(ledger.StockConflict):
+        ledger.apply_batch([
+            {"sku": "FRU-APP", "tx_type": "OUT", "quantity": 1},
+            {"sku": "FRU-CHE", "tx_type": "OUT", "quantity": 50},
+        ])
+    db.session.rollback()
+    assert (_stock("FRU-APP"), _stock("FRU-CHE")) == (10, 10)
+
+
+def test_partly_bad_batch_reports_each_line(app):
+    lines = [
+        {"sku": "FRU-APP", "tx_type": "OUT", "quantity": 2},
+        {"sku": "NOPE", "tx_type": "IN", "quantity": 1},
+        {"sku": "FRU-CHE", "tx_type": "OUT", "quantity": "two"},
+        {"sku": "FRU-BAN", "tx_type": "OUT", "quantity": 5},
+        # Stock taken in by an earlier line of the batch counts
+        {"sku": "FRU-BAN", "tx_type": "IN", "quantity": 5},
+        {"sku": "FRU-BAN", "tx_type": "OUT", "quantity": 6},
+        {"sku": "FRU-PIN", "tx_type": "IN", "quantity": 1, "location": "Attic"},
+        "FRU-PIN,IN,1",
+    ]
+    result = ledger.apply_batch(lines)
+    assert [(e["line"], e["sku"], e["error"]) for e in result.errors] == [
+        (2, "NOPE", "Unknown SKU."),
+        (3, "FRU-CHE", "quantity must be a whole number."),
+        (4, "FRU-BAN", "Not enough stock for Stock Out (available 3)."),
+        (7, "FRU-PIN", "Unknown location 'Attic'."),
+        (8, None, "Line must be an object."),
+    ]
+    assert result.applied and result.accepted == 3
+    assert (_stock("FRU-APP"), _stock("FRU-BAN"), _stock("FRU-CHE"), _stock("FRU-PIN")) == (8, 2, 10, 10)
+
+
+def test_atomic_batch_with_a_bad_line_applies_nothing(client):
+    response = client.post("/api/transactions/batch?atomic=1", json=[
+        {"sku": "FRU-APP", "tx_type": "OUT", "quantity": 2},
+        {"sku": "FRU-APP", "tx_type": "OUT", "quantity": 20},
+    ])
+    assert response.status_code == 422
+    body = response.get_json()
+    assert (body["applied"], [e["line"] for e in body["errors"]]) == (False, [2])
+    assert _stock("FRU-APP") == 10
@@ -0,0 +1,82 @@
+"""Stock held per location: transfers and per-location low-stock flags."""
+import pytest
+
+from app import db
+from app.ledger import InsufficientStock, record_transaction, transfer_stock
+from app.locations import DEFAULT_LOCATION_NAME, default_location_id
+from app.models import Location, Product, StockBalance, StockTransaction
+
+
+def _shop():
+    shop = Location(name="Shop")
+    db.session.add(shop)
+    db.session.commit()
+    return shop.id
+
+
+def _product(sku):
+    db.session.expire_all()
+    return db.session.execute(db.select(Product).where(Product.sku == sku)).scalar_one()
+
+
+def _balances(product_id):
+    """{location id: (quantity, is_low)}"""
+    rows = db.session.execute(
+        db.select(StockBalance.location_id, StockBalance.quantity, StockBalance.is_low).where(StockBalance.product_id == product_id)
+    )
+    return {lid: (qty, low) for lid, qty, low in rows}
+
+
+def test_transfer_moves_stock_and_keeps_the_total(client):
+    main, shop = default_location_id(), _shop()
+    response = client.post("/api/transfers", json={"sku": "FRU-APP", "from": DEFAULT_LOCATION_NAME, "to": "shop", "quantity": 6})
+    assert response.status_code == 200
+    apple = _product("FRU-APP")
+    # Reorder level 5: the shop is fine, the main store is low, so the product is
+    assert _balances(apple.id) == {main: (4, True), shop: (6, False)}
+    assert (apple.stock, apple.is_low) == (10, True)
+    rows = db.session.execute(
+        db.select(StockTransaction.tx_type, StockTransaction.location_id, StockTransaction.quantity)
+        .where(StockTransaction.product_id == apple.id, StockTransaction.tx_type.like("XFER_%"))
+        .order_by(StockTransaction.id)
+    ).all()
+    assert rows == [("XFER_OUT", main, 6), ("XFER_IN", shop, 6)]
+
+
+def test_transfer_of_more_than_the_source_holds_changes_nothing(client):
+    main, shop = default_location_id(), _shop()
+    apple = _product("FRU-APP")
+    response = client.post("/api/transfers", json={"sku": "FRU-APP", "from": "Main", "to": "Shop", "quantity": 11})
+    assert response.status_code == 409
+    assert client.post("/api/transfers", json={"sku": "FRU-APP", "from": "Main", "to": "Attic", "quantity": 1}).status_code == 400
+    assert _balances(apple.id) == {main: (10, False)}
+    with pytest.raises(InsufficientStock):
+        transfer_stock(apple.id, shop, main, 1)
+
+
+def test_low_flags_follow_stock_and_reorder_level(app):
+    main, shop = default_location_id(), _shop()
+    apple = _product("FRU-APP")
+    transfer_stock(apple.id, main, shop, 6)
+    record_transaction(apple.id, "IN", 2, location_id=main)
+    assert _balances(apple.id) == {main: (6, False), shop: (6, False)}
+    assert not _product("FRU-APP").is_low
+
+    record_transaction(apple.id, "OUT", 2, location_id=shop)
+    assert _balances(apple.id)[shop] == (4, True) and _product("FRU-APP").is_low
+
+    # A new reorder level re-reads every balance's flag
+    apple = _product("FRU-APP")
+    apple.reorder_level = 3
+    db.session.commit()
+    assert _balances(apple.id) == {main: (6, False), shop: (4, False)}
+    assert not _product("FRU-APP").is_low
+
+
+def test_transactions_filter_by_location(client):
+    main, shop = default_location_id(), _shop()
+    apple = _product("FRU-APP")
+    transfer_stock(apple.id, main, shop, 3, reference="to-the-shop")
+    page = client.get(f"/transactions?location={shop}").get_data(as_text=True)
+    assert "to-the-shop" in page and "ban-delivery" not in page
+    assert "ban-delivery" in client.get(f"/transactions?location={main}").get_data(as_text=True)
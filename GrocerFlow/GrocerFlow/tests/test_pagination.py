@@ -0,0 +1,50 @@
+"""Keyset pagination walks forward and back without skipping or repeating rows."""
+from app import db
+from app.models import Product, StockTransaction
+from app.pagination import decode_cursor, keyset_paginate
+from app.queries import PRODUCT_KEYS, product_list_query, transaction_keys
+
+
+def _add_apples(count):
+    db.session.add_all([
+        Product(name="Apple", sku=f"FRU-AP{i}", unit="kg", price=1.0, reorder_level=0, stock=0) for i in range(count)
+    ])
+    db.session.commit()
+
+
+def _walk(query, keys, page_size):
+    """Pages forward from the first, then back again from the last."""
+    forward = [keyset_paginate(query, keys, None, page_size)]
+    while forward[-1].has_next:
+        forward.append(keyset_paginate(query, keys, forward[-1].next_cursor, page_size))
+    backward = [forward[-1]]
+    while backward[-1].has_prev:
+        backward.append(keyset_paginate(query, keys, backward[-1].prev_cursor, page_size))
+    return forward, backward[::-1]
+
+
+def test_products_with_the_same_name_page_by_id(app):
+    _add_apples(3)
+    expected = db.session.execute(db.select(Product.id).order_by(Product.name, Product.id)).scalars().all()
+    assert len(expected) == 7
+    for page_size in (1, 2, 3):
+        forward, backward = _walk(product_list_query(), PRODUCT_KEYS, page_size)
+        assert [p.id for page in forward for p in page.items] == expected
+        assert [[p.id for p in page.items] for page in backward] == [[p.id for p in page.items] for page in forward]
+        assert not forward[0].has_prev and not forward[-1].has_next
+
+
+def test_transactions_page_newest_first(app):
+    keys = transaction_keys()
+    expected = db.session.execute(
+        db.select(StockTransaction.id).order_by(StockTransaction.tx_date.desc(), StockTransaction.id.desc())
+    ).scalars().all()
+    forward, backward = _walk(StockTransaction.query, keys, 2)
+    assert [t.id for page in forward for t in page.items] == expected
+    assert [len(page.items) for page in backward] == [2, 2, 1]
+
+
+def test_malformed_cursor_reads_the_first_page(app):
+    assert decode_cursor("not-a-cursor", 2) is None
+    page = keyset_paginate(product_list_query(), PRODUCT_KEYS, "not-a-cursor", 2)
+    assert [p.sku for p in page.items] == ["FRU-APP", "FRU-BAN"] and not page.has_prev
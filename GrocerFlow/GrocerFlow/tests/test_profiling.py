@@ -0,0 +1,44 @@
+"""Sampled requests share the process's single profiler."""
+import cProfile
+import os
+
+from app import profiling
+
+
+def _profiles(app):
+    folder = os.path.join(app.instance_path, profiling.PROFILE_DIR)
+    return sorted(f for f in os.listdir(folder) if f.endswith(".prof")) if os.path.isdir(folder) else []
+
+
+def _profile_everything(app):
+    app.config.update(PROFILE_SLOW_MS=0.001, PROFILE_SAMPLE_RATE=1.0)
+
+
+def test_slow_sampled_request_is_profiled(app, client):
+    _profile_everything(app)
+    assert client.get("/dashboard").status_code == 200
+    assert len(_profiles(app)) == 1
+    assert not profiling._profiler_lock.locked()
+
+
+def test_request_is_served_unprofiled_while_the_profiler_is_busy(app, client):
+    _profile_everything(app)
+    # Another request of this process is being profiled
+    assert profiling._profiler_lock.acquire(blocking=False)
+    try:
+        assert client.get("/dashboard").status_code == 200
+    finally:
+        profiling._profiler_lock.release()
+    assert _profiles(app) == []
+
+
+def test_request_is_served_when_enable_fails(app, client, monkeypatch):
+    _profile_everything(app)
+
+    def enable(self):
+        # What Python 3.12+ raises when sys.monitoring's profiler slot is taken
+        raise ValueError("Another profiling tool is already active")
+    monkeypatch.setattr(cProfile.Profile, "enable", enable)
+    assert client.get("/dashboard").status_code == 200
+    assert _profiles(app) == []
+    assert not profiling._profiler_lock.locked()
@@ -0,0 +1,49 @@
+"""Every view with a query budget stays within it under QUERY_BUDGET=strict.
+
+Each URL is fetched by a freshly created app, like the first request a
+new worker serves: its caches are cold and the search backend hasn't been
+picked yet, the worst case for the query count.
+"""
+import pytest
+
+URLS = {
+    "main.dashboard": ["/dashboard"],
+    "main.categories": ["/categories", "/categories?q=fru"],
+    "main.suppliers": ["/suppliers", "/suppliers?q=acm"],
+    "main.locations": ["/locations"],
+    "main.products": ["/products", "/products?q=ban", "/products?q=ana", "/products?low=1"],
+    "main.product_detail": ["/products/{product_id}"],
+    "main.transactions": ["/transactions", "/transactions?q=ban", "/transactions?type=IN"],
+    "main.export_inventory": ["/export/inventory.csv"],
+    "main.export_transactions": ["/export/transactions.csv", "/export/transactions.csv?q=ban"],
+    "api.products_search": ["/api/products/search?q=ban", "/api/products/search?q=ana"],
+    "api.options": ["/api/categories/options", "/api/suppliers/options?q=acm"],
+}
+
+
+def _budgeted_endpoints(app):
+    return {name for name, view in app.view_functions.items() if getattr(view, "query_budget", None) is not None}
+
+
+def test_every_budgeted_view_is_covered(make_app, database):
+    app = make_app(database[0])
+    assert _budgeted_endpoints(app) == set(URLS)
+
+
+@pytest.mark.parametrize("url", [url for urls in URLS.values() for url in urls])
+def test_view_stays_within_budget(make_app, database, url):
+    db_path, product_id = database
+    app = make_app(db_path)
+    client = app.test_client()
+    client.post("/auth/login", data={"username": "admin", "password": "admin123"})
+    # QueryBudgetExceeded propagates out of the test client in strict mode
+    response = client.get(url.format(product_id=product_id))
+    response.get_data()
+    response.close()
+    assert response.status_code == 200
+
+
+def test_counts_restart_with_each_request(client):
+    # The requests share the test's app context, and so its g
+    for _ in range(3):
+        assert client.get("/products").status_code == 200
@@ -0,0 +1,29 @@
+"""Migrations build today's schema from their own frozen table definitions."""
+from sqlalchemy import inspect
+
+from app import db, schema
+
+
+def test_upgrade_matches_the_models(make_app, tmp_path):
+    app = make_app(tmp_path / "fresh.db")
+    with app.app_context():
+        assert schema.upgrade() == len(schema.MIGRATIONS)
+        insp = inspect(db.engine)
+        for table in db.metadata.sorted_tables:
+            assert {c["name"] for c in insp.get_columns(table.name)} == set(table.columns.keys()), table.name
+            assert {ix["name"] for ix in insp.get_indexes(table.name)} == {ix.name for ix in table.indexes}, table.name
+        db.engine.dispose()
+
+
+def test_first_step_creates_the_tables_of_its_day(make_app, tmp_path):
+    app = make_app(tmp_path / "v1.db")
+    with app.app_context():
+        with db.engine.begin() as conn:
+            schema._create_tables(conn)
+        insp = inspect(db.engine)
+        assert not insp.has_table("locations") and not insp.has_table("stock_balances")
+        assert "location_id" not in {c["name"] for c in insp.get_columns("stock_transactions")}
+        # The rest brings it to today's schema
+        schema.upgrade()
+        assert "location_id" in {c["name"] for c in inspect(db.engine).get_columns("stock_transactions")}
+        db.engine.dispose()
@@ -0,0 +1,34 @@
+"""The FTS5 index matches the same rows as the plain ILIKE '%q%' scan."""
+import pytest
+from sqlalchemy import select, text
+
+from app import db, search
+from app.models import Product
+
+QUERIES = ["ana", "BAN", "an", "apple", "pple", "fru-b", "RU-CH", "Banana", "nana ", "zzz", "a\"b", "'"]
+
+
+def _ids(backend, q):
+    return set(db.session.execute(select(Product.id).where(backend.match("products", q))).scalars())
+
+
+def test_fts_backend_is_used(app):
+    assert isinstance(search.current_backend(), search.SQLiteFTSBackend)
+
+
+@pytest.mark.parametrize("q", QUERIES)
+def test_fts_matches_substrings_like_ilike(app, q):
+    expected = _ids(search.LikeBackend(), q.strip())
+    assert _ids(search.SQLiteFTSBackend(), q.strip()) == expected
+    assert set(search.SQLiteFTSBackend().ranked_ids("products", q.strip(), 50)) == expected
+
+
+def test_word_prefix_index_is_replaced(app):
+    fts = search.SQLiteFTSBackend()
+    with db.engine.begin() as conn:
+        conn.execute(text("DROP TABLE products_fts"))
+        conn.execute(text("CREATE VIRTUAL TABLE products_fts USING fts5(name, sku, content='products', content_rowid='id')"))
+        assert not fts.installed(conn)
+        fts.install(conn)
+        assert fts.installed(conn)
+    assert _ids(fts, "ana") == _ids(search.LikeBackend(), "ana")
@@ -0,0 +1,55 @@
+"""Point-in-time stock and valuation read the same from any checkpoint."""
+from datetime import datetime
+
+from sqlalchemy import insert, update
+
+from app import db
+from app.models import Product, StockSnapshot, StockSnapshotRun, StockTransaction
+from app.snapshots import stock_as_of, valuation_as_of
+
+DAYS = [datetime(2024, 1, 5), datetime(2024, 2, 1), datetime(2024, 2, 20), datetime(2024, 3, 20)]
+
+
+def _backdate():
+    """Products created 1 Jan 2024, delivered 10 Jan; Banana's Stock Out on 10 Mar."""
+    tx = StockTransaction.__table__
+    db.session.execute(update(Product.__table__).values(created_at=datetime(2024, 1, 1)))
+    db.session.execute(update(tx).where(tx.c.tx_type == "IN").values(tx_date=datetime(2024, 1, 10)))
+    db.session.execute(update(tx).where(tx.c.tx_type == "OUT").values(tx_date=datetime(2024, 3, 10)))
+    db.session.commit()
+
+
+def _checkpoint_in_february():
+    """A run from 15 Feb: every product at 10, the deliveries already counted."""
+    last_in = db.session.execute(db.select(db.func.max(StockTransaction.id)).where(StockTransaction.tx_type == "IN")).scalar()
+    run = StockSnapshotRun(taken_at=datetime(2024, 2, 15), last_tx_id=last_in, product_count=4)
+    db.session.add(run)
+    db.session.flush()
+    db.session.execute(insert(StockSnapshot.__table__), [
+        {"run_id": run.id, "product_id": pid, "stock": 10} for pid in db.session.execute(db.select(Product.id)).scalars()
+    ])
+    db.session.commit()
+
+
+def test_stock_as_of_from_live_stock(app, database):
+    _backdate()
+    banana = database[1]
+    assert stock_as_of(datetime(2023, 12, 31)) == {}
+    assert [stock_as_of(day)[banana] for day in DAYS] == [0, 10, 10, 3]
+
+
+def test_checkpoints_agree_with_live_stock(app):
+    _backdate()
+    from_live = [stock_as_of(day) for day in DAYS]
+    _checkpoint_in_february()
+    # The two middle days read forward or backward from the run
+    assert [stock_as_of(day) for day in DAYS] == from_live
+
+
+def test_valuation_as_of(app):
+    _backdate()
+    _checkpoint_in_february()
+    report = valuation_as_of(datetime(2024, 3, 20))
+    assert (report["units"], report["value"]) == (33, 49.5)
+    assert report["by_category"] == [("Fruit", {"units": 33, "value": 49.5})]
+    assert valuation_as_of(datetime(2024, 2, 20))["units"] == 40